@@ -0,0 +1,208 @@
+import sys
+import time
+import threading
+from array import array
+
+# Кольцевой буфер: последние RING_DAYS суток по часам (UTC)
+RING_DAYS = 30
+RING_HOURS = RING_DAYS * 24
+SERIES = ('messages', 'voice')  # voice - секунды присутствия в войсе (сумма по участникам)
+
+
+def current_hour(ts: float = None) -> int:
+    """Номер часа от эпохи (UTC)"""
+    return int((time.time() if ts is None else ts) // 3600)
+
+
+def _pack(values: array) -> bytes:
+    """int32 little-endian независимо от платформы"""
+    if sys.byteorder == 'big':
+        values = array('i', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(data: bytes) -> array:
+    values = array('i')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    if len(values) != RING_HOURS:
+        return array('i', bytes(4 * RING_HOURS))
+    return values
+
+
+class GuildHours:
+    """Кольцевые буферы одного сервера: ячейка = час, индекс = hour % RING_HOURS"""
+
+    __slots__ = ('last_hour', 'messages', 'voice', 'dirty')
+
+    def __init__(self, last_hour: int, messages: array = None, voice: array = None):
+        self.last_hour = last_hour
+        self.messages = messages if messages is not None else array('i', bytes(4 * RING_HOURS))
+        self.voice = voice if voice is not None else array('i', bytes(4 * RING_HOURS))
+        self.dirty = False
+
+    def advance(self, hour: int):
+        """Обнулить ячейки часов, пройденных с последнего обновления (не больше RING_HOURS)"""
+        if hour <= self.last_hour:
+            return
+        for h in range(max(self.last_hour + 1, hour - RING_HOURS + 1), hour + 1):
+            index = h % RING_HOURS
+            self.messages[index] = 0
+            self.voice[index] = 0
+        self.last_hour = hour
+        self.dirty = True
+
+
+class HourlyActivity:
+    """
+    Счётчики активности по часам для всех серверов.
+
+    Обновление - O(1) (инкремент одной ячейки), хранение - два массива int32
+    по RING_HOURS ячеек на сервер, в БД сохраняются как BLOB (см. flush).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._guilds = {}
+        self.load()
+
+    def load(self):
+        """Загрузить буферы из БД"""
+        for guild_id, last_hour, messages, voice in self.db.get_hourly_activity():
+            self._guilds[guild_id] = GuildHours(last_hour, _unpack(messages), _unpack(voice))
+
+    def _guild(self, guild_id: int, hour: int) -> GuildHours:
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = self._guilds[guild_id] = GuildHours(hour)
+        guild.advance(hour)
+        return guild
+
+    # ==================== ОБНОВЛЕНИЯ ====================
+
+    def add_message(self, guild_id: int, ts: float = None):
+        hour = current_hour(ts)
+        with self._lock:
+            guild = self._guild(guild_id, hour)
+            guild.messages[hour % RING_HOURS] += 1
+            guild.dirty = True
+
+    def add_voice(self, guild_id: int, seconds: int, ts: float = None):
+        """Секунды присутствия в войсе (чекпоинт: участников в войсе × прошедшее время)"""
+        if seconds <= 0:
+            return
+        hour = current_hour(ts)
+        with self._lock:
+            guild = self._guild(guild_id, hour)
+            guild.voice[hour % RING_HOURS] += int(seconds)
+            guild.dirty = True
+
+    def remove_guild(self, guild_id: int):
+        with self._lock:
+            self._guilds.pop(guild_id, None)
+        self.db.delete_hourly_activity(guild_id)
+
+    # ==================== СОХРАНЕНИЕ ====================
+
+    def flush(self) -> int:
+        """Сохранить изменённые буферы в БД. Возвращает количество серверов"""
+        with self._lock:
+            hour = current_hour()
+            rows = []
+            for guild_id, guild in self._guilds.items():
+                guild.advance(hour)
+                if guild.dirty:
+                    rows.append((guild_id, guild.last_hour, _pack(guild.messages), _pack(guild.voice)))
+                    guild.dirty = False
+        if rows and not self.db.save_hourly_activity(rows):
+            # Не сохранилось - попробуем в следующий раз
+            with self._lock:
+                for guild_id, *_ in rows:
+                    if guild_id in self._guilds:
+                        self._guilds[guild_id].dirty = True
+            return 0
+        return len(rows)
+
+    # ==================== ЧТЕНИЕ ====================
+
+    def grid(self, guild_id: int, series: str = 'messages', tz_offset: int = 0) -> list:
+        """
+        Последние RING_DAYS суток: RING_DAYS строк по 24 часа (локальное время UTC+tz_offset),
+        первая строка - самые старые сутки, последняя - сегодня.
+        """
+        hour = current_hour()
+        with self._lock:
+            guild = self._guilds.get(guild_id)
+            if guild is None:
+                return [[0] * 24 for _ in range(RING_DAYS)]
+            guild.advance(hour)
+            values = list(getattr(guild, series))
+
+        # Конец сетки - конец текущих локальных суток
+        local_hour = hour + tz_offset
+        day_end = local_hour - local_hour % 24 + 23
+        grid = []
+        for day in range(RING_DAYS - 1, -1, -1):
+            row = []
+            for h in range(24):
+                utc_hour = day_end - day * 24 - 23 + h - tz_offset
+                in_range = hour - RING_HOURS < utc_hour <= hour
+                row.append(values[utc_hour % RING_HOURS] if in_range else 0)
+            grid.append(row)
+        return grid
+
+    def weekday_hours(self, guild_id: int, series: str = 'messages', tz_offset: int = 0) -> list:
+        """
+        Средние значения по дням недели и часам: 7 строк (пн..вс) по 24 часа.
+        """
+        grid = self.grid(guild_id, series, tz_offset)
+        hour = current_hour() + tz_offset
+        today_weekday = ((hour // 24) + 3) % 7  # 1970-01-01 - четверг
+
+        sums = [[0] * 24 for _ in range(7)]
+        counts = [0] * 7
+        for offset, row in enumerate(reversed(grid)):
+            weekday = (today_weekday - offset) % 7
+            counts[weekday] += 1
+            for h, value in enumerate(row):
+                sums[weekday][h] += value
+        return [
+            [round(value / counts[weekday], 2) if counts[weekday] else 0 for value in sums[weekday]]
+            for weekday in range(7)
+        ]
+
+    def grid_dates(self, tz_offset: int = 0) -> list:
+        """Даты (локальные) строк grid()"""
+        local_day = (current_hour() + tz_offset) // 24
+        return [
+            time.strftime('%Y-%m-%d', time.gmtime((local_day - day) * 86400))
+            for day in range(RING_DAYS - 1, -1, -1)
+        ]
+
+
+WEEKDAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+_BLOCKS = ' ▁▂▃▄▅▆▇█'
+
+
+def peak_hours(matrix: list, top: int = 3) -> list:
+    """Самые активные часы суток по матрице 7x24: [(час, сумма по дням недели)]"""
+    totals = [sum(row[h] for row in matrix) for h in range(24)]
+    ranked = sorted(range(24), key=lambda h: totals[h], reverse=True)
+    return [(h, totals[h]) for h in ranked[:top] if totals[h] > 0]
+
+
+def render_heatmap(matrix: list) -> str:
+    """Текстовая тепловая карта 7x24 для embed (один символ на час)"""
+    peak = max((value for row in matrix for value in row), default=0)
+    lines = ['    ' + ''.join(str(h // 10) if h % 6 == 0 else ' ' for h in range(24)),
+             '    ' + ''.join(str(h % 10) if h % 6 == 0 else ' ' for h in range(24))]
+    for name, row in zip(WEEKDAY_NAMES, matrix):
+        cells = ''.join(
+            _BLOCKS[min(int(value / peak * (len(_BLOCKS) - 1) + 0.999), len(_BLOCKS) - 1)] if peak else ' '
+            for value in row
+        )
+        lines.append(f"{name}  {cells}")
+    return '\n'.join(lines)
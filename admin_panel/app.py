@@ -2,8 +2,12 @@ import streamlit as st
 import requests
 from urllib.parse import urlencode
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_client import BotAPIClient
+
 load_dotenv()
 
 # Конфигурация
@@ -18,6 +22,15 @@ st.set_page_config(
     layout="wide"
 )
 
+
+@st.cache_resource
+def get_api_client():
+    """Общий для всех сессий клиент API бота (пул keep-alive соединений)"""
+    return BotAPIClient(BOT_API_URL)
+
+
+api = get_api_client()
+
 # ==================== DISCORD OAUTH ====================
 
 def get_discord_auth_url():
@@ -57,10 +70,10 @@ def get_admin_guilds(access_token):
     """Получает серверы где пользователь является администратором"""
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get(f"{BOT_API_URL}/admin/guilds", headers=headers, timeout=10)
+        # Бот проверяет права через Discord API - кэшируем на минуту (ключ включает токен)
+        status, data = api.get_json("/admin/guilds", headers=headers, ttl=60, timeout=10)
 
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
             return data.get('guilds', [])
         return []
     except Exception as e:
@@ -71,7 +84,7 @@ def get_admin_guilds(access_token):
 def get_guild_settings(guild_id):
     """Получает настройки сервера"""
     try:
-        response = requests.get(f"{BOT_API_URL}/admin/guild/{guild_id}/settings", timeout=5)
+        response = api.get(f"/admin/guild/{guild_id}/settings", timeout=5)
         if response.status_code == 200:
             return response.json()
         return None
@@ -87,8 +100,9 @@ def update_guild_settings(guild_id, access_token, settings):
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
-        response = requests.put(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/settings",
+        response = api.request(
+            'PUT',
+            f"/admin/guild/{guild_id}/settings",
             headers=headers,
             json=settings,
             timeout=10
@@ -103,8 +117,9 @@ def reset_guild_settings(guild_id, access_token):
     """Сбрасывает настройки сервера к дефолтным"""
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.delete(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/settings",
+        response = api.request(
+            'DELETE',
+            f"/admin/guild/{guild_id}/settings",
             headers=headers,
             timeout=10
         )
@@ -119,8 +134,9 @@ def upload_logo(guild_id, access_token, file):
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
         files = {'file': (file.name, file.getvalue(), file.type)}
-        response = requests.post(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/logo",
+        response = api.request(
+            'POST',
+            f"/admin/guild/{guild_id}/logo",
             headers=headers,
             files=files,
             timeout=30
@@ -137,8 +153,9 @@ def delete_logo(guild_id, access_token):
     """Удаляет логотип сервера"""
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.delete(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/logo",
+        response = api.request(
+            'DELETE',
+            f"/admin/guild/{guild_id}/logo",
             headers=headers,
             timeout=10
         )
@@ -152,8 +169,9 @@ def apply_bot_avatar(guild_id, access_token):
     """Применяет загруженный логотип как серверную аватарку бота"""
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.post(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/bot-avatar",
+        response = api.request(
+            'POST',
+            f"/admin/guild/{guild_id}/bot-avatar",
             headers=headers,
             timeout=30
         )
@@ -166,8 +184,9 @@ def reset_bot_avatar(guild_id, access_token):
     """Сбрасывает серверную аватарку бота к глобальной"""
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.delete(
-            f"{BOT_API_URL}/admin/guild/{guild_id}/bot-avatar",
+        response = api.request(
+            'DELETE',
+            f"/admin/guild/{guild_id}/bot-avatar",
             headers=headers,
             timeout=30
         )
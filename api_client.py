@@ -0,0 +1,163 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# Сколько соединений держим открытыми к API бота и сколько запросов выполняем параллельно
+POOL_SIZE = 16
+MAX_WORKERS = 8
+DEFAULT_TTL = 300
+# Больше записей не храним: при вставке удаляются истёкшие, затем ближайшие к истечению
+MAX_CACHE_ENTRIES = 512
+
+
+def _freeze(value):
+    """Параметры запроса -> хэшируемый ключ кэша"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class BotAPIClient:
+    """
+    Клиент API бота для Streamlit приложений (dashboard, админ-панель).
+
+    Один экземпляр на процесс (st.cache_resource) - общий для всех сессий:
+    - пул keep-alive соединений (requests.Session), без TCP handshake на каждый вызов
+    - пул потоков: независимые наборы данных вкладки грузятся параллельно
+    - кэш с TTL (не больше max_entries записей) и дедупликацией: если тот же запрос уже выполняется
+      (другая сессия открыла ту же страницу), ждём его результат, а не дублируем
+
+    Значения из кэша общие для всех сессий - их нельзя изменять на месте.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = POOL_SIZE, max_workers: int = MAX_WORKERS,
+                 max_entries: int = MAX_CACHE_ENTRIES):
+        self.base_url = base_url.rstrip('/')
+        self.max_entries = max_entries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-api')
+        self._lock = threading.Lock()
+        self._cache = {}     # key -> (expires_at, value)
+        self._inflight = {}  # key -> Future
+
+    # ==================== HTTP ====================
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def request(self, method: str, path: str, timeout: float = 30, **kwargs) -> requests.Response:
+        """Запрос через общий пул соединений (без кэша)"""
+        return self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    # ==================== КЭШ ====================
+
+    def cached(self, key, loader, ttl: float = DEFAULT_TTL):
+        """
+        Значение из кэша или результат loader().
+        Одновременные вызовы с одинаковым ключом выполняют loader один раз.
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            now = time.monotonic()
+            self._cache[key] = (now + ttl, value)
+            self._prune(now)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _prune(self, now: float):
+        """Удалить истёкшие записи и ограничить размер кэша (вызывается под self._lock)"""
+        for key in [k for k, (expires_at, _) in self._cache.items() if expires_at <= now]:
+            del self._cache[key]
+        overflow = len(self._cache) - self.max_entries
+        if overflow > 0:
+            for key in sorted(self._cache, key=lambda k: self._cache[k][0])[:overflow]:
+                del self._cache[key]
+
+    def get_json(self, path: str, params: dict = None, ttl: float = DEFAULT_TTL, timeout: float = 30,
+                 headers: dict = None):
+        """
+        GET с кэшированием JSON ответа.
+        Ключ - путь, параметры и заголовки (ответы с разными токенами не смешиваются).
+
+        Returns:
+            (status_code, data) - data = None если ответ не JSON
+        """
+        def load():
+            response = self.get(path, params=params, timeout=timeout, headers=headers)
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            return response.status_code, data
+
+        key = ('json', path, _freeze(params or {}), _freeze(headers or {}))
+        status, data = self.cached(key, load, ttl)
+        if status != 200:
+            # Ошибки не кэшируем - следующий rerun повторит запрос
+            self.invalidate(key)
+        return status, data
+
+    def invalidate(self, key=None, prefix: str = None):
+        """
+        Сбросить кэш: одну запись, записи путей с prefix, или весь кэш.
+        """
+        with self._lock:
+            if key is not None:
+                self._cache.pop(key, None)
+            elif prefix is not None:
+                for cached_key in [k for k in self._cache if len(k) > 1 and str(k[1]).startswith(prefix)]:
+                    del self._cache[cached_key]
+            else:
+                self._cache.clear()
+
+    # ==================== ПАРАЛЛЕЛЬНАЯ ЗАГРУЗКА ====================
+
+    def fetch_all(self, loaders: dict) -> dict:
+        """
+        Выполнить независимые загрузки параллельно.
+        Время = самый медленный запрос, а не сумма всех.
+
+        Args:
+            loaders: {имя: функция без аргументов}
+
+        Returns:
+            {имя: результат} (исключение загрузчика пробрасывается)
+        """
+        futures = {name: self._executor.submit(loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def submit(self, loader) -> Future:
+        """Запустить загрузку в фоне (например, данные для кнопки скачивания)"""
+        return self._executor.submit(loader)
@@ -3,6 +3,14 @@ from discord.ext import commands
 import asyncio
 import config
 from database import Database
+from events import EventBus
+from role_index import RoleIndex
+from member_resolver import MemberResolver
+from reports import ReportCache
+from export_service import ExportService
+from notifications import NotificationQueue
+from activity_hours import HourlyActivity
+from metrics import instrument_database, GATEWAY_EVENTS
 import traceback
 from datetime import datetime
 
@@ -22,7 +30,31 @@ class DiscordBot(commands.Bot):
         )
 
         # Инициализация базы данных (теперь с отдельной БД для опросов)
-        self.db = Database()
+        self.db = instrument_database(Database())
+
+        # Шина live-событий для dashboard (SSE)
+        self.event_bus = EventBus()
+
+        # Индекс ролей участников (для фильтров по ролям)
+        self.role_index = RoleIndex()
+
+        # Индекс имён участников (поиск по имени в модальных окнах панели)
+        self.member_resolver = MemberResolver()
+
+        # Почасовая активность серверов (кольцевые буферы за 30 дней)
+        self.hourly_activity = HourlyActivity(self.db)
+
+        # Кэш отчётов «неактивные» / «сводка» (пагинация и экспорт без пересчёта)
+        self.report_cache = ReportCache(self.db, self.role_index)
+
+        # Генерация CSV/XLSX экспортов вне event loop
+        self.export_service = ExportService()
+
+        # Очередь личных сообщений (уведомления о выговорах) с ограничением скорости
+        self.notifications = NotificationQueue(self)
+
+        # Постоянные view /panel - создаются и регистрируются (add_view) при загрузке cogs.panel
+        self.panel_views = {}
 
         # Для API статистики
         self.start_time = datetime.now()
@@ -30,6 +62,8 @@ class DiscordBot(commands.Bot):
 
     async def setup_hook(self):
         """Загрузка расширений (cogs) при запуске бота"""
+        self.notifications.start()
+
         cogs_to_load = [
             'cogs.api',  # API первым!
             'cogs.help',
@@ -90,6 +124,16 @@ class DiscordBot(commands.Bot):
         """Отслеживание выполненных команд"""
         self.command_count += 1
 
+    async def on_socket_event_type(self, event_type):
+        """Счётчик событий gateway для /metrics"""
+        GATEWAY_EVENTS.inc(event=event_type)
+
+    async def close(self):
+        """Остановка бота: незапущенные экспорты и неотправленные DM отменяются"""
+        self.export_service.shutdown()
+        self.notifications.stop()
+        await super().close()
+
 # Глобальная переменная для доступа к боту из API
 bot_instance = None
 
@@ -1,10 +1,32 @@
-from discord.ext import commands
-from flask import Flask, jsonify, request, send_from_directory
+from discord.ext import commands, tasks
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
 import threading
-import requests
 import os
+import time
+import mimetypes
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from discord_rest import DiscordRESTClient
+from database import DAILY_RETENTION_DAYS
+from events import format_sse, MAX_SUBSCRIBERS
+from metrics import (
+    registry, API_REQUESTS, API_LATENCY, EVENT_LOOP_LAG, EVENT_LOOP_LAG_LAST, record_cache
+)
+from columnar import (
+    COLUMNAR_FORMATS, columnar_available, encode_records, users_stats_schema, members_schema
+)
+from activity_hours import SERIES as ACTIVITY_SERIES, WEEKDAY_NAMES, peak_hours
+from distribution import build_distribution, METRICS as DISTRIBUTION_METRICS
+from timeseries import build_timeseries, GRANULARITY_DAYS, DEFAULT_MAX_POINTS, MAX_ROLES
+from exports import (
+    iter_stats_rows, iter_export_records, member_snapshot, sort_records,
+    stream_csv, stream_ndjson, encode_stream
+)
+from logo_store import (
+    LogoStore, FileLRUCache, GC_GRACE_SECONDS,
+    content_hash, is_content_addressed, save_content_addressed
+)
  
 # Загружаем .env из корня проекта
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
@@ -12,25 +34,115 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'logos')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+LOGO_CACHE_CONTROL = 'public, max-age=31536000, immutable'  # имя файла = хэш, содержимое не меняется
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+# Сортировки users-stats: ключ -> функция ключа для sort()
+USERS_STATS_SORT_KEYS = {
+    'voice': lambda u: (u['period_voice_time'], u['period_messages']),
+    'messages': lambda u: (u['period_messages'], u['period_voice_time']),
+    'total_voice': lambda u: (u['total_voice_time'], u['total_messages']),
+    'total_messages': lambda u: (u['total_messages'], u['total_voice_time']),
+    'name': lambda u: u['display_name'].casefold()
+}
+USERS_STATS_MAX_PER_PAGE = 500
+
+# Обычные запросы + по потоку на каждого SSE подписчика
+API_THREADS = 4 + MAX_SUBSCRIBERS
 
 class APIServer(commands.Cog):
     """Flask API для dashboard"""
     
     def __init__(self, bot):
         self.bot = bot
+        # Общий клиент Discord REST API (пул соединений + rate limit бакеты)
+        self.rest = DiscordRESTClient()
+        # Кэш нормализованных аватарок (обработка в пуле процессов)
+        self.logo_store = LogoStore()
+        # LRU небольших файлов логотипов в памяти
+        self.logo_cache = FileLRUCache()
         self.flask_app = Flask(__name__)
+        self.setup_metrics()
         self.setup_routes()
+
+        # Замер задержки event loop
+        self._loop_lag_last = None
+        self.measure_loop_lag.start()
         
         # Запускаем Flask в отдельном потоке
         self.flask_thread = threading.Thread(target=self.run_flask, daemon=True)
         self.flask_thread.start()
     
+    def setup_metrics(self):
+        """Метрики запросов API и gauges состояния бота для /metrics"""
+
+        @self.flask_app.before_request
+        def start_timer():
+            request._metrics_started = time.perf_counter()
+
+        @self.flask_app.after_request
+        def record_request(response):
+            started = getattr(request, '_metrics_started', None)
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            if started is not None:
+                API_LATENCY.observe(time.perf_counter() - started, method=request.method, route=route)
+            API_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+            return response
+
+        bot = self.bot
+        registry.callback_gauge(
+            'guildbrew_up', 'Bot is connected and ready',
+            lambda: 1 if bot.is_ready() else 0
+        )
+        registry.callback_gauge(
+            'guildbrew_guilds', 'Number of guilds the bot is in',
+            lambda: len(bot.guilds)
+        )
+        registry.callback_gauge(
+            'guildbrew_gateway_latency_seconds', 'Discord gateway heartbeat latency',
+            lambda: bot.latency if bot.is_ready() else None
+        )
+        registry.callback_gauge(
+            'guildbrew_uptime_seconds', 'Seconds since bot start',
+            lambda: (datetime.now() - bot.start_time).total_seconds()
+        )
+        registry.callback_gauge(
+            'guildbrew_commands_total', 'Prefix commands executed since start',
+            lambda: bot.command_count
+        )
+        registry.callback_gauge(
+            'guildbrew_event_subscribers', 'Connected live event (SSE) subscribers',
+            lambda: bot.event_bus.subscriber_count
+        )
+        registry.callback_gauge(
+            'guildbrew_event_queue_depth', 'Events waiting in subscriber queues (max over subscribers)',
+            lambda: bot.event_bus.max_queue_depth()
+        )
+        registry.callback_gauge(
+            'guildbrew_logo_cache_bytes', 'Bytes held by the in-memory logo cache',
+            lambda: self.logo_cache.size_bytes
+        )
+
+    @tasks.loop(seconds=1)
+    async def measure_loop_lag(self):
+        """Раз в секунду: насколько позже запланированного проснулся event loop"""
+        now = time.perf_counter()
+        if self._loop_lag_last is not None:
+            lag = max(0.0, now - self._loop_lag_last - 1.0)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_LAST.set(lag)
+        self._loop_lag_last = now
+
     def setup_routes(self):
         """Настройка всех API эндпоинтов"""
         
+        @self.flask_app.route('/metrics')
+        def metrics():
+            """Метрики в формате Prometheus"""
+            return Response(registry.render(), content_type=registry.CONTENT_TYPE)
+
         @self.flask_app.route('/stats')
         def stats():
-            from datetime import datetime
             try:
                 uptime = str(datetime.now() - self.bot.start_time).split('.')[0] if hasattr(self.bot, 'start_time') else "Unknown"
                 
@@ -63,15 +175,10 @@ class APIServer(commands.Cog):
             ]
             return jsonify(guilds)
         
-        @self.flask_app.route('/api/guild/<int:guild_id>/roles')
-        def get_guild_roles(guild_id):
-            if not self.bot.is_ready():
-                return jsonify({'error': 'Bot not ready'}), 503
-            
-            guild = self.bot.get_guild(guild_id)
-            if not guild:
-                return jsonify({'error': 'Guild not found'}), 404
-            
+        # ==================== ДАННЫЕ СЕРВЕРА (общие для эндпоинтов и overview) ====================
+
+        def build_roles(guild) -> list:
+            """Роли сервера (без @everyone), отсортированные по позиции"""
             roles = [
                 {
                     'id': r.id,
@@ -82,10 +189,272 @@ class APIServer(commands.Cog):
                 for r in guild.roles
                 if r.name != "@everyone"
             ]
-            
             roles.sort(key=lambda x: x['position'], reverse=True)
+            return roles
+
+        def build_members(members: list) -> list:
+            """Участники сервера из снимка"""
+            return [
+                {
+                    'id': m.id,
+                    'name': m.name,
+                    'display_name': m.display_name,
+                    'avatar': str(m.avatar.url) if m.avatar else None,
+                    'bot': m.bot,
+                    'roles': [r.id for r in m.roles if r.name != "@everyone"]
+                }
+                for m in members
+            ]
+
+        def parse_format(args) -> str:
+            """?format=json|arrow|parquet (ValueError если формат неизвестен или нет pyarrow)"""
+            fmt = args.get('format', 'json')
+            if fmt == 'json':
+                return fmt
+            if fmt not in COLUMNAR_FORMATS:
+                raise ValueError(f"Invalid format. Use: json, {', '.join(COLUMNAR_FORMATS)}")
+            if not columnar_available():
+                raise ValueError(f"Format '{fmt}' requires pyarrow on the bot host")
+            return fmt
+
+        def columnar_response(records: list, schema, fmt: str, metadata: dict = None, total_count: int = None):
+            """Ответ в колоночном формате (Arrow IPC stream / Parquet)"""
+            return Response(
+                encode_records(records, schema, fmt, metadata),
+                mimetype=COLUMNAR_FORMATS[fmt],
+                headers={'X-Total-Count': str(len(records) if total_count is None else total_count)}
+            )
+
+        def parse_users_stats_args(args) -> dict:
+            """Фильтры users-stats из query string (ValueError при неверной дате)"""
+
+            since_date = args.get('since_date')  # Format: YYYY-MM-DD
+            filter_date = None
+            if since_date:
+                try:
+                    filter_date = datetime.strptime(since_date, '%Y-%m-%d').date()
+                except ValueError:
+                    raise ValueError('Invalid date format. Use YYYY-MM-DD')
+
+            sort_by = args.get('sort_by', 'voice')
+            if sort_by not in USERS_STATS_SORT_KEYS:
+                raise ValueError(f"Invalid sort_by. Use: {', '.join(USERS_STATS_SORT_KEYS)}")
+            order = args.get('order', 'desc')
+            if order not in ('asc', 'desc'):
+                raise ValueError('Invalid order. Use: asc or desc')
+
+            # Пагинация включается параметром per_page (без него - все строки, как раньше)
+            per_page = args.get('per_page', type=int)
+            if per_page is not None and not 1 <= per_page <= USERS_STATS_MAX_PER_PAGE:
+                raise ValueError(f'per_page must be between 1 and {USERS_STATS_MAX_PER_PAGE}')
+
+            return {
+                'include_roles': args.getlist('include_roles', type=int),
+                'exclude_roles': args.getlist('exclude_roles', type=int),
+                'since_date': since_date,
+                'filter_date': filter_date,
+                'sort_by': sort_by,
+                'order': order,
+                'search': (args.get('search') or '').strip(),
+                'page': max(args.get('page', 1, type=int), 1),
+                'per_page': per_page
+            }
+
+        def build_users_stats(guild, cursor, filters: dict, with_avatars: bool = True) -> dict:
+            """Статистика участников с фильтрами по ролям и дате"""
+            guild_id = guild.id
+            include_roles = filters['include_roles']
+            exclude_roles = filters['exclude_roles']
+            filter_date = filters['filter_date']
+            sort_by = filters['sort_by']
+
+            # Non-bot members matching role filters (set operations over the role index)
+            member_ids = self.bot.role_index.filter_ids(guild, include_roles, exclude_roles)
+
+            search = filters['search'].casefold()
+
+            members_data = {}
+            for user_id in member_ids:
+                member = guild.get_member(user_id)
+                if member is None:
+                    continue
+
+                if search and search not in member.name.casefold() \
+                        and search not in member.display_name.casefold() and search != str(member.id):
+                    continue
+
+                members_data[member.id] = {
+                    'user_id': member.id,
+                    'username': member.name,
+                    'display_name': member.display_name,
+                    'avatar': None,  # заполняется только для отдаваемой страницы
+                    'roles': list(self.bot.role_index.role_ids(guild_id, member.id)),
+                    'total_messages': 0,
+                    'total_voice_time': 0,
+                    'period_messages': 0,
+                    'period_voice_time': 0
+                }
+
+            # Get total stats
+            cursor.execute('''
+                SELECT user_id, total_messages, total_voice_time
+                FROM user_stats_total
+                WHERE guild_id = ?
+            ''', (guild_id,))
+
+            for row in cursor.fetchall():
+                user_id, total_messages, total_voice_time = row
+                if user_id in members_data:
+                    members_data[user_id]['total_messages'] = total_messages or 0
+                    members_data[user_id]['total_voice_time'] = total_voice_time or 0
+
+            # Get period stats based on filter_date
+            if filter_date:
+                # Messages since date
+                cursor.execute('''
+                    SELECT user_id, SUM(message_count) as period_messages
+                    FROM user_messages_daily
+                    WHERE guild_id = ? AND message_date >= ?
+                    GROUP BY user_id
+                ''', (guild_id, filter_date.isoformat()))
+
+                for row in cursor.fetchall():
+                    user_id, period_messages = row
+                    if user_id in members_data:
+                        members_data[user_id]['period_messages'] = period_messages or 0
+
+                # Voice time since date
+                cursor.execute('''
+                    SELECT user_id, SUM(voice_time) as period_voice_time
+                    FROM user_voice_daily
+                    WHERE guild_id = ? AND voice_date >= ?
+                    GROUP BY user_id
+                ''', (guild_id, filter_date.isoformat()))
+
+                for row in cursor.fetchall():
+                    user_id, period_voice_time = row
+                    if user_id in members_data:
+                        members_data[user_id]['period_voice_time'] = period_voice_time or 0
+            else:
+                # No date filter - period stats = total stats
+                for user_id in members_data:
+                    members_data[user_id]['period_messages'] = members_data[user_id]['total_messages']
+                    members_data[user_id]['period_voice_time'] = members_data[user_id]['total_voice_time']
+
+            # Convert to list and sort
+            result = list(members_data.values())
+            result.sort(key=USERS_STATS_SORT_KEYS[sort_by], reverse=filters['order'] == 'desc')
+
+            # Итоги по всей выборке (не только по странице)
+            summary = {
+                'period_messages': sum(u['period_messages'] for u in result),
+                'period_voice_time': sum(u['period_voice_time'] for u in result),
+                'active_messages': sum(1 for u in result if u['period_messages'] > 0),
+                'active_voice': sum(1 for u in result if u['period_voice_time'] > 0)
+            }
+
+            total_count = len(result)
+            per_page = filters['per_page']
+            page = filters['page']
+            if per_page:
+                pages = max((total_count + per_page - 1) // per_page, 1)
+                page = min(page, pages)
+                result = result[(page - 1) * per_page:page * per_page]
+            else:
+                pages = 1
+                page = 1
+
+            if with_avatars:
+                for user in result:
+                    member = guild.get_member(user['user_id'])
+                    if member is not None and member.avatar:
+                        user['avatar'] = str(member.avatar.url)
+
+            return {
+                'users': result,
+                'generated_ts': time.time(),  # момент снимка - dashboard досчитывает live-дельты после него
+                'total_count': total_count,
+                'page': page,
+                'per_page': per_page,
+                'pages': pages,
+                'summary': summary,
+                'filters': {
+                    'include_roles': include_roles,
+                    'exclude_roles': exclude_roles,
+                    'since_date': filters['since_date'],
+                    'sort_by': sort_by,
+                    'order': filters['order'],
+                    'search': filters['search']
+                }
+            }
+
+        def build_inactive(guild_id: int, members: list, cursor, days: int, activity_type: str) -> dict:
+            """Неактивные участники за период по типу активности"""
+            # Все пользователи сервера (не боты)
+            all_members = [m.id for m in members if not m.bot]
+
+            # Активные по сообщениям / войсу за период
+            cursor.execute('''
+                SELECT DISTINCT user_id FROM user_messages_daily
+                WHERE guild_id = ? AND message_count > 0
+                AND message_date >= DATE('now', '-' || ? || ' days')
+            ''', (guild_id, days))
+            message_active = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute('''
+                SELECT DISTINCT user_id FROM user_voice_daily
+                WHERE guild_id = ? AND voice_time > 0
+                AND voice_date >= DATE('now', '-' || ? || ' days')
+            ''', (guild_id, days))
+            voice_active = {row[0] for row in cursor.fetchall()}
+
+            if activity_type == 'messages':
+                # Активен если есть сообщения
+                active_user_ids = message_active
+            elif activity_type == 'voice':
+                # Активен если есть время в войсе
+                active_user_ids = voice_active
+            else:
+                # Активен если есть И сообщения И войс
+                active_user_ids = message_active & voice_active
+
+            # Неактивные = все - активные
+            inactive_ids = [uid for uid in all_members if uid not in active_user_ids]
+
+            return {
+                'total_members': len(all_members),
+                'active_members': len(all_members) - len(inactive_ids),
+                'inactive_members': len(inactive_ids),
+                'inactive_user_ids': inactive_ids,
+                'activity_type': activity_type
+            }
+
+        def build_warnings(guild_id: int) -> dict:
+            """Сводка по выговорам сервера (кэшированная сводка WarningsRepository)"""
+            summary = self.bot.db.warnings_repo.summary(guild_id)
+
+            return {
+                'total_warnings': summary['total_warnings'],
+                'active_warnings': summary['active_warnings'],
+                'unique_users': summary['unique_users'],
+                'top_offenders': [
+                    {'user_id': user_id, 'warning_count': active}
+                    for user_id, active, _ in summary['active'][:10]
+                ]
+            }
+
+        # ==================== ЭНДПОИНТЫ СЕРВЕРА ====================
+
+        @self.flask_app.route('/api/guild/<int:guild_id>/roles')
+        def get_guild_roles(guild_id):
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
             
-            return jsonify(roles)
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return jsonify({'error': 'Guild not found'}), 404
+            
+            return jsonify(build_roles(guild))
         
         @self.flask_app.route('/api/guild/<int:guild_id>/members')
         def get_guild_members(guild_id):
@@ -96,18 +465,14 @@ class APIServer(commands.Cog):
             if not guild:
                 return jsonify({'error': 'Guild not found'}), 404
             
-            members = [
-                {
-                    'id': m.id,
-                    'name': m.name,
-                    'display_name': m.display_name,
-                    'avatar': str(m.avatar.url) if m.avatar else None,
-                    'bot': m.bot,
-                    'roles': [r.id for r in m.roles if r.name != "@everyone"]
-                }
-                for m in guild.members
-            ]
-            
+            try:
+                fmt = parse_format(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            members = build_members(list(guild.members))
+            if fmt != 'json':
+                return columnar_response(members, members_schema(), fmt)
             return jsonify(members)
         
         @self.flask_app.route('/api/guild/<int:guild_id>/users-stats')
@@ -121,124 +486,109 @@ class APIServer(commands.Cog):
                 return jsonify({'error': 'Guild not found'}), 404
 
             try:
-                from datetime import datetime
-
-                # Get filter parameters
-                include_roles = request.args.getlist('include_roles', type=int)
-                exclude_roles = request.args.getlist('exclude_roles', type=int)
-                since_date = request.args.get('since_date')  # Format: YYYY-MM-DD
-                sort_by = request.args.get('sort_by', 'voice')  # 'voice' or 'messages'
+                filters = parse_users_stats_args(request.args)
+                fmt = parse_format(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-                # Parse since_date if provided
-                filter_date = None
-                if since_date:
-                    try:
-                        filter_date = datetime.strptime(since_date, '%Y-%m-%d').date()
-                    except ValueError:
-                        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-
-                # Get all non-bot members with their roles
-                members_data = {}
-                for member in guild.members:
-                    if member.bot:
-                        continue
-
-                    member_role_ids = [r.id for r in member.roles if r.name != "@everyone"]
-
-                    # Apply role filters
-                    if include_roles:
-                        if not any(role_id in member_role_ids for role_id in include_roles):
-                            continue
-
-                    if exclude_roles:
-                        if any(role_id in member_role_ids for role_id in exclude_roles):
-                            continue
-
-                    members_data[member.id] = {
-                        'user_id': member.id,
-                        'username': member.name,
-                        'display_name': member.display_name,
-                        'avatar': str(member.avatar.url) if member.avatar else None,
-                        'roles': member_role_ids,
-                        'total_messages': 0,
-                        'total_voice_time': 0,
-                        'period_messages': 0,
-                        'period_voice_time': 0
-                    }
-
-                # Get stats from database
+            try:
                 import sqlite3
                 conn = sqlite3.connect(self.bot.db.db_path)
-                cursor = conn.cursor()
+                try:
+                    result = build_users_stats(guild, conn.cursor(), filters)
+                finally:
+                    conn.close()
+
+                if fmt != 'json':
+                    # total_count, пагинация, итоги и фильтры - в метаданных схемы
+                    return columnar_response(
+                        result['users'], users_stats_schema(), fmt,
+                        metadata={k: v for k, v in result.items() if k != 'users'},
+                        total_count=result['total_count']
+                    )
+                response = jsonify(result)
+                response.headers['X-Total-Count'] = str(result['total_count'])
+                return response
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.flask_app.route('/api/guild/<int:guild_id>/export')
+        def export_guild_stats(guild_id):
+            """Потоковый экспорт статистики (CSV / NDJSON, опционально gzip)"""
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
 
-                # Get total stats
-                cursor.execute('''
-                    SELECT user_id, total_messages, total_voice_time
-                    FROM user_stats_total
-                    WHERE guild_id = ?
-                ''', (guild_id,))
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return jsonify({'error': 'Guild not found'}), 404
 
-                for row in cursor.fetchall():
-                    user_id, total_messages, total_voice_time = row
-                    if user_id in members_data:
-                        members_data[user_id]['total_messages'] = total_messages or 0
-                        members_data[user_id]['total_voice_time'] = total_voice_time or 0
-
-                # Get period stats based on filter_date
-                if filter_date:
-                    # Messages since date
-                    cursor.execute('''
-                        SELECT user_id, SUM(message_count) as period_messages
-                        FROM user_messages_daily
-                        WHERE guild_id = ? AND message_date >= ?
-                        GROUP BY user_id
-                    ''', (guild_id, filter_date.isoformat()))
-
-                    for row in cursor.fetchall():
-                        user_id, period_messages = row
-                        if user_id in members_data:
-                            members_data[user_id]['period_messages'] = period_messages or 0
-
-                    # Voice time since date
-                    cursor.execute('''
-                        SELECT user_id, SUM(voice_time) as period_voice_time
-                        FROM user_voice_daily
-                        WHERE guild_id = ? AND voice_date >= ?
-                        GROUP BY user_id
-                    ''', (guild_id, filter_date.isoformat()))
-
-                    for row in cursor.fetchall():
-                        user_id, period_voice_time = row
-                        if user_id in members_data:
-                            members_data[user_id]['period_voice_time'] = period_voice_time or 0
-                else:
-                    # No date filter - period stats = total stats
-                    for user_id in members_data:
-                        members_data[user_id]['period_messages'] = members_data[user_id]['total_messages']
-                        members_data[user_id]['period_voice_time'] = members_data[user_id]['total_voice_time']
+            export_format = request.args.get('format', 'csv')
+            if export_format not in ['csv', 'ndjson']:
+                return jsonify({'error': 'Invalid format. Use: csv or ndjson'}), 400
 
-                conn.close()
+            days = request.args.get('days', type=int)
+            if days is not None and days not in [7, 14, 30]:
+                return jsonify({'error': 'Invalid days parameter'}), 400
 
-                # Convert to list and sort
-                result = list(members_data.values())
-                if sort_by == 'messages':
-                    result.sort(key=lambda x: (x['period_messages'], x['period_voice_time']), reverse=True)
-                else:  # default: voice
-                    result.sort(key=lambda x: (x['period_voice_time'], x['period_messages']), reverse=True)
+            since_date = request.args.get('since_date')  # Format: YYYY-MM-DD
+            if since_date:
+                try:
+                    since_date = datetime.strptime(since_date, '%Y-%m-%d').date().isoformat()
+                except ValueError:
+                    return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+            include_roles = request.args.getlist('include_roles', type=int)
+            exclude_roles = request.args.getlist('exclude_roles', type=int)
+            # Сортировки - те же, что у таблицы users-stats
+            sort_by = request.args.get('sort_by', 'voice')
+            if sort_by not in USERS_STATS_SORT_KEYS:
+                return jsonify({'error': f"Invalid sort_by. Use: {', '.join(USERS_STATS_SORT_KEYS)}"}), 400
+            order = request.args.get('order', 'desc')
+            if order not in ('asc', 'desc'):
+                return jsonify({'error': 'Invalid order. Use: asc or desc'}), 400
+            members_only = request.args.get('members_only', '0') == '1'
+            compress = request.args.get('gzip', '0') == '1'
+
+            # Снимок участников берём один раз. Строки статистики читаем целиком до начала
+            # ответа: открытый курсор держит SHARED lock (БД не в WAL), и запись бота ждала бы,
+            # пока клиент скачивает файл. Дальше по сети отдаётся уже без SQLite
+            members = member_snapshot(guild)
+            rows = list(iter_stats_rows(
+                self.bot.db.db_path, guild_id, days=days, since_date=since_date, sort_by=sort_by, order=order
+            ))
+            allowed_ids = None
+            if include_roles or exclude_roles:
+                allowed_ids = self.bot.role_index.filter_ids(
+                    guild, include_roles, exclude_roles, humans_only=members_only
+                )
+            records = iter_export_records(
+                rows, members,
+                allowed_ids=allowed_ids,
+                members_only=members_only or bool(include_roles),
+                include_bots=not members_only
+            )
+            if sort_by == 'name':
+                # Имена есть только у участников - эта сортировка в памяти, остальные в SQL
+                records = sort_records(records, USERS_STATS_SORT_KEYS['name'], reverse=order == 'desc')
+
+            if export_format == 'csv':
+                chunks = stream_csv(records, bom=True)
+                mimetype = 'text/csv'
+                filename = f'user_stats_{guild_id}.csv'
+            else:
+                chunks = stream_ndjson(records)
+                mimetype = 'application/x-ndjson'
+                filename = f'user_stats_{guild_id}.ndjson'
+
+            if compress:
+                mimetype = 'application/gzip'
+                filename += '.gz'
+
+            response = Response(stream_with_context(encode_stream(chunks, compress=compress)), mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            response.headers['Cache-Control'] = 'no-store'
+            return response
 
-                return jsonify({
-                    'users': result,
-                    'total_count': len(result),
-                    'filters': {
-                        'include_roles': include_roles,
-                        'exclude_roles': exclude_roles,
-                        'since_date': since_date,
-                        'sort_by': sort_by
-                    }
-                })
-            except Exception as e:
-                return jsonify({'error': str(e)}), 500
-        
         @self.flask_app.route('/api/guild/<int:guild_id>/inactive/<int:days>/<activity_type>')
         def get_inactive_users(guild_id, days, activity_type):
             if not self.bot.is_ready():
@@ -255,41 +605,14 @@ class APIServer(commands.Cog):
                 if not guild:
                     return jsonify({'error': 'Guild not found'}), 404
                 
-                # Все пользователи сервера (не боты)
-                all_members = [m.id for m in guild.members if not m.bot]
-                
-                # Получаем статистику
-                all_stats = self.bot.db.get_all_users_stats(guild_id, days)
-                
-                # Определяем активных по типу активности
-                active_user_ids = set()
-                
-                for stat in all_stats:
-                    if activity_type == 'messages':
-                        # Активен если есть сообщения
-                        if stat['period_messages'] > 0:
-                            active_user_ids.add(stat['user_id'])
-                    
-                    elif activity_type == 'voice':
-                        # Активен если есть время в войсе
-                        if stat['period_voice_time'] > 0:
-                            active_user_ids.add(stat['user_id'])
-                    
-                    elif activity_type == 'both':
-                        # Активен если есть И сообщения И войс
-                        if stat['period_messages'] > 0 and stat['period_voice_time'] > 0:
-                            active_user_ids.add(stat['user_id'])
-                
-                # Неактивные = все - активные
-                inactive_ids = [uid for uid in all_members if uid not in active_user_ids]
-                
-                return jsonify({
-                    'total_members': len(all_members),
-                    'active_members': len(active_user_ids),
-                    'inactive_members': len(inactive_ids),
-                    'inactive_user_ids': inactive_ids,
-                    'activity_type': activity_type
-                })
+                import sqlite3
+                conn = sqlite3.connect(self.bot.db.db_path)
+                try:
+                    result = build_inactive(guild_id, list(guild.members), conn.cursor(), days, activity_type)
+                finally:
+                    conn.close()
+
+                return jsonify(result)
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
@@ -298,48 +621,267 @@ class APIServer(commands.Cog):
             if not self.bot.is_ready():
                 return jsonify({'error': 'Bot not ready'}), 503
             
+            try:
+                return jsonify(build_warnings(guild_id))
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @self.flask_app.route('/api/guild/<int:guild_id>/overview')
+        def get_guild_overview(guild_id):
+            """
+            Все данные страницы dashboard одним запросом из одного снимка.
+            ?sections=members,roles,users_stats,inactive,warnings
+            Параметры секций: фильтры users-stats, days и activity_type для inactive.
+            """
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return jsonify({'error': 'Guild not found'}), 404
+
+            available = ['members', 'roles', 'users_stats', 'inactive', 'warnings']
+            sections_arg = request.args.get('sections')
+            sections = [s.strip() for s in sections_arg.split(',') if s.strip()] if sections_arg else available
+            unknown = [s for s in sections if s not in available]
+            if unknown:
+                return jsonify({'error': f"Unknown sections: {', '.join(unknown)}. Available: {', '.join(available)}"}), 400
+
+            try:
+                filters = parse_users_stats_args(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            days = request.args.get('days', 7, type=int)
+            activity_type = request.args.get('activity_type', 'both')
+            if 'inactive' in sections:
+                if days not in [7, 14, 30]:
+                    return jsonify({'error': 'Invalid days parameter'}), 400
+                if activity_type not in ['messages', 'voice', 'both']:
+                    return jsonify({'error': 'Invalid activity_type. Use: messages, voice, or both'}), 400
+
+            try:
+                import sqlite3
+
+                # Один снимок участников на все секции
+                members = list(guild.members)
+                result = {
+                    'guild_id': guild_id,
+                    'generated_at': datetime.utcnow().isoformat(),
+                    'generated_ts': time.time(),
+                    'sections': sections
+                }
+
+                if 'roles' in sections:
+                    result['roles'] = build_roles(guild)
+                if 'members' in sections:
+                    result['members'] = build_members(members)
+
+                db_sections = [s for s in sections if s in ('users_stats', 'inactive')]
+                if db_sections:
+                    # Одна read-транзакция - все секции видят одно состояние БД
+                    conn = sqlite3.connect(self.bot.db.db_path, isolation_level=None)
+                    try:
+                        cursor = conn.cursor()
+                        cursor.execute('BEGIN')
+                        if 'users_stats' in sections:
+                            result['users_stats'] = build_users_stats(guild, cursor, filters)
+                        if 'inactive' in sections:
+                            result['inactive'] = build_inactive(guild_id, members, cursor, days, activity_type)
+                        cursor.execute('COMMIT')
+                    finally:
+                        conn.close()
+                if 'warnings' in sections:
+                    result['warnings'] = build_warnings(guild_id)
+
+                return jsonify(result)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @self.flask_app.route('/api/guild/<int:guild_id>/timeseries')
+        def get_guild_timeseries(guild_id):
+            """
+            Активность по дням/неделям для графиков.
+            ?days=30 или ?since_date=YYYY-MM-DD, ?granularity=day|week,
+            (не больше DAILY_RETENTION_DAYS - более старые дневные данные удаляются),
+            ?max_points=365 (бакеты укрупняются на сервере), ?roles=<id>&roles=<id> - разбивка по ролям
+            """
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return jsonify({'error': 'Guild not found'}), 404
+
+            granularity = request.args.get('granularity', 'day')
+            if granularity not in GRANULARITY_DAYS:
+                return jsonify({'error': f"Invalid granularity. Use: {', '.join(GRANULARITY_DAYS)}"}), 400
+
+            end = datetime.utcnow().date()  # дневные таблицы пишутся по DATE('now') - это UTC
+            oldest = end - timedelta(days=DAILY_RETENTION_DAYS - 1)
+            since_date = request.args.get('since_date')
+            if since_date:
+                try:
+                    start = datetime.strptime(since_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+                start = max(start, oldest)
+            else:
+                days = request.args.get('days', DAILY_RETENTION_DAYS, type=int)
+                if not 1 <= days <= DAILY_RETENTION_DAYS:
+                    return jsonify({'error': f'days must be between 1 and {DAILY_RETENTION_DAYS}'}), 400
+                start = end - timedelta(days=days - 1)
+            if start > end:
+                return jsonify({'error': 'since_date is in the future'}), 400
+
+            max_points = min(max(request.args.get('max_points', DEFAULT_MAX_POINTS, type=int), 10), 1000)
+
+            role_ids = request.args.getlist('roles', type=int)
+            if len(role_ids) > MAX_ROLES:
+                return jsonify({'error': f'At most {MAX_ROLES} roles'}), 400
+            roles_by_id = {r.id: r for r in guild.roles}
+            unknown = [role_id for role_id in role_ids if role_id not in roles_by_id]
+            if unknown:
+                return jsonify({'error': f"Unknown roles: {', '.join(map(str, unknown))}"}), 400
+            role_members = {
+                role_id: self.bot.role_index.filter_ids(guild, [role_id])
+                for role_id in role_ids
+            }
+
             try:
                 import sqlite3
-                
                 conn = sqlite3.connect(self.bot.db.db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT 
-                        COUNT(*) as total_warnings,
-                        SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active_warnings,
-                        COUNT(DISTINCT user_id) as unique_users
-                    FROM warnings
-                    WHERE guild_id = ?
-                ''', (guild_id,))
-                
-                stats = cursor.fetchone()
-                
-                cursor.execute('''
-                    SELECT user_id, COUNT(*) as warning_count
-                    FROM warnings
-                    WHERE guild_id = ? AND is_active = 1
-                    GROUP BY user_id
-                    ORDER BY warning_count DESC
-                    LIMIT 10
-                ''', (guild_id,))
-                
-                top_offenders = [
-                    {'user_id': row[0], 'warning_count': row[1]}
-                    for row in cursor.fetchall()
-                ]
-                
-                conn.close()
-                
-                return jsonify({
-                    'total_warnings': stats[0],
-                    'active_warnings': stats[1],
-                    'unique_users': stats[2],
-                    'top_offenders': top_offenders
-                })
+                try:
+                    result = build_timeseries(
+                        conn.cursor(), guild_id, start, end,
+                        granularity=granularity, max_points=max_points, role_members=role_members
+                    )
+                finally:
+                    conn.close()
+
+                for role in result['roles']:
+                    role['name'] = roles_by_id[role['role_id']].name
+                result['guild_id'] = guild_id
+                return jsonify(result)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @self.flask_app.route('/api/guild/<int:guild_id>/distribution')
+        def get_guild_distribution(guild_id):
+            """
+            Распределение активности участников: гистограммы, перцентили p50/p90/p99,
+            коэффициент Джини, доля топ-1%/10%, кривая Лоренца и совместная гистограмма
+            сообщения × войс. Фильтры - как у users-stats; ответ не зависит от размера сервера.
+            ?metrics=period_messages,period_voice_time&bins=20&scale=log|linear
+            """
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return jsonify({'error': 'Guild not found'}), 404
+
+            try:
+                filters = parse_users_stats_args(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            filters['per_page'] = None
+            filters['search'] = ''
+
+            metrics_arg = request.args.get('metrics')
+            metrics = [m.strip() for m in metrics_arg.split(',') if m.strip()] if metrics_arg else list(DISTRIBUTION_METRICS)
+            unknown = [m for m in metrics if m not in DISTRIBUTION_METRICS]
+            if unknown:
+                return jsonify({'error': f"Unknown metrics: {', '.join(unknown)}. Available: {', '.join(DISTRIBUTION_METRICS)}"}), 400
+
+            bins = min(max(request.args.get('bins', 20, type=int), 2), 100)
+            scale = request.args.get('scale', 'log')
+            if scale not in ('log', 'linear'):
+                return jsonify({'error': 'Invalid scale. Use: log or linear'}), 400
+
+            try:
+                import sqlite3
+                conn = sqlite3.connect(self.bot.db.db_path)
+                try:
+                    stats = build_users_stats(guild, conn.cursor(), filters, with_avatars=False)
+                finally:
+                    conn.close()
+
+                result = build_distribution(stats['users'], metrics, bins=bins, log=scale == 'log')
+                result['guild_id'] = guild_id
+                result['filters'] = stats['filters']
+                return jsonify(result)
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
+
+        @self.flask_app.route('/api/guild/<int:guild_id>/activity-hours')
+        def get_guild_activity_hours(guild_id):
+            """
+            Активность по часам суток за последние 30 дней (из кольцевых буферов, без запросов к БД).
+            ?series=messages|voice, ?tz=3 (часовой пояс UTC+N).
+            voice - среднее число участников в войсе за час.
+            """
+            if not self.bot.get_guild(guild_id):
+                return jsonify({'error': 'Guild not found'}), 404
+
+            series = request.args.get('series', 'messages')
+            if series not in ACTIVITY_SERIES:
+                return jsonify({'error': f"Invalid series. Use: {', '.join(ACTIVITY_SERIES)}"}), 400
+            tz_offset = request.args.get('tz', 0, type=int)
+            if not -12 <= tz_offset <= 14:
+                return jsonify({'error': 'tz must be between -12 and 14'}), 400
+
+            activity = self.bot.hourly_activity
+            scale = 3600 if series == 'voice' else 1
+
+            def scaled(matrix):
+                return [[round(value / scale, 2) for value in row] for row in matrix]
+
+            weekdays = scaled(activity.weekday_hours(guild_id, series, tz_offset))
+            return jsonify({
+                'guild_id': guild_id,
+                'series': series,
+                'tz_offset': tz_offset,
+                'hours': list(range(24)),
+                'dates': activity.grid_dates(tz_offset),
+                'days': scaled(activity.grid(guild_id, series, tz_offset)),
+                'weekday_names': WEEKDAY_NAMES,
+                'weekdays': weekdays,
+                'peak_hours': [{'hour': hour, 'value': round(value, 2)} for hour, value in peak_hours(weekdays)]
+            })
         
+        @self.flask_app.route('/api/guild/<int:guild_id>/events')
+        def stream_guild_events(guild_id):
+            """
+            Live-события сервера (Server-Sent Events): messages, voice_join, voice_leave,
+            warning_issued, warning_removed, warning_expired, settings_changed, resync
+            """
+            if not self.bot.is_ready():
+                return jsonify({'error': 'Bot not ready'}), 503
+
+            if not self.bot.get_guild(guild_id):
+                return jsonify({'error': 'Guild not found'}), 404
+
+            subscription = self.bot.event_bus.subscribe(guild_id)
+            if subscription is None:
+                return jsonify({'error': 'Too many event subscribers'}), 503
+
+            def generate():
+                with subscription:
+                    yield f"retry: {SSE_RETRY_MS}\n: connected\n\n"
+                    while True:
+                        event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                        if event is None:
+                            # Heartbeat - держим соединение и замечаем отключившихся клиентов
+                            yield ": ping\n\n"
+                        else:
+                            yield format_sse(event)
+
+            response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
         # ==================== НОВЫЕ ЭНДПОИНТЫ ДЛЯ АВТОРИЗАЦИИ ====================
         
         @self.flask_app.route('/api/whitelist/check/<int:guild_id>/<int:user_id>')
@@ -391,12 +933,7 @@ class APIServer(commands.Cog):
         def get_user_id_from_token(access_token: str) -> int | None:
             """Получить user_id из Discord access token"""
             try:
-                headers = {'Authorization': f'Bearer {access_token}'}
-                response = requests.get(
-                    'https://discord.com/api/users/@me',
-                    headers=headers,
-                    timeout=10
-                )
+                response = self.rest.get_current_user(access_token)
                 if response.status_code == 200:
                     return int(response.json()['id'])
                 return None
@@ -415,13 +952,10 @@ class APIServer(commands.Cog):
 
             try:
                 # Получаем user_id из Discord API
-                headers = {'Authorization': f'Bearer {access_token}'}
-                response = requests.get(
-                    'https://discord.com/api/users/@me',
-                    headers=headers,
-                    timeout=10
-                )
+                response = self.rest.get_current_user(access_token)
 
+                if response.status_code == 429:
+                    return jsonify({'error': 'Rate limited. Please try again later.'}), 429
                 if response.status_code != 200:
                     return jsonify({'error': 'Failed to fetch user from Discord'}), 401
 
@@ -491,6 +1025,9 @@ class APIServer(commands.Cog):
                 success = self.bot.db.update_guild_settings(guild_id, **filtered_data)
 
                 if success:
+                    if 'logo_url' in filtered_data:
+                        self.collect_logo_garbage()
+                    self.bot.event_bus.publish('settings_changed', guild_id, fields=sorted(filtered_data))
                     return jsonify({'success': True, 'message': 'Settings updated'})
                 else:
                     return jsonify({'error': 'Failed to update settings'}), 500
@@ -516,6 +1053,8 @@ class APIServer(commands.Cog):
                 success = self.bot.db.reset_guild_settings(guild_id)
 
                 if success:
+                    self.collect_logo_garbage()
+                    self.bot.event_bus.publish('settings_changed', guild_id, fields=[], reset=True)
                     return jsonify({'success': True, 'message': 'Settings reset to defaults'})
                 else:
                     return jsonify({'error': 'Failed to reset settings'}), 500
@@ -564,26 +1103,31 @@ class APIServer(commands.Cog):
                 # Создаём папку если не существует
                 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-                # Удаляем старый логотип если есть
-                for old_file in os.listdir(UPLOAD_FOLDER):
-                    if old_file.startswith(f"{guild_id}."):
-                        os.remove(os.path.join(UPLOAD_FOLDER, old_file))
+                image_data = file.read()
+
+                # Сразу готовим аватарку 256x256 (один раз, в пуле процессов)
+                try:
+                    rendition = self.logo_store.process(image_data)
+                except Exception as e:
+                    return jsonify({'error': f'Invalid image: {str(e)}'}), 400
 
-                # Сохраняем новый файл
+                # Сохраняем под именем = хэш содержимого (файл неизменяемый)
                 ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{guild_id}.{ext}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
+                filename = save_content_addressed(UPLOAD_FOLDER, image_data, ext)
 
                 # Формируем URL для логотипа
                 logo_url = f"/uploads/logos/{filename}"
 
-                # Обновляем настройки в БД
+                # Обновляем настройки в БД и удаляем файлы, на которые больше никто не ссылается
                 self.bot.db.update_guild_settings(guild_id, logo_url=logo_url)
+                self.collect_logo_garbage()
+                self.bot.event_bus.publish('settings_changed', guild_id, fields=['logo_url'])
 
                 return jsonify({
                     'success': True,
                     'logo_url': logo_url,
+                    'avatar_hash': rendition['hash'],
+                    'processing_ms': rendition['processing_ms'],
                     'message': 'Logo uploaded successfully'
                 })
             except Exception as e:
@@ -605,13 +1149,10 @@ class APIServer(commands.Cog):
                 return jsonify({'error': 'Access denied'}), 403
 
             try:
-                # Удаляем файл
-                for old_file in os.listdir(UPLOAD_FOLDER):
-                    if old_file.startswith(f"{guild_id}."):
-                        os.remove(os.path.join(UPLOAD_FOLDER, old_file))
-
-                # Очищаем URL в БД
+                # Очищаем URL в БД, файл удаляется если им не пользуются другие серверы
                 self.bot.db.update_guild_settings(guild_id, logo_url=None)
+                self.collect_logo_garbage()
+                self.bot.event_bus.publish('settings_changed', guild_id, fields=['logo_url'])
 
                 return jsonify({'success': True, 'message': 'Logo deleted'})
             except Exception as e:
@@ -619,8 +1160,40 @@ class APIServer(commands.Cog):
 
         @self.flask_app.route('/uploads/logos/<filename>')
         def serve_logo(filename):
-            """Отдаём файл логотипа"""
-            return send_from_directory(UPLOAD_FOLDER, filename)
+            """Отдаём файл логотипа (с ETag и долгим кэшированием для хэшированных имён)"""
+            filename = secure_filename(filename)
+            immutable = is_content_addressed(filename)
+            cache_control = LOGO_CACHE_CONTROL if immutable else 'no-cache'
+
+            cached = self.logo_cache.get(filename)
+            record_cache('logo_file', cached is not None)
+            if cached is None:
+                filepath = os.path.join(UPLOAD_FOLDER, filename)
+                if not os.path.isfile(filepath):
+                    return jsonify({'error': 'Not found'}), 404
+
+                if os.path.getsize(filepath) > self.logo_cache.max_file_size:
+                    # Большие файлы отдаём с диска (conditional + ETag от Werkzeug)
+                    response = send_from_directory(UPLOAD_FOLDER, filename, conditional=True, etag=True)
+                    response.headers['Cache-Control'] = cache_control
+                    return response
+
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+                etag = filename.split('.', 1)[0] if immutable else content_hash(data)
+                # Изменяемые (старые) файлы не держим в памяти - они могут быть перезаписаны
+                if immutable:
+                    self.logo_cache.put(filename, data, etag)
+            else:
+                data, etag = cached
+
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = Response(data, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
 
         @self.flask_app.route('/api/admin/guild/<int:guild_id>/bot-avatar', methods=['POST'])
         def apply_bot_avatar(guild_id):
@@ -651,7 +1224,6 @@ class APIServer(commands.Cog):
 
             try:
                 import base64
-                import asyncio
 
                 # Определяем путь к файлу логотипа
                 if logo_url.startswith('/uploads/logos/'):
@@ -661,48 +1233,24 @@ class APIServer(commands.Cog):
                     if not os.path.exists(filepath):
                         return jsonify({'error': 'Logo file not found'}), 404
 
-                    # Читаем файл и конвертируем в base64
                     with open(filepath, 'rb') as f:
-                        image_data = f.read()
-                else:
-                    # Внешний URL - скачиваем изображение
-                    try:
-                        response = requests.get(logo_url, timeout=10)
-                        if response.status_code != 200:
-                            return jsonify({'error': 'Failed to fetch logo from URL'}), 400
-                        image_data = response.content
-                    except Exception as e:
-                        return jsonify({'error': f'Failed to fetch logo: {str(e)}'}), 400
-
-                # Ресайзим изображение для Discord (макс 256x256, рекомендуется PNG)
-                from PIL import Image
-                import io as io_module
-
-                # Открываем изображение
-                img = Image.open(io_module.BytesIO(image_data))
-
-                # Конвертируем в RGB если нужно (для RGBA/P режимов)
-                if img.mode in ('RGBA', 'P'):
-                    # Сохраняем альфа-канал для PNG
-                    img = img.convert('RGBA')
-                else:
-                    img = img.convert('RGB')
-
-                # Ресайзим до 256x256 (Discord рекомендует квадратные аватарки)
-                max_size = 256
-                if img.width > max_size or img.height > max_size:
-                    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-                # Сохраняем в PNG формат
-                output_buffer = io_module.BytesIO()
-                if img.mode == 'RGBA':
-                    img.save(output_buffer, format='PNG', optimize=True)
-                    mime_type = 'image/png'
-                else:
-                    img.save(output_buffer, format='PNG', optimize=True)
-                    mime_type = 'image/png'
+                        source_data = f.read()
 
-                image_data = output_buffer.getvalue()
+                    # Аватарка берётся из кэша по хэшу; обработка только если исходник изменился
+                    image_data = self.logo_store.process(source_data)['data']
+                else:
+                    # Внешний URL - скачиваем только если аватарка ещё не готова
+                    image_data = self.logo_store.get_cached_for_url(logo_url)
+                    if image_data is None:
+                        try:
+                            response = self.rest.fetch_url(logo_url, max_bytes=MAX_FILE_SIZE)
+                            if response.status_code != 200:
+                                return jsonify({'error': 'Failed to fetch logo from URL'}), 400
+                        except Exception as e:
+                            return jsonify({'error': f'Failed to fetch logo: {str(e)}'}), 400
+                        image_data = self.logo_store.process(response.content, source_url=logo_url)['data']
+
+                mime_type = 'image/png'
 
                 # Формируем data URI для Discord API
                 base64_image = base64.b64encode(image_data).decode('utf-8')
@@ -714,17 +1262,7 @@ class APIServer(commands.Cog):
                 if not bot_token:
                     return jsonify({'error': 'Bot token not configured'}), 500
 
-                headers = {
-                    'Authorization': f'Bot {bot_token}',
-                    'Content-Type': 'application/json'
-                }
-
-                api_response = requests.patch(
-                    f'https://discord.com/api/v10/guilds/{guild_id}/members/@me',
-                    headers=headers,
-                    json={'avatar': avatar_data},
-                    timeout=30
-                )
+                api_response = self.rest.modify_current_member(guild_id, bot_token, {'avatar': avatar_data})
 
                 if api_response.status_code == 200:
                     return jsonify({
@@ -772,35 +1310,70 @@ class APIServer(commands.Cog):
                 if not bot_token:
                     return jsonify({'error': 'Bot token not configured'}), 500
 
-                headers = {
-                    'Authorization': f'Bot {bot_token}',
-                    'Content-Type': 'application/json'
-                }
-
                 # Отправляем null чтобы сбросить к глобальной аватарке
-                api_response = requests.patch(
-                    f'https://discord.com/api/v10/guilds/{guild_id}/members/@me',
-                    headers=headers,
-                    json={'avatar': None},
-                    timeout=30
-                )
+                api_response = self.rest.modify_current_member(guild_id, bot_token, {'avatar': None})
 
                 if api_response.status_code == 200:
                     return jsonify({
                         'success': True,
                         'message': 'Bot avatar reset to default for this server'
                     })
+                elif api_response.status_code == 429:
+                    return jsonify({'error': 'Rate limited. Please try again later.'}), 429
                 else:
                     return jsonify({'error': f'Discord API returned status {api_response.status_code}'}), 500
 
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
+    def collect_logo_garbage(self) -> int:
+        """Удалить файлы логотипов и аватарок, на которые не ссылается ни один сервер"""
+        referenced_urls = self.bot.db.get_all_logo_urls()
+        if referenced_urls is None or not os.path.isdir(UPLOAD_FOLDER):
+            return 0
+
+        referenced_files = {
+            url.split('/')[-1] for url in referenced_urls
+            if url.startswith('/uploads/logos/')
+        }
+
+        removed = 0
+        referenced_hashes = set()
+        now = time.time()
+        for filename in os.listdir(UPLOAD_FOLDER):
+            filepath = os.path.join(UPLOAD_FOLDER, filename)
+            if filename in referenced_files:
+                if is_content_addressed(filename):
+                    referenced_hashes.add(filename.split('.', 1)[0])
+                else:
+                    with open(filepath, 'rb') as f:
+                        referenced_hashes.add(content_hash(f.read()))
+                continue
+
+            try:
+                if now - os.path.getmtime(filepath) < GC_GRACE_SECONDS:
+                    continue
+                os.remove(filepath)
+                self.logo_cache.discard(filename)
+                removed += 1
+            except OSError:
+                pass
+
+        removed += self.logo_store.collect_garbage(referenced_hashes)
+        if removed:
+            print(f"🧹 Removed {removed} orphaned logo files")
+        return removed
+
+    def cog_unload(self):
+        """Останавливаем пул обработки логотипов и замер задержки loop"""
+        self.measure_loop_lag.cancel()
+        self.logo_store.shutdown()
+
     def run_flask(self):
         """Запуск Flask через Waitress (production-ready)"""
         from waitress import serve
         print("🚀 Starting Waitress API server on http://0.0.0.0:5555")
-        serve(self.flask_app, host='0.0.0.0', port=5555, threads=4)
+        serve(self.flask_app, host='0.0.0.0', port=5555, threads=API_THREADS)
 
 
 async def setup(bot):
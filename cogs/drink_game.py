@@ -13,6 +13,14 @@ class DrinkGame(commands.Cog):
         
         # Инициализируем таблицу в БД
         self.init_drink_table()
+        
+        # Рейтинг сервера (пересчитывается после следующего !drink на сервере)
+        self.leaderboards = {}  # guild_id -> {'ranking': [...], 'server': [...], 'ranks': {...}}
+        
+        # Время последнего напитка и итоги по напиткам - в памяти, загружаются
+        # при первом обращении к серверу и дальше обновляются в add_drink
+        self.last_drinks = {}  # guild_id -> {user_id: datetime}
+        self.user_totals = {}  # guild_id -> {user_id: {напиток: литров}}
     
     def init_drink_table(self):
         """Создание таблицы для статистики напитков"""
@@ -35,29 +43,46 @@ class DrinkGame(commands.Cog):
         conn.commit()
         conn.close()
     
-    def get_last_drink_time(self, guild_id: int, user_id: int):
-        """Получить время последнего напитка"""
+    def load_guild(self, guild_id: int):
+        """Загрузить время последних напитков и итоги сервера (один раз на сервер)"""
+        if guild_id in self.last_drinks:
+            return
+        
         import sqlite3
         conn = sqlite3.connect(self.db.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT drunk_at FROM drink_stats
-            WHERE guild_id = ? AND user_id = ?
-            ORDER BY drunk_at DESC LIMIT 1
-        ''', (guild_id, user_id))
+            SELECT user_id, MAX(drunk_at) FROM drink_stats
+            WHERE guild_id = ?
+            GROUP BY user_id
+        ''', (guild_id,))
+        last_drinks = {user_id: datetime.fromisoformat(drunk_at) for user_id, drunk_at in cursor.fetchall()}
         
-        result = cursor.fetchone()
-        conn.close()
+        cursor.execute('''
+            SELECT user_id, drink_type, total FROM drink_totals
+            WHERE guild_id = ?
+        ''', (guild_id,))
+        user_totals = {}
+        for user_id, drink_type, total in cursor.fetchall():
+            user_totals.setdefault(user_id, {})[drink_type] = total
         
-        if result:
-            return datetime.fromisoformat(result[0])
-        return None
+        conn.close()
+        self.last_drinks[guild_id] = last_drinks
+        self.user_totals[guild_id] = user_totals
+    
+    def get_last_drink_time(self, guild_id: int, user_id: int):
+        """Получить время последнего напитка"""
+        self.load_guild(guild_id)
+        return self.last_drinks[guild_id].get(user_id)
     
     def add_drink(self, guild_id: int, user_id: int, drink_type: str, amount: int):
         """Добавить напиток в статистику"""
         import sqlite3
         try:
+            # Загружаем сервер до записи - иначе новая строка попадёт в итоги дважды
+            self.load_guild(guild_id)
+            
             conn = sqlite3.connect(self.db.db_path)
             cursor = conn.cursor()
             
@@ -68,48 +93,76 @@ class DrinkGame(commands.Cog):
             
             conn.commit()
             conn.close()
+            
+            self.last_drinks[guild_id][user_id] = datetime.utcnow()
+            totals = self.user_totals[guild_id].setdefault(user_id, {})
+            totals[drink_type] = totals.get(drink_type, 0) + amount
+            self.leaderboards.pop(guild_id, None)
             return True
         except Exception as e:
             print(f"Error adding drink: {e}")
             return False
     
     def get_user_stats(self, guild_id: int, user_id: int):
-        """Получить статистику пользователя"""
+        """Получить статистику пользователя: {напиток: литров}"""
+        self.load_guild(guild_id)
+        return dict(self.user_totals[guild_id].get(user_id, {}))
+    
+    def get_leaderboard(self, guild_id: int) -> dict:
+        """
+        Рейтинг сервера одним запросом по drink_totals:
+        ranking - [(user_id, всего, любимый напиток)] по убыванию,
+        server - [(напиток, всего)] по серверу, ranks - user_id -> место.
+        Кэшируется до следующего !drink на сервере.
+        """
+        leaderboard = self.leaderboards.get(guild_id)
+        if leaderboard is not None:
+            return leaderboard
+        
         import sqlite3
         conn = sqlite3.connect(self.db.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT drink_type, SUM(amount) as total
-            FROM drink_stats
-            WHERE guild_id = ? AND user_id = ?
+            WITH user_drinks AS (
+                SELECT user_id, drink_type,
+                       SUM(total) OVER (PARTITION BY user_id) as user_total,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY total DESC, drink_type) as drink_rank
+                FROM drink_totals
+                WHERE guild_id = ? AND total > 0
+            )
+            SELECT 'user', user_id, drink_type, user_total
+            FROM user_drinks
+            WHERE drink_rank = 1
+            UNION ALL
+            SELECT 'server', NULL, drink_type, SUM(total)
+            FROM drink_totals
+            WHERE guild_id = ?
             GROUP BY drink_type
-        ''', (guild_id, user_id))
+        ''', (guild_id, guild_id))
         
-        results = cursor.fetchall()
+        rows = cursor.fetchall()
         conn.close()
         
-        return {drink_type: total for drink_type, total in results}
+        ranking = sorted(
+            ((user_id, total, drink_type) for kind, user_id, drink_type, total in rows if kind == 'user'),
+            key=lambda row: (-row[1], row[0])
+        )
+        server = sorted(
+            ((drink_type, total) for kind, _, drink_type, total in rows if kind == 'server' and total),
+            key=lambda row: -row[1]
+        )
+        leaderboard = {
+            'ranking': ranking,
+            'server': server,
+            'ranks': {user_id: i for i, (user_id, _, _) in enumerate(ranking, 1)}
+        }
+        self.leaderboards[guild_id] = leaderboard
+        return leaderboard
     
     def get_top_drinkers(self, guild_id: int, limit: int = 10):
-        """Получить топ любителей выпить"""
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, SUM(amount) as total_amount
-            FROM drink_stats
-            WHERE guild_id = ?
-            GROUP BY user_id
-            ORDER BY total_amount DESC
-            LIMIT ?
-        ''', (guild_id, limit))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        return results
+        """Получить топ любителей выпить: [(user_id, всего)]"""
+        return [(user_id, total) for user_id, total, _ in self.get_leaderboard(guild_id)['ranking'][:limit]]
     
     def pluralize_liters(self, amount: int) -> str:
         """Склонение слова 'литр'"""
@@ -239,7 +292,8 @@ class DrinkGame(commands.Cog):
             await ctx.send("❌ Укажите число от 1 до 50")
             return
         
-        top_drinkers = self.get_top_drinkers(ctx.guild.id, limit)
+        leaderboard = self.get_leaderboard(ctx.guild.id)
+        top_drinkers = leaderboard['ranking'][:limit]
         
         if not top_drinkers:
             await ctx.send("📊 Пока никто ничего не пил!")
@@ -252,8 +306,9 @@ class DrinkGame(commands.Cog):
             timestamp=datetime.utcnow()
         )
         
+        drink_emoji = {"чай": "🍵", "пиво": "🍺", "виски": "🥃"}
         top_text = []
-        for i, (user_id, total_amount) in enumerate(top_drinkers, 1):
+        for i, (user_id, total_amount, favorite_drink) in enumerate(top_drinkers, 1):
             member = ctx.guild.get_member(user_id)
             
             if member:
@@ -269,30 +324,9 @@ class DrinkGame(commands.Cog):
                 
                 liters = self.pluralize_liters(total_amount)
                 
-                # Получаем детальную статистику
-                import sqlite3
-                conn = sqlite3.connect(self.db.db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT drink_type, SUM(amount) as total
-                    FROM drink_stats
-                    WHERE guild_id = ? AND user_id = ?
-                    GROUP BY drink_type
-                    ORDER BY total DESC
-                ''', (ctx.guild.id, user_id))
-                
-                drinks = cursor.fetchall()
-                conn.close()
-                
-                # Формируем строку с любимым напитком
-                if drinks:
-                    favorite_drink = drinks[0][0]
-                    drink_emoji = {"чай": "🍵", "пиво": "🍺", "виски": "🥃"}
-                    favorite_emoji = drink_emoji.get(favorite_drink, "🍷")
-                    top_text.append(f"{medal} **{member.display_name}**: {total_amount} {liters} {favorite_emoji}")
-                else:
-                    top_text.append(f"{medal} **{member.display_name}**: {total_amount} {liters}")
+                # Строка с любимым напитком
+                favorite_emoji = drink_emoji.get(favorite_drink, "🍷")
+                top_text.append(f"{medal} **{member.display_name}**: {total_amount} {liters} {favorite_emoji}")
         
         embed.add_field(
             name="📋 Рейтинг",
@@ -301,23 +335,9 @@ class DrinkGame(commands.Cog):
         )
         
         # Общая статистика сервера
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT drink_type, SUM(amount) as total
-            FROM drink_stats
-            WHERE guild_id = ?
-            GROUP BY drink_type
-            ORDER BY total DESC
-        ''', (ctx.guild.id,))
-        
-        server_drinks = cursor.fetchall()
-        conn.close()
+        server_drinks = leaderboard['server']
         
         if server_drinks:
-            drink_emoji = {"чай": "🍵", "пиво": "🍺", "виски": "🥃"}
             server_stats = []
             total_server = 0
             
@@ -401,17 +421,13 @@ class DrinkGame(commands.Cog):
         )
         
         # Место в рейтинге
-        top_drinkers = self.get_top_drinkers(ctx.guild.id, 1000)
-        user_rank = None
-        for i, (user_id, _) in enumerate(top_drinkers, 1):
-            if user_id == target.id:
-                user_rank = i
-                break
+        leaderboard = self.get_leaderboard(ctx.guild.id)
+        user_rank = leaderboard['ranks'].get(target.id)
         
         if user_rank:
             embed.add_field(
                 name="🏆 Место в рейтинге",
-                value=f"**#{user_rank}** из {len(top_drinkers)}",
+                value=f"**#{user_rank}** из {len(leaderboard['ranking'])}",
                 inline=True
             )
         
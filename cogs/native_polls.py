@@ -1,8 +1,10 @@
 import discord
 from discord.ext import commands
 from datetime import datetime
-import io
 from utils import is_admin_or_whitelisted
+from exports import voter_activity, write_poll_xlsx_tempfile
+from export_service import ExportTooLarge, ExportProgress
+from poll_voters import PollVoterCrawler
 
 
 class NativePollSystem(commands.Cog):
@@ -11,6 +13,8 @@ class NativePollSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = bot.db
+        # Загрузка голосов с контрольными точками (повторный экспорт продолжает с места ошибки)
+        self.voter_crawler = PollVoterCrawler(self.db.db_path)
 
     @commands.command(name='gb_poll_export_detailed')
     @is_admin_or_whitelisted()
@@ -79,167 +83,73 @@ class NativePollSystem(commands.Cog):
         # Собираем голоса напрямую из Discord API
         status_msg = await ctx.send("⏳ Загружаю данные о голосах из Discord...")
 
-        votes_by_answer = {}  # {answer_id: [members]}
-        all_voters = set()
+        progress = ExportProgress(status_msg, "⏳ Загружаю голоса из Discord")
+        progress.start()
+        try:
+            voters_by_answer, failed = await self.voter_crawler.crawl(msg_id, poll, progress=progress.report)
+        finally:
+            await progress.stop()
 
-        for answer in poll.answers:
-            try:
-                voters = []
-                async for voter in answer.voters():
-                    voters.append(voter)
-                    all_voters.add(voter.id)
-                votes_by_answer[answer.id] = voters
-            except Exception as e:
-                print(f"Error fetching voters for answer {answer.id}: {e}")
-                votes_by_answer[answer.id] = []
+        if failed:
+            await status_msg.delete()
+            await ctx.send(
+                f"⚠️ Не удалось загрузить голоса для {len(failed)} из {len(poll.answers)} вариантов ответа. "
+                f"Повторите команду - загрузка продолжится с места остановки.",
+                delete_after=30
+            )
+            return
 
-        total_votes = sum(len(v) for v in votes_by_answer.values())
+        all_voters = {user_id for voters in voters_by_answer.values() for user_id, _ in voters}
+        total_votes = sum(len(v) for v in voters_by_answer.values())
 
         if total_votes == 0:
             await status_msg.delete()
             await ctx.send("❌ В опросе нет голосов", delete_after=10)
             return
 
-        # Получаем статистику активности для всех проголосовавших
-        await status_msg.edit(content="⏳ Загружаю статистику активности...")
-
-        user_stats = {}
-        for user_id in all_voters:
-            stats = self.db.get_user_stats(ctx.guild.id, user_id, days)
-            if stats:
-                user_stats[user_id] = {
-                    'messages': stats['period_messages'],
-                    'voice_time': stats['period_voice_time']
-                }
-            else:
-                user_stats[user_id] = {'messages': 0, 'voice_time': 0}
-
-        # Сортируем по времени в войсе
-        sorted_votes_by_answer = {}
-        for answer_id, voters in votes_by_answer.items():
-            sorted_voters = sorted(
-                voters,
-                key=lambda m: user_stats.get(m.id, {}).get('voice_time', 0),
-                reverse=True
-            )
-            sorted_votes_by_answer[answer_id] = sorted_voters
-
-        await status_msg.edit(content="⏳ Создаю Excel файл...")
+        # Статистика активности и Excel файл - в пуле экспорта (один проход по статистике
+        # сервера вместо запроса на каждого проголосовавшего, openpyxl write-only)
+        await status_msg.edit(content="⏳ Загружаю статистику активности и создаю Excel файл...")
+
+        answers = [(answer.id, answer.text) for answer in poll.answers]
+        header = [
+            ('Message ID:', msg_id),
+            ('Question:', str(poll.question)),
+            ('Period:', f'{days} days'),
+            (None, None),
+            ('Total Votes:', total_votes),
+        ]
+
+        def build_workbook(progress=None):
+            activity = voter_activity(self.db.db_path, ctx.guild.id, all_voters, days)
+
+            # Сортируем по времени в войсе
+            sorted_votes = {
+                answer_id: sorted(voters, key=lambda v: activity[v[0]]['voice_time'], reverse=True)
+                for answer_id, voters in voters_by_answer.items()
+            }
+            return write_poll_xlsx_tempfile(header, answers, sorted_votes, activity, progress=progress)
 
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Poll Results Detailed"
-
-            # Заголовок
-            ws['A1'] = 'Discord Poll Export (Fetched from Discord)'
-            ws['A1'].font = Font(bold=True, size=14)
-
-            ws['A2'] = 'Message ID:'
-            ws['B2'] = msg_id
-            ws['A3'] = 'Question:'
-            ws['B3'] = str(poll.question)
-            ws['A4'] = 'Period:'
-            ws['B4'] = f'{days} days'
-
-            ws['A6'] = 'Total Votes:'
-            ws['B6'] = total_votes
-
-            # Статистика по вариантам
-            ws['A8'] = 'Option'
-            ws['B8'] = 'Votes'
-            ws['C8'] = 'Percentage'
-            ws['A8'].font = Font(bold=True)
-            ws['B8'].font = Font(bold=True)
-            ws['C8'].font = Font(bold=True)
-
-            row = 9
-            for answer in poll.answers:
-                count = len(votes_by_answer.get(answer.id, []))
-                percentage = (count / total_votes * 100) if total_votes > 0 else 0
-                ws[f'A{row}'] = answer.text
-                ws[f'B{row}'] = count
-                ws[f'C{row}'] = f"{percentage:.1f}%"
-                row += 1
-
-            # Пустая строка
-            row += 1
-
-            # Заголовки вариантов
-            start_col = 1  # Колонка B
-            header_row = row
-
-            yellow_fill = PatternFill(start_color='FFD966', end_color='FFD966', fill_type='solid')
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
+            excel_file = await self.bot.export_service.run(
+                ctx.guild.id, build_workbook, status=status_msg, label="⏳ Создаю Excel файл"
             )
-
-            for i, answer in enumerate(poll.answers):
-                col_letter = chr(ord('A') + start_col + i)
-                cell = ws[f'{col_letter}{header_row}']
-
-                cell.value = answer.text
-                cell.fill = yellow_fill
-                cell.font = Font(bold=True, size=11)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = thin_border
-
-                ws.column_dimensions[col_letter].width = 35
-
-            # Заполняем данные с статистикой
-            max_votes = max([len(sorted_votes_by_answer.get(answer.id, [])) for answer in poll.answers], default=0)
-
-            for row_index in range(max_votes):
-                data_row = header_row + 1 + row_index
-
-                for i, answer in enumerate(poll.answers):
-                    voters = sorted_votes_by_answer.get(answer.id, [])
-                    col_letter = chr(ord('A') + start_col + i)
-
-                    if row_index < len(voters):
-                        member = voters[row_index]
-                        user_id = member.id
-
-                        cell = ws[f'{col_letter}{data_row}']
-
-                        username = member.display_name
-                        profile_link = f"https://discord.com/users/{user_id}"
-
-                        stats = user_stats.get(user_id, {'messages': 0, 'voice_time': 0})
-                        messages = stats['messages']
-                        voice_hours = int(stats['voice_time'] // 3600)
-                        voice_minutes = int((stats['voice_time'] % 3600) // 60)
-
-                        cell_value = f"{username} | {messages} msg | {voice_hours}h {voice_minutes}m"
-
-                        cell.value = cell_value
-                        cell.hyperlink = profile_link
-                        cell.font = Font(color='0563C1', underline='single')
-                        cell.alignment = Alignment(vertical='center')
-                        cell.border = thin_border
-
-            # Сохраняем
-            excel_file = io.BytesIO()
-            wb.save(excel_file)
-            excel_file.seek(0)
-
-            file = discord.File(
-                excel_file,
-                filename=f'poll_{msg_id}_fetched_{days}d.xlsx'
+            file = await self.bot.export_service.to_discord_file(
+                excel_file, f'poll_{msg_id}_fetched_{days}d.xlsx', ctx.guild.filesize_limit
             )
 
             await status_msg.delete()
-            await ctx.send(f"📊 Экспорт из Discord ({days}д, {total_votes} голосов)", file=file)
+            try:
+                await ctx.send(f"📊 Экспорт из Discord ({days}д, {total_votes} голосов)", file=file)
+            finally:
+                file.close()
 
         except ImportError:
             await status_msg.delete()
             await ctx.send("❌ Требуется установить openpyxl: `pip install openpyxl`", delete_after=10)
+        except ExportTooLarge as e:
+            await status_msg.delete()
+            await ctx.send(f"❌ Файл экспорта слишком большой для загрузки в Discord ({e})", delete_after=10)
         except Exception as e:
             await status_msg.delete()
             await ctx.send(f"❌ Ошибка: {e}", delete_after=10)
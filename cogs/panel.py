@@ -1,10 +1,72 @@
 import discord
 from discord.ext import commands
 from datetime import datetime
+from exports import iter_stats_rows, iter_export_records, member_snapshot, write_csv_tempfile
+from activity_hours import RING_DAYS, peak_hours, render_heatmap
+from reports import InactiveReportView, summary_embed
+from export_service import ExportTooLarge, edit_status
+import config
 import io
 import csv
 from io import StringIO
 
+
+def member_not_found_message(user_input: str, candidates: list) -> str:
+    """Ответ модального окна, если ввод не указывает однозначно на участника"""
+    if candidates:
+        options = "\n".join(f"• {m.mention} - `{m.name}` (`{m.id}`)" for m in candidates)
+        return (
+            f"❓ По запросу `{user_input}` найдено несколько участников:\n{options}\n\n"
+            f"💡 Уточните имя или используйте ID / упоминание"
+        )
+    return (
+        f"❌ Пользователь `{user_input}` не найден на сервере\n\n"
+        f"💡 **Подсказка:**\n"
+        f"• Используйте ID: `123456789`\n"
+        f"• Или упоминание: скопируйте упоминание\n"
+        f"• Или точное имя: `username` или `@username`"
+    )
+
+
+def panel_embed(bot, interaction: discord.Interaction) -> discord.Embed:
+    """Главная страница панели с брендингом сервера (настройки из кэша БД)"""
+    settings = bot.db.get_guild_settings(interaction.guild.id)
+    primary_color = int(settings['primary_color'].lstrip('#'), 16)
+
+    embed = discord.Embed(
+        title=f"🎛️ {settings['panel_title']}",
+        description=settings['welcome_message'],
+        color=primary_color,
+        timestamp=datetime.utcnow()
+    )
+    
+    embed.add_field(
+        name="📈 Stats",
+        value="Статистика пользователей и активности",
+        inline=True
+    )
+    
+    embed.add_field(
+        name="👥 Whitelist",
+        value="Управление whitelist пользователями",
+        inline=True
+    )
+    
+    embed.add_field(
+        name="⚠️ Warnings",
+        value="Система выговоров и модерация",
+        inline=True
+    )
+    
+    # Используем кастомный footer или дефолтный с именем пользователя
+    # Локальные пути (/uploads/...) не работают в Discord embeds - нужен полный URL
+    logo_url = settings.get('logo_url')
+    if not logo_url or logo_url.startswith('/'):
+        logo_url = interaction.user.avatar.url if interaction.user.avatar else None
+    embed.set_footer(text=settings['footer_text'], icon_url=logo_url)
+    return embed
+
+
 class StatsSelectMenu(discord.ui.Select):
     """Dropdown меню для выбора периода статистики"""
     def __init__(self, bot, user_id):
@@ -206,90 +268,78 @@ class ExportModal(discord.ui.Modal, title="📤 Экспорт статисти
             await interaction.followup.send(f"📊 Экспорт статистики {member.mention}", file=file, ephemeral=True)
 
         elif self.export_type == "all":
-            # Экспорт всех пользователей
-            all_stats = self.bot.db.get_all_users_stats(interaction.guild.id, days)
-
-            if not all_stats:
-                await interaction.followup.send("📊 Нет данных о пользователях", ephemeral=True)
-                return
-
-            # Формируем CSV
-            output = StringIO()
-            writer = csv.writer(output)
-
+            # Экспорт всех пользователей - построчно из курсора БД во временный файл
             period_text = f"{days} days" if days else "all time"
+            export_date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
+            guild_name = interaction.guild.name
 
-            writer.writerow(['Server Statistics'])
-            writer.writerow(['Server:', interaction.guild.name])
-            writer.writerow(['Period:', period_text])
-            writer.writerow(['Total Users:', len(all_stats)])
-            writer.writerow(['Export Date:', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')])
-            writer.writerow([])
+            def voice_text(seconds):
+                return f"{int(seconds // 3600)}h {int((seconds % 3600) // 60)}m"
 
-            # Заголовок таблицы
+            def user_name(record):
+                return record['display_name'] if record['in_guild'] else f"User ID: {record['user_id']}"
+
+            # Колонки таблицы
             if days:
-                writer.writerow([
-                    'Rank',
-                    'User Name',
-                    'User ID',
-                    f'Messages ({period_text})',
-                    'Total Messages',
-                    f'Voice Time ({period_text})',
-                    'Total Voice Time'
-                ])
+                columns = [
+                    ('Rank', lambda r: r['rank']),
+                    ('User Name', user_name),
+                    ('User ID', lambda r: r['user_id']),
+                    (f'Messages ({period_text})', lambda r: r['period_messages']),
+                    ('Total Messages', lambda r: r['total_messages']),
+                    (f'Voice Time ({period_text})', lambda r: voice_text(r['period_voice_time'])),
+                    ('Total Voice Time', lambda r: voice_text(r['total_voice_time'])),
+                ]
             else:
-                writer.writerow([
-                    'Rank',
-                    'User Name',
-                    'User ID',
-                    'Total Messages',
-                    'Total Voice Time'
-                ])
+                columns = [
+                    ('Rank', lambda r: r['rank']),
+                    ('User Name', user_name),
+                    ('User ID', lambda r: r['user_id']),
+                    ('Total Messages', lambda r: r['total_messages']),
+                    ('Total Voice Time', lambda r: voice_text(r['total_voice_time'])),
+                ]
+
+            def preamble(count):
+                return [
+                    ['Server Statistics'],
+                    ['Server:', guild_name],
+                    ['Period:', period_text],
+                    ['Total Users:', count],
+                    ['Export Date:', export_date],
+                    [],
+                ]
 
             # Сортируем по сообщениям
-            sorted_stats = sorted(all_stats, key=lambda x: x['period_messages'], reverse=True)
-
-            # Записываем данные
-            for i, user_data in enumerate(sorted_stats, 1):
-                member = interaction.guild.get_member(user_data['user_id'])
-                user_name = member.display_name if member else f"User ID: {user_data['user_id']}"
-
-                if days:
-                    period_hours = int(user_data['period_voice_time'] // 3600)
-                    period_minutes = int((user_data['period_voice_time'] % 3600) // 60)
-                    total_hours = int(user_data['total_voice_time'] // 3600)
-                    total_minutes = int((user_data['total_voice_time'] % 3600) // 60)
-
-                    writer.writerow([
-                        i,
-                        user_name,
-                        user_data['user_id'],
-                        user_data['period_messages'],
-                        user_data['total_messages'],
-                        f"{period_hours}h {period_minutes}m",
-                        f"{total_hours}h {total_minutes}m"
-                    ])
-                else:
-                    hours = int(user_data['total_voice_time'] // 3600)
-                    minutes = int((user_data['total_voice_time'] % 3600) // 60)
-
-                    writer.writerow([
-                        i,
-                        user_name,
-                        user_data['user_id'],
-                        user_data['total_messages'],
-                        f"{hours}h {minutes}m"
-                    ])
+            members = member_snapshot(interaction.guild)
+            rows = iter_stats_rows(self.bot.db.db_path, interaction.guild.id, days=days, sort_by='messages')
+            records = iter_export_records(rows, members)
+
+            # Генерация в пуле экспорта, прогресс - в статус-сообщении
+            status_msg = await interaction.followup.send("⏳ Готовлю экспорт статистики...", ephemeral=True, wait=True)
+            csv_file, count = await self.bot.export_service.run(
+                interaction.guild.id, write_csv_tempfile, records,
+                columns=columns, preamble_fn=preamble, status=status_msg, label="⏳ Экспорт статистики"
+            )
 
-            csv_data = output.getvalue()
+            if count == 0:
+                csv_file.close()
+                await edit_status(status_msg, "📊 Нет данных о пользователях")
+                return
 
-            # Создаем файл
-            file = discord.File(
-                io.BytesIO(csv_data.encode('utf-8-sig')),
-                filename=f'server_stats_{interaction.guild.name}_{period_text}.csv'
-            )
+            # Создаем файл (больше лимита загрузки сервера - в zip)
+            try:
+                file = await self.bot.export_service.to_discord_file(
+                    csv_file, f'server_stats_{guild_name}_{period_text}.csv', interaction.guild.filesize_limit
+                )
+            except ExportTooLarge as e:
+                await edit_status(status_msg, f"❌ Файл экспорта слишком большой для загрузки в Discord ({e})")
+                return
 
-            await interaction.followup.send(f"📊 Экспорт статистики сервера ({len(all_stats)} пользователей)", file=file, ephemeral=True)
+            try:
+                await interaction.followup.send(f"📊 Экспорт статистики сервера ({count} пользователей)", file=file, ephemeral=True)
+                await edit_status(status_msg, "✅ Экспорт готов")
+            finally:
+                file.close()
 
 
 class StatsView(discord.ui.View):
@@ -468,298 +518,48 @@ class StatsView(discord.ui.View):
         
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="😴 Неактивные", style=discord.ButtonStyle.gray, custom_id="inactive_users", row=3)
-    async def inactive_users(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Добавляем Select Menu для выбора периода
-        view = discord.ui.View(timeout=180)
-        
-        select = discord.ui.Select(
-            placeholder="Выберите период неактивности...",
-            options=[
-                discord.SelectOption(label="За 7 дней", emoji="📅", value="7"),
-                discord.SelectOption(label="За 14 дней", emoji="📆", value="14"),
-                discord.SelectOption(label="За 30 дней", emoji="🗓️", value="30"),
-            ]
-        )
-        
-        async def select_callback(inter: discord.Interaction):
-            days = int(select.values[0])
-            await inter.response.defer(ephemeral=True)
-            
-            # Получаем всех пользователей сервера (не ботов)
-            all_members = [m for m in inter.guild.members if not m.bot]
-            
-            # Получаем статистику активных пользователей
-            active_stats = self.bot.db.get_all_users_stats(inter.guild.id, days)
-            active_user_ids = {stat['user_id'] for stat in active_stats if stat['period_messages'] > 0 or stat['period_voice_time'] > 0}
-            
-            # Находим неактивных
-            inactive_members = [m for m in all_members if m.id not in active_user_ids]
-            
-            if not inactive_members:
-                await inter.followup.send(f"✅ Все пользователи были активны за последние {days} дней!", ephemeral=True)
-                return
-            
-            # Формируем embed
-            embed = discord.Embed(
-                title=f"😴 Неактивные пользователи",
-                description=f"Пользователи без активности за последние **{days} дней**",
-                color=0xE67E22,
-                timestamp=datetime.utcnow()
-            )
-            
-            # Список неактивных (максимум 25)
-            inactive_text = []
-            for i, member in enumerate(inactive_members[:25], 1):
-                top_role = member.top_role.name if member.top_role.name != "@everyone" else "Нет роли"
-                inactive_text.append(f"{i}. {member.mention} • `{top_role}`")
-            
-            if inactive_text:
-                if len(inactive_members) <= 25:
-                    embed.add_field(
-                        name=f"👥 Список ({len(inactive_members)} пользователей)",
-                        value="\n".join(inactive_text),
-                        inline=False
-                    )
-                else:
-                    embed.add_field(
-                        name=f"👥 Первые 25 из {len(inactive_members)}",
-                        value="\n".join(inactive_text),
-                        inline=False
-                    )
-            
-            # Статистика
-            total_members = len(all_members)
-            inactive_percent = (len(inactive_members) / total_members * 100) if total_members > 0 else 0
-            
-            embed.add_field(
-                name="📊 Статистика",
-                value=f"**Всего участников:** {total_members}\n**Неактивных:** {len(inactive_members)} ({inactive_percent:.1f}%)\n**Активных:** {len(active_user_ids)} ({100-inactive_percent:.1f}%)",
-                inline=False
-            )
-            
-            # Кнопка экспорта
-            export_view = discord.ui.View(timeout=60)
-            export_btn = discord.ui.Button(label="📤 Экспорт в CSV", style=discord.ButtonStyle.green)
-            
-            async def export_callback(export_inter: discord.Interaction):
-                await export_inter.response.defer(ephemeral=True)
-                
-                # Формируем CSV
-                from io import StringIO
-                import csv
-                
-                output = StringIO()
-                writer = csv.writer(output)
-                
-                writer.writerow(['Inactive Users Report'])
-                writer.writerow(['Server:', inter.guild.name])
-                writer.writerow(['Period:', f'{days} days'])
-                writer.writerow(['Total Members:', len(all_members)])
-                writer.writerow(['Inactive Members:', len(inactive_members)])
-                writer.writerow(['Report Date:', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')])
-                writer.writerow([])
-                
-                writer.writerow([
-                    'Rank',
-                    'Username',
-                    'Display Name',
-                    'User ID',
-                    'Top Role',
-                    'Joined Server',
-                    'Account Created'
-                ])
-                
-                for i, member in enumerate(inactive_members, 1):
-                    top_role = member.top_role.name if member.top_role.name != "@everyone" else "No Role"
-                    joined = member.joined_at.strftime('%Y-%m-%d') if member.joined_at else "Unknown"
-                    created = member.created_at.strftime('%Y-%m-%d')
-                    
-                    writer.writerow([
-                        i,
-                        member.name,
-                        member.display_name,
-                        member.id,
-                        top_role,
-                        joined,
-                        created
-                    ])
-                
-                csv_data = output.getvalue()
-                
-                # Создаем файл
-                import io
-                file = discord.File(
-                    io.BytesIO(csv_data.encode('utf-8-sig')),
-                    filename=f'inactive_users_{inter.guild.name}_{days}days.csv'
-                )
-                
-                await export_inter.followup.send(
-                    f"📊 Экспорт неактивных пользователей ({len(inactive_members)} пользователей за {days} дней)",
-                    file=file,
-                    ephemeral=True
-                )
-            
-            export_btn.callback = export_callback
-            export_view.add_item(export_btn)
-            
-            embed.set_footer(text="💡 Нажмите кнопку ниже для экспорта полного списка")
-            
-            await inter.followup.send(embed=embed, view=export_view, ephemeral=True)
-        
-        select.callback = select_callback
-        view.add_item(select)
-        
+    @discord.ui.button(label="🕒 Часы активности", style=discord.ButtonStyle.gray, custom_id="activity_hours", row=3)
+    async def activity_hours(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # Данные из кольцевых буферов в памяти - без запросов к БД
+        activity = self.bot.hourly_activity
+        tz_offset = config.ACTIVITY_TZ_OFFSET
+        messages = activity.weekday_hours(interaction.guild.id, 'messages', tz_offset)
+        voice = [[value / 3600 for value in row] for row in activity.weekday_hours(interaction.guild.id, 'voice', tz_offset)]
+
+        if not any(any(row) for row in messages) and not any(any(row) for row in voice):
+            await interaction.response.send_message("📊 Пока нет данных об активности по часам", ephemeral=True)
+            return
+
         embed = discord.Embed(
-            title="😴 Неактивные пользователи",
-            description="Выберите период для поиска неактивных пользователей:",
-            color=0xE67E22
+            title="🕒 Когда сервер онлайн",
+            description=f"Средняя активность по дням недели и часам за {RING_DAYS} дней (UTC{tz_offset:+d})",
+            color=0x3498DB,
+            timestamp=datetime.utcnow()
         )
-        
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
-    @discord.ui.button(label="📊 Сводка", style=discord.ButtonStyle.blurple, custom_id="activity_summary", row=3)
-    async def activity_summary(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Добавляем Select Menu для выбора периода
-        view = discord.ui.View(timeout=180)
-        
-        select = discord.ui.Select(
-            placeholder="Выберите период...",
-            options=[
-                discord.SelectOption(label="За 7 дней", emoji="📅", value="7"),
-                discord.SelectOption(label="За 14 дней", emoji="📆", value="14"),
-                discord.SelectOption(label="За 30 дней", emoji="🗓️", value="30"),
-            ]
-        )
-        
-        async def select_callback(inter: discord.Interaction):
-            days = int(select.values[0])
-            await inter.response.defer(ephemeral=True)
-            
-            # Получаем всех пользователей
-            all_members = [m for m in inter.guild.members if not m.bot]
-            
-            # Получаем статистику
-            all_stats = self.bot.db.get_all_users_stats(inter.guild.id, days)
-            
-            # Считаем активность
-            very_active = [s for s in all_stats if s['period_messages'] >= 100 or s['period_voice_time'] >= 3600*10]
-            active = [s for s in all_stats if (s['period_messages'] >= 20 or s['period_voice_time'] >= 3600*2) and s not in very_active]
-            low_active = [s for s in all_stats if (s['period_messages'] > 0 or s['period_voice_time'] > 0) and s not in very_active and s not in active]
-            
-            active_user_ids = {stat['user_id'] for stat in all_stats if stat['period_messages'] > 0 or stat['period_voice_time'] > 0}
-            inactive_members = [m for m in all_members if m.id not in active_user_ids]
-            
-            # Общая статистика
-            total_messages = sum(s['period_messages'] for s in all_stats)
-            total_voice_time = sum(s['period_voice_time'] for s in all_stats)
-            
-            # Формируем embed
-            embed = discord.Embed(
-                title=f"📊 Сводка активности сервера",
-                description=f"Анализ активности за последние **{days} дней**",
-                color=0x3498DB,
-                timestamp=datetime.utcnow()
-            )
-            
-            # Общие цифры
-            embed.add_field(
-                name="📈 Общая активность",
-                value=f"**Сообщений:** {total_messages:,}\n**Время в войсе:** {int(total_voice_time // 3600)}ч {int((total_voice_time % 3600) // 60)}м",
-                inline=True
-            )
-            
-            embed.add_field(
-                name="👥 Участники",
-                value=f"**Всего:** {len(all_members)}\n**Активных:** {len(active_user_ids)}",
-                inline=True
-            )
-            
-            # Пустое поле для выравнивания
-            embed.add_field(name="\u200b", value="\u200b", inline=True)
-            
-            # Разбивка по уровням активности
-            embed.add_field(
-                name="🎯 Уровни активности",
-                value=f"🔥 **Очень активные:** {len(very_active)}\n⚡ **Активные:** {len(active)}\n💬 **Низкая активность:** {len(low_active)}\n😴 **Неактивные:** {len(inactive_members)}",
-                inline=False
-            )
-            
-            # Процентное соотношение
-            total = len(all_members)
-            if total > 0:
-                very_active_pct = len(very_active) / total * 100
-                active_pct = len(active) / total * 100
-                low_active_pct = len(low_active) / total * 100
-                inactive_pct = len(inactive_members) / total * 100
-                
-                # Визуальная диаграмма
-                bar_length = 20
-                very_bar = int(very_active_pct / 100 * bar_length)
-                active_bar = int(active_pct / 100 * bar_length)
-                low_bar = int(low_active_pct / 100 * bar_length)
-                inactive_bar = bar_length - very_bar - active_bar - low_bar
-                
-                visual = f"🔥 `{'█' * very_bar}{'░' * (bar_length - very_bar)}` {very_active_pct:.1f}%\n"
-                visual += f"⚡ `{'█' * active_bar}{'░' * (bar_length - active_bar)}` {active_pct:.1f}%\n"
-                visual += f"💬 `{'█' * low_bar}{'░' * (bar_length - low_bar)}` {low_active_pct:.1f}%\n"
-                visual += f"😴 `{'█' * inactive_bar}{'░' * (bar_length - inactive_bar)}` {inactive_pct:.1f}%"
-                
-                embed.add_field(
-                    name="📊 Распределение активности",
-                    value=visual,
-                    inline=False
-                )
-            
-            # Топ-3 самых активных
-            if all_stats:
-                top_messages = sorted(all_stats, key=lambda x: x['period_messages'], reverse=True)[:3]
-                top_text = []
-                for i, user_data in enumerate(top_messages, 1):
-                    member = inter.guild.get_member(user_data['user_id'])
-                    if member:
-                        emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
-                        top_text.append(f"{emoji} {member.mention}: {user_data['period_messages']} сообщений")
-                
-                if top_text:
-                    embed.add_field(
-                        name="🏆 Топ-3 по сообщениям",
-                        value="\n".join(top_text),
-                        inline=False
-                    )
-            
-            embed.set_footer(text=f"💡 Критерии: Очень активные (100+ сообщений или 10+ часов), Активные (20+ сообщений или 2+ часов)")
-            
-            await inter.followup.send(embed=embed, ephemeral=True)
-        
-        select.callback = select_callback
-        view.add_item(select)
-        
-        embed = discord.Embed(
-            title="📊 Сводка активности",
-            description="Выберите период для анализа активности сервера:",
-            color=0x3498DB
+        embed.add_field(name="💬 Сообщения", value=f"```\n{render_heatmap(messages)}\n```", inline=False)
+        embed.add_field(name="🎤 Участники в войсе", value=f"```\n{render_heatmap(voice)}\n```", inline=False)
+
+        peak_messages = peak_hours(messages)
+        peak_voice = peak_hours(voice)
+        embed.add_field(
+            name="🔥 Пиковые часы",
+            value=(
+                f"💬 {', '.join(f'{hour:02d}:00' for hour, _ in peak_messages) or '—'}\n"
+                f"🎤 {', '.join(f'{hour:02d}:00' for hour, _ in peak_voice) or '—'}"
+            ),
+            inline=False
         )
-        
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        embed.set_footer(text="Чем выше столбик, тем больше активность")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @discord.ui.button(label="🔙 Назад", style=discord.ButtonStyle.red, custom_id="back_to_main")
     async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Возвращаемся к главной панели с кастомными настройками
-        settings = self.get_settings(interaction.guild.id)
-        primary_color = int(settings['primary_color'].lstrip('#'), 16)
-
-        embed = discord.Embed(
-            title=f"🎛️ {settings['panel_title']}",
-            description=settings['welcome_message'],
-            color=primary_color,
-            timestamp=datetime.utcnow()
+        await interaction.response.edit_message(
+            embed=panel_embed(self.bot, interaction), view=self.bot.panel_views['main']
         )
-        logo_url = settings.get('logo_url') or (self.bot.user.avatar.url if self.bot.user.avatar else None)
-        embed.set_thumbnail(url=self.bot.user.avatar.url if self.bot.user.avatar else None)
-        embed.set_footer(text=settings['footer_text'], icon_url=logo_url)
-
-        await interaction.response.edit_message(embed=embed, view=PanelView(self.bot, interaction.guild.id))
 
     @discord.ui.button(label="😴 Неактивные", style=discord.ButtonStyle.gray, custom_id="inactive_users", row=3)
     async def inactive_users(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -789,25 +589,11 @@ class StatsView(discord.ui.View):
 
 
 class PanelView(discord.ui.View):
-    """Главная панель управления"""
+    """Главная панель управления (постоянная: регистрируется один раз в Panel.cog_load)"""
 
-    def __init__(self, bot, guild_id: int = None):
-        super().__init__(timeout=180)
+    def __init__(self, bot):
+        super().__init__(timeout=None)
         self.bot = bot
-        self.guild_id = guild_id
-
-    def get_settings(self, guild_id: int = None) -> dict:
-        """Получить настройки сервера"""
-        gid = guild_id or self.guild_id
-        if gid:
-            return self.bot.db.get_guild_settings(gid)
-        return {
-            'panel_title': 'GuildBrew Control Panel',
-            'welcome_message': 'Добро пожаловать в панель управления!\nВыберите нужный раздел, нажав на кнопку ниже.',
-            'primary_color': '#5865F2',
-            'footer_text': 'GuildBrew • Панель управления',
-            'logo_url': None
-        }
     
     @discord.ui.button(label="📈 Stats", style=discord.ButtonStyle.blurple, custom_id="stats_panel", row=0)
     async def stats(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -850,7 +636,7 @@ class PanelView(discord.ui.View):
         
         embed.set_footer(text=f"Запросил: {interaction.user.name}", icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
         
-        await interaction.response.edit_message(embed=embed, view=StatsView(self.bot))
+        await interaction.response.edit_message(embed=embed, view=self.bot.panel_views['stats'])
     
     @discord.ui.button(label="👥 Whitelist", style=discord.ButtonStyle.green, custom_id="whitelist_panel", row=0)
     async def whitelist(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -889,7 +675,7 @@ class PanelView(discord.ui.View):
         
         embed.set_footer(text=f"Запросил: {interaction.user.name}", icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
         
-        await interaction.response.edit_message(embed=embed, view=WhitelistView(self.bot))
+        await interaction.response.edit_message(embed=embed, view=self.bot.panel_views['whitelist'])
     
     @discord.ui.button(label="⚠️ Warnings", style=discord.ButtonStyle.red, custom_id="warnings_panel", row=0)
     async def warnings(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -953,13 +739,13 @@ class PanelView(discord.ui.View):
         
         embed.set_footer(text=f"Запросил: {interaction.user.name}", icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
         
-        await interaction.response.edit_message(embed=embed, view=WarningsView(self.bot))
+        await interaction.response.edit_message(embed=embed, view=self.bot.panel_views['warnings'])
 
 class WhitelistView(discord.ui.View):
-    """Меню управления whitelist"""
+    """Меню управления whitelist (постоянное)"""
     
     def __init__(self, bot):
-        super().__init__(timeout=180)
+        super().__init__(timeout=None)
         self.bot = bot
     
     @discord.ui.button(label="➕ Добавить", style=discord.ButtonStyle.green, custom_id="whitelist_add", row=0)
@@ -1020,46 +806,10 @@ class WhitelistView(discord.ui.View):
     
     @discord.ui.button(label="🔙 Назад", style=discord.ButtonStyle.gray, custom_id="back_to_main_from_whitelist", row=1)
     async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Получаем кастомные настройки сервера
-        settings = self.bot.db.get_guild_settings(interaction.guild.id)
-        primary_color = int(settings['primary_color'].lstrip('#'), 16)
-
-        embed = discord.Embed(
-            title=f"🎛️ {settings['panel_title']}",
-            description=settings['welcome_message'],
-            color=primary_color,
-            timestamp=datetime.utcnow()
-        )
-
-        embed.add_field(
-            name="📈 Stats",
-            value="Статистика пользователей и активности",
-            inline=True
-        )
-
-        embed.add_field(
-            name="👥 Whitelist",
-            value="Управление whitelist пользователями",
-            inline=True
+        await interaction.response.edit_message(
+            embed=panel_embed(self.bot, interaction), view=self.bot.panel_views['main']
         )
 
-        embed.add_field(
-            name="📊 Polls",
-            value="Создание и управление опросами",
-            inline=True
-        )
-
-        embed.add_field(
-            name="⚠️ Warnings",
-            value="Система выговоров и модерация",
-            inline=True
-        )
-
-        logo_url = settings.get('logo_url') or (interaction.user.avatar.url if interaction.user.avatar else None)
-        embed.set_footer(text=settings['footer_text'], icon_url=logo_url)
-
-        await interaction.response.edit_message(embed=embed, view=PanelView(self.bot, interaction.guild.id))
-
 
 class WhitelistAddModal(discord.ui.Modal, title="➕ Добавить в whitelist"):
     """Модальное окно для добавления в whitelist"""
@@ -1076,61 +826,13 @@ class WhitelistAddModal(discord.ui.Modal, title="➕ Добавить в whiteli
     )
     
     async def on_submit(self, interaction: discord.Interaction):
-        # Парсим ID пользователя
+        # Ищем пользователя: ID, упоминание или имя (индекс имён, без перебора участников)
         user_input = self.user_id.value.strip()
+        user_id, member, candidates = self.bot.member_resolver.resolve(interaction.guild, user_input)
         
-        member = None
-        
-        # Вариант 1: Упоминание <@123456789> или <@!123456789>
-        if user_input.startswith('<@') and user_input.endswith('>'):
-            user_input = user_input[2:-1]
-            if user_input.startswith('!'):
-                user_input = user_input[1:]
-            
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 2: Просто ID
-        if not member:
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 3: Имя пользователя (@username или username)
-        if not member:
-            # Убираем @ если есть
-            search_name = user_input.lstrip('@')
-            
-            # Ищем по точному совпадению имени
-            member = discord.utils.get(interaction.guild.members, name=search_name)
-            
-            # Если не нашли, ищем по display_name
-            if not member:
-                member = discord.utils.get(interaction.guild.members, display_name=search_name)
-            
-            # Если не нашли, ищем по началу имени (case-insensitive)
-            if not member:
-                search_name_lower = search_name.lower()
-                for m in interaction.guild.members:
-                    if m.name.lower().startswith(search_name_lower) or m.display_name.lower().startswith(search_name_lower):
-                        member = m
-                        break
-        
-        # Если пользователь не найден
+        # Если пользователь не найден или найдено несколько
         if not member:
-            await interaction.response.send_message(
-                f"❌ Пользователь `{user_input}` не найден на сервере\n\n"
-                f"💡 **Подсказка:**\n"
-                f"• Используйте ID: `123456789`\n"
-                f"• Или упоминание: скопируйте упоминание\n"
-                f"• Или точное имя: `username` или `@username`",
-                ephemeral=True
-            )
+            await interaction.response.send_message(member_not_found_message(user_input, candidates), ephemeral=True)
             return
         
         # Добавляем в whitelist
@@ -1174,65 +876,13 @@ class WhitelistRemoveModal(discord.ui.Modal, title="➖ Удалить из whit
     )
     
     async def on_submit(self, interaction: discord.Interaction):
-        # Парсим ID пользователя
+        # Ищем пользователя: ID, упоминание или имя (индекс имён, без перебора участников)
         user_input = self.user_id.value.strip()
+        user_id, member, candidates = self.bot.member_resolver.resolve(interaction.guild, user_input)
         
-        member = None
-        user_id = None
-        
-        # Вариант 1: Упоминание <@123456789> или <@!123456789>
-        if user_input.startswith('<@') and user_input.endswith('>'):
-            id_str = user_input[2:-1]
-            if id_str.startswith('!'):
-                id_str = id_str[1:]
-            
-            try:
-                user_id = int(id_str)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 2: Просто ID
+        # Если пользователь не найден или найдено несколько
         if not user_id:
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 3: Имя пользователя (@username или username)
-        if not user_id:
-            # Убираем @ если есть
-            search_name = user_input.lstrip('@')
-            
-            # Ищем по точному совпадению имени
-            member = discord.utils.get(interaction.guild.members, name=search_name)
-            
-            # Если не нашли, ищем по display_name
-            if not member:
-                member = discord.utils.get(interaction.guild.members, display_name=search_name)
-            
-            # Если не нашли, ищем по началу имени (case-insensitive)
-            if not member:
-                search_name_lower = search_name.lower()
-                for m in interaction.guild.members:
-                    if m.name.lower().startswith(search_name_lower) or m.display_name.lower().startswith(search_name_lower):
-                        member = m
-                        break
-            
-            if member:
-                user_id = member.id
-        
-        # Если пользователь не найден
-        if not user_id:
-            await interaction.response.send_message(
-                f"❌ Пользователь `{user_input}` не найден на сервере\n\n"
-                f"💡 **Подсказка:**\n"
-                f"• Используйте ID: `123456789`\n"
-                f"• Или упоминание: скопируйте упоминание\n"
-                f"• Или точное имя: `username` или `@username`",
-                ephemeral=True
-            )
+            await interaction.response.send_message(member_not_found_message(user_input, candidates), ephemeral=True)
             return
         
         member_name = member.mention if member else f"ID:{user_id}"
@@ -1280,141 +930,17 @@ class InactiveUsersView(discord.ui.View):
     async def show_inactive(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
         
-        # Получаем всех пользователей сервера (не ботов)
-        all_members = [m for m in self.guild.members if not m.bot]
+        # Отчёт из кэша (повторные клики и экспорт не пересчитывают его)
+        report = await self.bot.report_cache.get(self.guild, self.selected_days, self.selected_role)
         
-        # Фильтруем по роли если указана
-        if self.selected_role:
-            all_members = [m for m in all_members if self.selected_role in m.roles]
-        
-        # Получаем статистику активных пользователей
-        active_stats = self.bot.db.get_all_users_stats(self.guild.id, self.selected_days)
-        active_user_ids = {stat['user_id'] for stat in active_stats if stat['period_messages'] > 0 or stat['period_voice_time'] > 0}
-        
-        # Находим неактивных
-        inactive_members = [m for m in all_members if m.id not in active_user_ids]
-        
-        if not inactive_members:
+        if not report.inactive_ids:
             role_text = f" с ролью {self.selected_role.mention}" if self.selected_role else ""
             await interaction.followup.send(f"✅ Все пользователи{role_text} были активны за последние {self.selected_days} дней!", ephemeral=True)
             return
         
-        # Формируем embed
-        title_suffix = f" (роль: {self.selected_role.name})" if self.selected_role else ""
-        embed = discord.Embed(
-            title=f"😴 Неактивные пользователи{title_suffix}",
-            description=f"Пользователи без активности за последние **{self.selected_days} дней**",
-            color=0xE67E22,
-            timestamp=datetime.utcnow()
-        )
-        
-        # Список неактивных (максимум 25)
-        inactive_text = []
-        for i, member in enumerate(inactive_members[:25], 1):
-            top_role = member.top_role.name if member.top_role.name != "@everyone" else "Нет роли"
-            inactive_text.append(f"{i}. {member.mention} • `{top_role}`")
-        
-        if inactive_text:
-            if len(inactive_members) <= 25:
-                embed.add_field(
-                    name=f"👥 Список ({len(inactive_members)} пользователей)",
-                    value="\n".join(inactive_text),
-                    inline=False
-                )
-            else:
-                embed.add_field(
-                    name=f"👥 Первые 25 из {len(inactive_members)}",
-                    value="\n".join(inactive_text),
-                    inline=False
-                )
-        
-        # Статистика
-        total_members = len(all_members)
-        inactive_percent = (len(inactive_members) / total_members * 100) if total_members > 0 else 0
-        
-        embed.add_field(
-            name="📊 Статистика",
-            value=f"**Всего участников:** {total_members}\n**Неактивных:** {len(inactive_members)} ({inactive_percent:.1f}%)\n**Активных:** {len(active_user_ids)} ({100-inactive_percent:.1f}%)",
-            inline=False
-        )
-        
-        # Кнопка экспорта
-        export_view = discord.ui.View(timeout=60)
-        export_btn = discord.ui.Button(label="📤 Экспорт в CSV", style=discord.ButtonStyle.green)
-        
-        async def export_callback(export_inter: discord.Interaction):
-            await export_inter.response.defer(ephemeral=True)
-            
-            # Формируем CSV
-            from io import StringIO
-            import csv
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            writer.writerow(['Inactive Users Report'])
-            writer.writerow(['Server:', self.guild.name])
-            writer.writerow(['Period:', f'{self.selected_days} days'])
-            if self.selected_role:
-                writer.writerow(['Filtered by role:', self.selected_role.name])
-            writer.writerow(['Total Members:', len(all_members)])
-            writer.writerow(['Inactive Members:', len(inactive_members)])
-            writer.writerow(['Report Date:', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')])
-            writer.writerow([])
-            
-            writer.writerow([
-                'Rank',
-                'Username',
-                'Display Name',
-                'User ID',
-                'Top Role',
-                'All Roles',
-                'Joined Server',
-                'Account Created'
-            ])
-            
-            for i, member in enumerate(inactive_members, 1):
-                top_role = member.top_role.name if member.top_role.name != "@everyone" else "No Role"
-                all_roles = ", ".join([r.name for r in member.roles if r.name != "@everyone"])
-                if not all_roles:
-                    all_roles = "No Roles"
-                joined = member.joined_at.strftime('%Y-%m-%d') if member.joined_at else "Unknown"
-                created = member.created_at.strftime('%Y-%m-%d')
-                
-                writer.writerow([
-                    i,
-                    member.name,
-                    member.display_name,
-                    member.id,
-                    top_role,
-                    all_roles,
-                    joined,
-                    created
-                ])
-            
-            csv_data = output.getvalue()
-            
-            # Создаем файл
-            import io
-            role_suffix = f"_role_{self.selected_role.name}" if self.selected_role else ""
-            file = discord.File(
-                io.BytesIO(csv_data.encode('utf-8-sig')),
-                filename=f'inactive_users_{self.guild.name}_{self.selected_days}days{role_suffix}.csv'
-            )
-            
-            role_text = f" с ролью **{self.selected_role.name}**" if self.selected_role else ""
-            await export_inter.followup.send(
-                f"📊 Экспорт неактивных пользователей{role_text} ({len(inactive_members)} пользователей за {self.selected_days} дней)",
-                file=file,
-                ephemeral=True
-            )
-        
-        export_btn.callback = export_callback
-        export_view.add_item(export_btn)
-        
-        embed.set_footer(text="💡 Нажмите кнопку ниже для экспорта полного списка")
-        
-        await interaction.followup.send(embed=embed, view=export_view, ephemeral=True)
+        # Постраничный список с кнопкой экспорта
+        view = InactiveReportView(report, self.guild, self.bot.export_service, interaction.user.id)
+        await interaction.followup.send(embed=view.embed(), view=view, ephemeral=True)
 
 
 class ActivitySummaryView(discord.ui.View):
@@ -1435,110 +961,12 @@ class ActivitySummaryView(discord.ui.View):
     async def show_summary(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
         
-        # Получаем всех пользователей
-        all_members = [m for m in self.guild.members if not m.bot]
-        
-        # Фильтруем по роли если указана
-        if self.selected_role:
-            all_members = [m for m in all_members if self.selected_role in m.roles]
-        
-        # Получаем статистику
-        all_stats = self.bot.db.get_all_users_stats(self.guild.id, self.selected_days)
-        
-        # Фильтруем статистику по роли
-        if self.selected_role:
-            filtered_user_ids = {m.id for m in all_members}
-            all_stats = [s for s in all_stats if s['user_id'] in filtered_user_ids]
-        
-        # Считаем активность
-        very_active = [s for s in all_stats if s['period_messages'] >= 100 or s['period_voice_time'] >= 3600*10]
-        active = [s for s in all_stats if (s['period_messages'] >= 20 or s['period_voice_time'] >= 3600*2) and s not in very_active]
-        low_active = [s for s in all_stats if (s['period_messages'] > 0 or s['period_voice_time'] > 0) and s not in very_active and s not in active]
-        
-        active_user_ids = {stat['user_id'] for stat in all_stats if stat['period_messages'] > 0 or stat['period_voice_time'] > 0}
-        inactive_members = [m for m in all_members if m.id not in active_user_ids]
-        
-        # Общая статистика
-        total_messages = sum(s['period_messages'] for s in all_stats)
-        total_voice_time = sum(s['period_voice_time'] for s in all_stats)
-        
-        # Формируем embed
-        title_suffix = f" (роль: {self.selected_role.name})" if self.selected_role else ""
-        embed = discord.Embed(
-            title=f"📊 Сводка активности сервера{title_suffix}",
-            description=f"Анализ активности за последние **{self.selected_days} дней**",
-            color=0x3498DB,
-            timestamp=datetime.utcnow()
-        )
-        
-        # Общие цифры
-        embed.add_field(
-            name="📈 Общая активность",
-            value=f"**Сообщений:** {total_messages:,}\n**Время в войсе:** {int(total_voice_time // 3600)}ч {int((total_voice_time % 3600) // 60)}м",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="👥 Участники",
-            value=f"**Всего:** {len(all_members)}\n**Активных:** {len(active_user_ids)}",
-            inline=True
-        )
-        
-        # Пустое поле для выравнивания
-        embed.add_field(name="\u200b", value="\u200b", inline=True)
-        
-        # Разбивка по уровням активности
-        embed.add_field(
-            name="🎯 Уровни активности",
-            value=f"🔥 **Очень активные:** {len(very_active)}\n⚡ **Активные:** {len(active)}\n💬 **Низкая активность:** {len(low_active)}\n😴 **Неактивные:** {len(inactive_members)}",
-            inline=False
+        report = await self.bot.report_cache.get(self.guild, self.selected_days, self.selected_role)
+        embed = summary_embed(
+            report, self.guild,
+            footer="💡 Критерии: Очень активные (100+ сообщений или 10+ часов), Активные (20+ сообщений или 2+ часов)"
         )
         
-        # Процентное соотношение
-        total = len(all_members)
-        if total > 0:
-            very_active_pct = len(very_active) / total * 100
-            active_pct = len(active) / total * 100
-            low_active_pct = len(low_active) / total * 100
-            inactive_pct = len(inactive_members) / total * 100
-            
-            # Визуальная диаграмма
-            bar_length = 20
-            very_bar = int(very_active_pct / 100 * bar_length)
-            active_bar = int(active_pct / 100 * bar_length)
-            low_bar = int(low_active_pct / 100 * bar_length)
-            inactive_bar = bar_length - very_bar - active_bar - low_bar
-            
-            visual = f"🔥 `{'█' * very_bar}{'░' * (bar_length - very_bar)}` {very_active_pct:.1f}%\n"
-            visual += f"⚡ `{'█' * active_bar}{'░' * (bar_length - active_bar)}` {active_pct:.1f}%\n"
-            visual += f"💬 `{'█' * low_bar}{'░' * (bar_length - low_bar)}` {low_active_pct:.1f}%\n"
-            visual += f"😴 `{'█' * inactive_bar}{'░' * (bar_length - inactive_bar)}` {inactive_pct:.1f}%"
-            
-            embed.add_field(
-                name="📊 Распределение активности",
-                value=visual,
-                inline=False
-            )
-        
-        # Топ-3 самых активных
-        if all_stats:
-            top_messages = sorted(all_stats, key=lambda x: x['period_messages'], reverse=True)[:3]
-            top_text = []
-            for i, user_data in enumerate(top_messages, 1):
-                member = self.guild.get_member(user_data['user_id'])
-                if member:
-                    emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
-                    top_text.append(f"{emoji} {member.mention}: {user_data['period_messages']} сообщений")
-            
-            if top_text:
-                embed.add_field(
-                    name="🏆 Топ-3 по сообщениям",
-                    value="\n".join(top_text),
-                    inline=False
-                )
-        
-        embed.set_footer(text=f"💡 Критерии: Очень активные (100+ сообщений или 10+ часов), Активные (20+ сообщений или 2+ часов)")
-        
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 
@@ -1599,7 +1027,7 @@ class WarningsView(discord.ui.View):
     """Интерактивное меню для системы выговоров"""
     
     def __init__(self, bot):
-        super().__init__(timeout=180)
+        super().__init__(timeout=None)
         self.bot = bot
     
     @discord.ui.button(label="⚠️ Выдать выговор", style=discord.ButtonStyle.red, custom_id="warn_user", row=0)
@@ -1630,7 +1058,7 @@ class WarningsView(discord.ui.View):
             await interaction.followup.send("❌ Система выговоров не загружена", ephemeral=True)
             return
         
-        warnings_data = warnings_cog.get_all_warnings(interaction.guild.id, active_only=True)
+        warnings_data = warnings_cog.get_all_warnings(interaction.guild.id)
         
         if not warnings_data:
             await interaction.followup.send("✅ На сервере нет пользователей с активными выговорами!", ephemeral=True)
@@ -1697,48 +1125,12 @@ class WarningsView(discord.ui.View):
             await interaction.followup.send("❌ Система выговоров не загружена", ephemeral=True)
             return
         
-        import sqlite3
-        conn = sqlite3.connect(self.bot.db.db_path)
-        cursor = conn.cursor()
-        
-        # Общая статистика
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active,
-                COUNT(DISTINCT user_id) as unique_users
-            FROM warnings
-            WHERE guild_id = ?
-        ''', (interaction.guild.id,))
-        
-        stats = cursor.fetchone()
-        total_warnings, active_warnings, unique_users = stats
-        
-        # Топ нарушителей (всего)
-        cursor.execute('''
-            SELECT user_id, COUNT(*) as total_count
-            FROM warnings
-            WHERE guild_id = ?
-            GROUP BY user_id
-            ORDER BY total_count DESC
-            LIMIT 5
-        ''', (interaction.guild.id,))
-        
-        top_offenders = cursor.fetchall()
-        
-        # Топ модераторов
-        cursor.execute('''
-            SELECT warned_by, COUNT(*) as warnings_given
-            FROM warnings
-            WHERE guild_id = ?
-            GROUP BY warned_by
-            ORDER BY warnings_given DESC
-            LIMIT 5
-        ''', (interaction.guild.id,))
-        
-        top_moderators = cursor.fetchall()
-        
-        conn.close()
+        summary = self.bot.db.warnings_repo.summary(interaction.guild.id)
+        total_warnings = summary['total_warnings']
+        active_warnings = summary['active_warnings']
+        unique_users = summary['unique_users']
+        top_offenders = summary['top_total']
+        top_moderators = summary['top_moderators']
         
         embed = discord.Embed(
             title="📊 Статистика выговоров сервера",
@@ -1785,46 +1177,10 @@ class WarningsView(discord.ui.View):
     
     @discord.ui.button(label="🔙 Назад", style=discord.ButtonStyle.red, custom_id="back_to_main_from_warnings", row=2)
     async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Получаем кастомные настройки сервера
-        settings = self.bot.db.get_guild_settings(interaction.guild.id)
-        primary_color = int(settings['primary_color'].lstrip('#'), 16)
-
-        embed = discord.Embed(
-            title=f"🎛️ {settings['panel_title']}",
-            description=settings['welcome_message'],
-            color=primary_color,
-            timestamp=datetime.utcnow()
+        await interaction.response.edit_message(
+            embed=panel_embed(self.bot, interaction), view=self.bot.panel_views['main']
         )
 
-        embed.add_field(
-            name="📈 Stats",
-            value="Статистика пользователей и активности",
-            inline=True
-        )
-
-        embed.add_field(
-            name="👥 Whitelist",
-            value="Управление whitelist пользователями",
-            inline=True
-        )
-
-        embed.add_field(
-            name="📊 Polls",
-            value="Создание и управление опросами",
-            inline=True
-        )
-
-        embed.add_field(
-            name="⚠️ Warnings",
-            value="Система выговоров и модерация",
-            inline=True
-        )
-
-        logo_url = settings.get('logo_url') or (interaction.user.avatar.url if interaction.user.avatar else None)
-        embed.set_footer(text=settings['footer_text'], icon_url=logo_url)
-
-        await interaction.response.edit_message(embed=embed, view=PanelView(self.bot, interaction.guild.id))
-
 
 class WarnUserModal(discord.ui.Modal, title="⚠️ Выдать выговор"):
     """Модальное окно для выдачи выговора"""
@@ -1851,61 +1207,13 @@ class WarnUserModal(discord.ui.Modal, title="⚠️ Выдать выговор"
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
-        # Парсим ID пользователя
+        # Ищем пользователя: ID, упоминание или имя (индекс имён, без перебора участников)
         user_input = self.user_id.value.strip()
+        user_id, member, candidates = self.bot.member_resolver.resolve(interaction.guild, user_input)
         
-        member = None
-        
-        # Вариант 1: Упоминание <@123456789> или <@!123456789>
-        if user_input.startswith('<@') and user_input.endswith('>'):
-            user_input = user_input[2:-1]
-            if user_input.startswith('!'):
-                user_input = user_input[1:]
-            
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 2: Просто ID
+        # Если пользователь не найден или найдено несколько
         if not member:
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 3: Имя пользователя (@username или username)
-        if not member:
-            # Убираем @ если есть
-            search_name = user_input.lstrip('@')
-            
-            # Ищем по точному совпадению имени
-            member = discord.utils.get(interaction.guild.members, name=search_name)
-            
-            # Если не нашли, ищем по display_name
-            if not member:
-                member = discord.utils.get(interaction.guild.members, display_name=search_name)
-            
-            # Если не нашли, ищем по началу имени (case-insensitive)
-            if not member:
-                search_name_lower = search_name.lower()
-                for m in interaction.guild.members:
-                    if m.name.lower().startswith(search_name_lower) or m.display_name.lower().startswith(search_name_lower):
-                        member = m
-                        break
-        
-        # Если пользователь не найден
-        if not member:
-            await interaction.followup.send(
-                f"❌ Пользователь `{user_input}` не найден на сервере\n\n"
-                f"💡 **Подсказка:**\n"
-                f"• Используйте ID: `123456789`\n"
-                f"• Или упоминание: скопируйте упоминание\n"
-                f"• Или точное имя: `username` или `@username`",
-                ephemeral=True
-            )
+            await interaction.followup.send(member_not_found_message(user_input, candidates), ephemeral=True)
             return
         
         # Нельзя выдать выговор самому себе
@@ -1991,7 +1299,7 @@ class WarnUserModal(discord.ui.Modal, title="⚠️ Выдать выговор"
         
         await interaction.followup.send(embed=embed, ephemeral=True)
         
-        # Пытаемся отправить DM пользователю
+        # DM пользователю - через очередь уведомлений
         try:
             dm_embed = discord.Embed(
                 title="⚠️ Вы получили выговор",
@@ -2025,9 +1333,9 @@ class WarnUserModal(discord.ui.Modal, title="⚠️ Выдать выговор"
                     inline=False
                 )
             
-            await member.send(embed=dm_embed)
-        except:
-            pass
+            self.bot.notifications.notify(member.id, dm_embed)
+        except Exception as e:
+            print(f"Error queueing warning DM: {e}")
 
 
 class UnwarnModal(discord.ui.Modal, title="✅ Снять выговор"):
@@ -2067,19 +1375,8 @@ class UnwarnModal(discord.ui.Modal, title="✅ Снять выговор"):
             await interaction.followup.send("❌ Система выговоров не загружена", ephemeral=True)
             return
         
-        # Получаем информацию о выговоре
-        import sqlite3
-        conn = sqlite3.connect(self.bot.db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, warned_by, reason, is_active
-            FROM warnings
-            WHERE id = ?
-        ''', (warn_id,))
-        
-        warning_data = cursor.fetchone()
-        conn.close()
+        # Получаем информацию о выговоре (только этого сервера)
+        warning_data = self.bot.db.warnings_repo.get_warning(interaction.guild.id, warn_id)
         
         if not warning_data:
             await interaction.followup.send(f"❌ Выговор с ID `{warn_id}` не найден", ephemeral=True)
@@ -2156,9 +1453,9 @@ class UnwarnModal(discord.ui.Modal, title="✅ Снять выговор"):
                         inline=False
                     )
                     
-                    await member.send(embed=dm_embed)
-                except:
-                    pass
+                    self.bot.notifications.notify(member.id, dm_embed)
+                except Exception as e:
+                    print(f"Error queueing unwarn DM: {e}")
         else:
             await interaction.followup.send(f"❌ Не удалось снять выговор `{warn_id}`", ephemeral=True)
 
@@ -2180,65 +1477,13 @@ class CheckWarningsModal(discord.ui.Modal, title="👤 Проверить выг
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
-        # Парсим ID пользователя
+        # Ищем пользователя: ID, упоминание или имя (индекс имён, без перебора участников)
         user_input = self.user_id.value.strip()
+        user_id, member, candidates = self.bot.member_resolver.resolve(interaction.guild, user_input)
         
-        member = None
-        user_id = None
-        
-        # Вариант 1: Упоминание <@123456789> или <@!123456789>
-        if user_input.startswith('<@') and user_input.endswith('>'):
-            id_str = user_input[2:-1]
-            if id_str.startswith('!'):
-                id_str = id_str[1:]
-            
-            try:
-                user_id = int(id_str)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 2: Просто ID
-        if not user_id:
-            try:
-                user_id = int(user_input)
-                member = interaction.guild.get_member(user_id)
-            except ValueError:
-                pass
-        
-        # Вариант 3: Имя пользователя (@username или username)
-        if not user_id:
-            # Убираем @ если есть
-            search_name = user_input.lstrip('@')
-            
-            # Ищем по точному совпадению имени
-            member = discord.utils.get(interaction.guild.members, name=search_name)
-            
-            # Если не нашли, ищем по display_name
-            if not member:
-                member = discord.utils.get(interaction.guild.members, display_name=search_name)
-            
-            # Если не нашли, ищем по началу имени (case-insensitive)
-            if not member:
-                search_name_lower = search_name.lower()
-                for m in interaction.guild.members:
-                    if m.name.lower().startswith(search_name_lower) or m.display_name.lower().startswith(search_name_lower):
-                        member = m
-                        break
-            
-            if member:
-                user_id = member.id
-        
-        # Если не найден
+        # Если пользователь не найден или найдено несколько
         if not user_id:
-            await interaction.followup.send(
-                f"❌ Пользователь `{user_input}` не найден на сервере\n\n"
-                f"💡 **Подсказка:**\n"
-                f"• Используйте ID: `123456789`\n"
-                f"• Или упоминание: скопируйте упоминание\n"
-                f"• Или точное имя: `username` или `@username`",
-                ephemeral=True
-            )
+            await interaction.followup.send(member_not_found_message(user_input, candidates), ephemeral=True)
             return
         
         target = member if member else None
@@ -2260,8 +1505,8 @@ class CheckWarningsModal(discord.ui.Modal, title="👤 Проверить выг
             await interaction.followup.send(f"✅ У {target.mention} нет выговоров!", ephemeral=True)
             return
         
-        # Считаем активные
-        active_count = sum(1 for w in warnings if (len(w) == 5 or w[5] == 1))
+        # Счётчики - из warning_counters
+        active_count, total_count = warnings_cog.get_warning_counts(interaction.guild.id, target.id)
         
         embed = discord.Embed(
             title=f"📋 Выговоры пользователя",
@@ -2274,7 +1519,7 @@ class CheckWarningsModal(discord.ui.Modal, title="👤 Проверить выг
         
         embed.add_field(
             name="📊 Статус",
-            value=f"**Активных:** {active_count}/3\n**Всего:** {len(warnings)}",
+            value=f"**Активных:** {active_count}/3\n**Всего:** {total_count}",
             inline=False
         )
         
@@ -2330,9 +1575,17 @@ class Panel(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    def get_guild_settings(self, guild_id: int) -> dict:
-        """Получить настройки сервера для панели"""
-        return self.bot.db.get_guild_settings(guild_id)
+    async def cog_load(self):
+        # Постоянные view панели: один экземпляр на бота, custom_id стабильны,
+        # поэтому кнопки работают и после перезапуска, а навигация не создаёт новых объектов
+        self.bot.panel_views = {
+            'main': PanelView(self.bot),
+            'stats': StatsView(self.bot),
+            'whitelist': WhitelistView(self.bot),
+            'warnings': WarningsView(self.bot),
+        }
+        for view in self.bot.panel_views.values():
+            self.bot.add_view(view)
 
     @discord.app_commands.command(name="panel", description="🎛️ Панель управления GuildBrew")
     async def panel(self, interaction: discord.Interaction):
@@ -2346,47 +1599,9 @@ class Panel(commands.Cog):
                 )
                 return
 
-        # Получаем кастомные настройки сервера
-        settings = self.get_guild_settings(interaction.guild.id)
-        primary_color = int(settings['primary_color'].lstrip('#'), 16)
-
-        embed = discord.Embed(
-            title=f"🎛️ {settings['panel_title']}",
-            description=settings['welcome_message'],
-            color=primary_color,
-            timestamp=datetime.utcnow()
-        )
-        
-        embed.add_field(
-            name="📈 Stats",
-            value="Статистика пользователей и активности",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="👥 Whitelist",
-            value="Управление whitelist пользователями",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="⚠️ Warnings",
-            value="Система выговоров и модерация",
-            inline=True
+        await interaction.response.send_message(
+            embed=panel_embed(self.bot, interaction), view=self.bot.panel_views['main'], ephemeral=True
         )
-        
-        # Используем кастомный footer или дефолтный с именем пользователя
-        # Локальные пути (/uploads/...) не работают в Discord embeds - нужен полный URL
-        logo_url = settings.get('logo_url')
-        if logo_url and logo_url.startswith('/'):
-            # Локальный путь - используем аватар пользователя вместо этого
-            logo_url = interaction.user.avatar.url if interaction.user.avatar else None
-        elif not logo_url:
-            logo_url = interaction.user.avatar.url if interaction.user.avatar else None
-        embed.set_footer(text=settings['footer_text'], icon_url=logo_url)
-
-        await interaction.response.send_message(embed=embed, view=PanelView(self.bot, interaction.guild.id), ephemeral=True)
-
 
 
 async def setup(bot):
@@ -2,6 +2,11 @@ import discord
 from discord.ext import commands, tasks
 from datetime import datetime
 from utils import is_admin_or_whitelisted
+from exports import iter_stats_rows, iter_export_records, member_snapshot, write_csv_tempfile
+from reports import InactiveReportView, summary_embed
+from export_service import ExportTooLarge
+import asyncio
+import time
 import io
 import csv
 from io import StringIO
@@ -12,10 +17,14 @@ class Stats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = bot.db
+        self._last_checkpoint = None
         self.cleanup_task.start()
+        self.activity_checkpoint.start()
 
     def cog_unload(self):
         self.cleanup_task.cancel()
+        self.activity_checkpoint.cancel()
+        self.bot.hourly_activity.flush()
 
     async def setup_hook(self):
         """Вызывается при загрузке cog - закрываем зависшие сессии"""
@@ -42,6 +51,58 @@ class Stats(commands.Cog):
         else:
             print("ℹ️ No users in voice channels to recover")
 
+        # Индекс ролей (перестраиваем целиком - после переподключения кэш мог измениться)
+        for guild in self.bot.guilds:
+            self.bot.role_index.build_guild(guild)
+            self.bot.member_resolver.build_guild(guild)
+        print(f"✅ Role and member name indexes built for {len(self.bot.guilds)} guilds")
+
+    # ========================================
+    # ИНДЕКСЫ РОЛЕЙ И ИМЁН
+    # ========================================
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.bot.role_index.build_guild(guild)
+        self.bot.member_resolver.build_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.bot.role_index.remove_guild(guild.id)
+        self.bot.member_resolver.remove_guild(guild.id)
+        self.bot.hourly_activity.remove_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.bot.role_index.update_member(member)
+        self.bot.member_resolver.update_member(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.bot.role_index.remove_member(member.guild.id, member.id)
+        self.bot.member_resolver.remove_member(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.bot.role_index.update_member(after)
+        if before.display_name != after.display_name:
+            self.bot.member_resolver.update_member(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        """Смена username/глобального имени - обновляем индекс имён на всех общих серверах"""
+        if before.name == after.name and before.global_name == after.global_name:
+            return
+        for guild in after.mutual_guilds:
+            member = guild.get_member(after.id)
+            if member:
+                self.bot.member_resolver.update_member(member)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.bot.role_index.remove_role(role.guild.id, role.id)
+
     @tasks.loop(hours=24)
     async def cleanup_task(self):
         """Ежедневная очистка старых данных"""
@@ -57,6 +118,38 @@ class Stats(commands.Cog):
     async def before_cleanup(self):
         await self.bot.wait_until_ready()
 
+    # ========================================
+    # ПОЧАСОВАЯ АКТИВНОСТЬ
+    # ========================================
+
+    @tasks.loop(minutes=1)
+    async def activity_checkpoint(self):
+        """
+        Раз в минуту: время в войсе за прошедший интервал в ячейку текущего часа
+        (участников в войсе × секунд) и сохранение изменённых буферов в БД.
+        """
+        now = time.monotonic()
+        elapsed = int(now - self._last_checkpoint) if self._last_checkpoint is not None else 0
+        self._last_checkpoint = now
+
+        if elapsed > 0:
+            for guild in self.bot.guilds:
+                in_voice = sum(
+                    1
+                    for channel in guild.voice_channels
+                    if channel != guild.afk_channel
+                    for member in channel.members
+                    if not member.bot
+                )
+                if in_voice:
+                    self.bot.hourly_activity.add_voice(guild.id, in_voice * elapsed)
+
+        await asyncio.get_running_loop().run_in_executor(None, self.bot.hourly_activity.flush)
+
+    @activity_checkpoint.before_loop
+    async def before_activity_checkpoint(self):
+        await self.bot.wait_until_ready()
+
     @commands.Cog.listener()
     async def on_message(self, message):
         """Отслеживание сообщений"""
@@ -70,6 +163,8 @@ class Stats(commands.Cog):
 
         # Логируем сообщение
         self.db.log_message(message.guild.id, message.author.id)
+        self.bot.hourly_activity.add_message(message.guild.id)
+        self.bot.event_bus.increment_messages(message.guild.id, message.author.id)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
@@ -84,11 +179,13 @@ class Stats(commands.Cog):
         # Пользователь присоединился к каналу
         if before.channel is None and after.channel is not None:
             self.db.start_voice_session(guild_id, user_id)
+            self.bot.event_bus.publish('voice_join', guild_id, user_id=user_id, channel_id=after.channel.id)
             print(f"Voice session started: {member.name} -> {after.channel.name}")
 
         # Пользователь покинул канал
         elif before.channel is not None and after.channel is None:
             self.db.end_voice_session(guild_id, user_id)
+            self.bot.event_bus.publish('voice_leave', guild_id, user_id=user_id, channel_id=before.channel.id)
             print(f"Voice session ended: {member.name} <- {before.channel.name}")
 
         # Пользователь переключился между каналами
@@ -298,55 +395,17 @@ class Stats(commands.Cog):
             await ctx.send("❌ Допустимые периоды: 7, 14 или 30 дней", delete_after=10)
             return
 
-        # Получаем всех участников (исключая ботов)
-        all_members = [m for m in ctx.guild.members if not m.bot]
-        
-        # Фильтруем по роли если указана
-        if role:
-            all_members = [m for m in all_members if role in m.roles]
-
-        # Получаем статистику
-        all_stats = self.db.get_all_users_stats(ctx.guild.id, days)
-
-        # Находим ID активных пользователей
-        active_user_ids = {
-            stat['user_id'] for stat in all_stats 
-            if stat['period_messages'] > 0 or stat['period_voice_time'] > 0
-        }
-
-        # Находим неактивных
-        inactive_members = [m for m in all_members if m.id not in active_user_ids]
+        # Отчёт из кэша - тот же, что у кнопки «Неактивные» в панели
+        report = await self.bot.report_cache.get(ctx.guild, days, role)
 
-        if not inactive_members:
+        if not report.inactive_ids:
             role_text = f" с ролью **{role.name}**" if role else ""
             await ctx.send(f"✅ Все участники{role_text} активны за последние {days} дней!", delete_after=10)
             return
 
-        # Формируем embed
-        title_suffix = f" (роль: {role.name})" if role else ""
-        embed = discord.Embed(
-            title=f"😴 Неактивные участники{title_suffix}",
-            description=f"Участники без активности за последние **{days} дней**",
-            color=discord.Color.red(),
-            timestamp=datetime.utcnow()
-        )
-
-        # Разбиваем на чанки по 20 пользователей
-        chunk_size = 20
-        for i in range(0, len(inactive_members), chunk_size):
-            chunk = inactive_members[i:i + chunk_size]
-            members_list = [f"• {m.mention} ({m.name})" for m in chunk]
-            
-            field_name = f"Неактивные участники ({i+1}-{min(i+chunk_size, len(inactive_members))})"
-            embed.add_field(
-                name=field_name,
-                value="\n".join(members_list),
-                inline=False
-            )
-
-        embed.set_footer(text=f"Всего неактивных: {len(inactive_members)}")
-
-        await ctx.send(embed=embed)
+        # Постраничный вывод вместо всех участников в полях одного embed
+        view = InactiveReportView(report, ctx.guild, self.bot.export_service, ctx.author.id)
+        await ctx.send(embed=view.embed(), view=view)
 
     @commands.command(name='gb_summary')
     @is_admin_or_whitelisted()
@@ -358,107 +417,9 @@ class Stats(commands.Cog):
             await ctx.send("❌ Допустимые периоды: 7, 14 или 30 дней", delete_after=10)
             return
         
-        # Получаем всех участников (исключая ботов)
-        all_members = [m for m in ctx.guild.members if not m.bot]
-        
-        # Фильтруем по роли если указана
-        if role:
-            all_members = [m for m in all_members if role in m.roles]
-        
-        # Получаем статистику
-        all_stats = self.db.get_all_users_stats(ctx.guild.id, days)
-        
-        # Фильтруем статистику по роли
-        if role:
-            filtered_user_ids = {m.id for m in all_members}
-            all_stats = [s for s in all_stats if s['user_id'] in filtered_user_ids]
-        
-        # Считаем активность
-        very_active = [s for s in all_stats if s['period_messages'] >= 100 or s['period_voice_time'] >= 3600*10]  # 100+ сообщений или 10+ часов
-        active = [s for s in all_stats if (s['period_messages'] >= 20 or s['period_voice_time'] >= 3600*2) and s not in very_active]  # 20+ сообщений или 2+ часов
-        low_active = [s for s in all_stats if (s['period_messages'] > 0 or s['period_voice_time'] > 0) and s not in very_active and s not in active]
-        
-        active_user_ids = {stat['user_id'] for stat in all_stats if stat['period_messages'] > 0 or stat['period_voice_time'] > 0}
-        inactive_members = [m for m in all_members if m.id not in active_user_ids]
-        
-        # Общая статистика
-        total_messages = sum(s['period_messages'] for s in all_stats)
-        total_voice_time = sum(s['period_voice_time'] for s in all_stats)
-        
-        # Формируем embed
-        title_suffix = f" (роль: {role.name})" if role else ""
-        embed = discord.Embed(
-            title=f"📊 Сводка активности сервера{title_suffix}",
-            description=f"Анализ активности за последние **{days} дней**",
-            color=0x3498DB,
-            timestamp=datetime.utcnow()
-        )
-        
-        # Общие цифры
-        embed.add_field(
-            name="📈 Общая активность",
-            value=f"**Сообщений:** {total_messages:,}\n**Время в войсе:** {int(total_voice_time // 3600)}ч {int((total_voice_time % 3600) // 60)}м",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="👥 Участники",
-            value=f"**Всего:** {len(all_members)}\n**Активных:** {len(active_user_ids)}",
-            inline=True
-        )
-        
-        # Разбивка по уровням активности
-        embed.add_field(
-            name="🎯 Уровни активности",
-            value=f"🔥 **Очень активные:** {len(very_active)}\n⚡ **Активные:** {len(active)}\n💬 **Низкая активность:** {len(low_active)}\n😴 **Неактивные:** {len(inactive_members)}",
-            inline=False
-        )
-        
-        # Процентное соотношение
-        total = len(all_members)
-        if total > 0:
-            very_active_pct = len(very_active) / total * 100
-            active_pct = len(active) / total * 100
-            low_active_pct = len(low_active) / total * 100
-            inactive_pct = len(inactive_members) / total * 100
-            
-            # Визуальная диаграмма
-            bar_length = 20
-            very_bar = int(very_active_pct / 100 * bar_length)
-            active_bar = int(active_pct / 100 * bar_length)
-            low_bar = int(low_active_pct / 100 * bar_length)
-            inactive_bar = bar_length - very_bar - active_bar - low_bar
-            
-            visual = f"🔥`{'█' * very_bar}` {very_active_pct:.1f}%\n"
-            visual += f"⚡`{'█' * active_bar}` {active_pct:.1f}%\n"
-            visual += f"💬`{'█' * low_bar}` {low_active_pct:.1f}%\n"
-            visual += f"😴`{'█' * inactive_bar}` {inactive_pct:.1f}%"
-            
-            embed.add_field(
-                name="📊 Распределение",
-                value=visual,
-                inline=False
-            )
-        
-        # Топ-3 самых активных
-        if all_stats:
-            top_messages = sorted(all_stats, key=lambda x: x['period_messages'], reverse=True)[:3]
-            top_text = []
-            for i, user_data in enumerate(top_messages, 1):
-                member = ctx.guild.get_member(user_data['user_id'])
-                if member:
-                    emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
-                    top_text.append(f"{emoji} {member.mention}: {user_data['period_messages']} сообщений")
-            
-            if top_text:
-                embed.add_field(
-                    name="🏆 Топ-3 по сообщениям",
-                    value="\n".join(top_text),
-                    inline=False
-                )
-        
-        embed.set_footer(text=f"Используйте !gb_inactive {days} для списка неактивных")
-        
+        report = await self.bot.report_cache.get(ctx.guild, days, role)
+        embed = summary_embed(report, ctx.guild, footer=f"Используйте !gb_inactive {days} для списка неактивных")
+
         await ctx.send(embed=embed)
 
     @commands.command(name='gb_export')
@@ -471,97 +432,63 @@ class Stats(commands.Cog):
             await ctx.send("❌ Допустимые периоды: 7, 14 или 30 дней", delete_after=10)
             return
 
-        # Получаем статистику
-        all_stats = self.db.get_all_users_stats(ctx.guild.id, days)
-
-        if not all_stats:
-            await ctx.send("📊 Нет данных для экспорта", delete_after=10)
-            return
-        
-        # Фильтруем по роли если указана
+        report_date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
+
+        def preamble(count):
+            rows = [
+                ['User Statistics Report'],
+                ['Server:', ctx.guild.name],
+                ['Period:', f'{days} days'],
+            ]
+            if role:
+                rows.append(['Filtered by role:', role.name])
+            rows.append(['Total Users:', count])
+            rows.append(['Report Date:', report_date])
+            rows.append([])
+            return rows
+
+        # CSV пишется построчно из курсора БД во временный файл (в пуле экспорта, не блокируя event loop)
+        members = member_snapshot(ctx.guild)
+        rows = iter_stats_rows(self.db.db_path, ctx.guild.id, days=days)
+        allowed_ids = None
         if role:
-            filtered_stats = []
-            for stat in all_stats:
-                member = ctx.guild.get_member(stat['user_id'])
-                if member and role in member.roles:
-                    filtered_stats.append(stat)
-            all_stats = filtered_stats
-        
-        if not all_stats:
-            await ctx.send(f"📊 Нет данных для роли {role.mention}", delete_after=10)
-            return
+            allowed_ids = self.bot.role_index.filter_ids(ctx.guild, include_roles=[role.id], humans_only=False)
+        records = iter_export_records(rows, members, allowed_ids=allowed_ids, members_only=role is not None)
 
-        # Формируем CSV
-        output = StringIO()
-        writer = csv.writer(output)
-
-        writer.writerow(['User Statistics Report'])
-        writer.writerow(['Server:', ctx.guild.name])
-        writer.writerow(['Period:', f'{days} days'])
-        if role:
-            writer.writerow(['Filtered by role:', role.name])
-        writer.writerow(['Total Users:', len(all_stats)])
-        writer.writerow(['Report Date:', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')])
-        writer.writerow([])
+        status_msg = await ctx.send("⏳ Готовлю экспорт статистики...")
+        csv_file, count = await self.bot.export_service.run(
+            ctx.guild.id, write_csv_tempfile, records,
+            preamble_fn=preamble, status=status_msg, label="⏳ Экспорт статистики"
+        )
 
-        writer.writerow([
-            'Rank',
-            'Username',
-            'Display Name',
-            'User ID',
-            'Top Role',
-            'All Roles',
-            'Messages (Period)',
-            'Messages (Total)',
-            'Voice Time (Period, hours)',
-            'Voice Time (Total, hours)'
-        ])
-
-        for i, user_data in enumerate(all_stats, 1):
-            member = ctx.guild.get_member(user_data['user_id'])
-            
-            if member:
-                username = member.name
-                display_name = member.display_name
-                top_role = member.top_role.name if member.top_role.name != "@everyone" else "No Role"
-                
-                # Все роли (кроме @everyone)
-                all_roles = ", ".join([r.name for r in member.roles if r.name != "@everyone"])
-                if not all_roles:
-                    all_roles = "No Roles"
+        if count == 0:
+            csv_file.close()
+            await status_msg.delete()
+            if role:
+                await ctx.send(f"📊 Нет данных для роли {role.mention}", delete_after=10)
             else:
-                username = f"Unknown (ID: {user_data['user_id']})"
-                display_name = username
-                top_role = "Unknown"
-                all_roles = "Unknown"
-
-            writer.writerow([
-                i,
-                username,
-                display_name,
-                user_data['user_id'],
-                top_role,
-                all_roles,
-                user_data['period_messages'],
-                user_data['total_messages'],
-                round(user_data['period_voice_time'] / 3600, 2),
-                round(user_data['total_voice_time'] / 3600, 2)
-            ])
-
-        csv_data = output.getvalue()
+                await ctx.send("📊 Нет данных для экспорта", delete_after=10)
+            return
 
-        # Создаем файл
+        # Создаем файл (больше лимита загрузки сервера - в zip)
         role_suffix = f"_role_{role.name}" if role else ""
-        file = discord.File(
-            io.BytesIO(csv_data.encode('utf-8-sig')),
-            filename=f'user_stats_{ctx.guild.name}_{days}days{role_suffix}.csv'
-        )
+        try:
+            file = await self.bot.export_service.to_discord_file(
+                csv_file, f'user_stats_{ctx.guild.name}_{days}days{role_suffix}.csv', ctx.guild.filesize_limit
+            )
+        except ExportTooLarge as e:
+            await status_msg.edit(content=f"❌ Файл экспорта слишком большой для загрузки в Discord ({e})")
+            return
 
         role_text = f" для роли **{role.name}**" if role else ""
-        await ctx.send(
-            f"📊 Статистика {len(all_stats)} пользователей{role_text} экспортирована",
-            file=file
-        )
+        try:
+            await status_msg.delete()
+            await ctx.send(
+                f"📊 Статистика {count} пользователей{role_text} экспортирована",
+                file=file
+            )
+        finally:
+            file.close()
 
     @commands.command(name='gb_voice_debug')
     @commands.has_permissions(administrator=True)
@@ -1,7 +1,9 @@
 import discord
-from discord.ext import commands, tasks
+import functools
+from discord.ext import commands
 from datetime import datetime, timedelta
 from utils import is_admin_or_whitelisted
+from expiry_scheduler import ExpiryScheduler, utc_timestamp
 
 class WarningSystem(commands.Cog):
     """Система выговоров для модерации сервера"""
@@ -13,11 +15,15 @@ class WarningSystem(commands.Cog):
         # Инициализируем таблицу в БД
         self.init_warnings_table()
         
-        # Запускаем задачу автоматического снятия выговоров
-        self.auto_remove_warnings.start()
+        # Таймеры снятия выговоров: срабатывают ровно в expires_at
+        self.expiry = ExpiryScheduler(self.expire_warnings)
+        self.load_expiry_timers()
+    
+    async def cog_load(self):
+        self.expiry.start()
     
     def cog_unload(self):
-        self.auto_remove_warnings.cancel()
+        self.expiry.stop()
     
     def init_warnings_table(self):
         """Создание таблицы для выговоров"""
@@ -44,20 +50,27 @@ class WarningSystem(commands.Cog):
         conn.commit()
         conn.close()
     
+    def load_expiry_timers(self):
+        """Поставить таймеры для всех активных выговоров (один раз при загрузке)"""
+        import sqlite3
+        try:
+            conn = sqlite3.connect(self.db.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, expires_at FROM warnings WHERE is_active = 1')
+            for warning_id, expires_at in cursor.fetchall():
+                self.expiry.schedule(warning_id, utc_timestamp(expires_at))
+            conn.close()
+            print(f"⏰ Warning expiry timers loaded: {len(self.expiry)}")
+        except Exception as e:
+            print(f"Error loading warning expiry timers: {e}")
+    
+    def get_warning_counts(self, guild_id: int, user_id: int) -> tuple:
+        """(активных, всего) выговоров пользователя - чтение одной строки warning_counters"""
+        return self.db.warnings_repo.user_counts(guild_id, user_id)
+    
     def get_active_warnings_count(self, guild_id: int, user_id: int) -> int:
         """Получить количество активных выговоров"""
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM warnings
-            WHERE guild_id = ? AND user_id = ? AND is_active = 1
-        ''', (guild_id, user_id))
-        
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        return self.get_warning_counts(guild_id, user_id)[0]
     
     def add_warning(self, guild_id: int, user_id: int, warned_by: int, reason: str) -> tuple:
         """Добавить выговор. Возвращает (успех, warning_id или сообщение об ошибке)"""
@@ -85,6 +98,13 @@ class WarningSystem(commands.Cog):
             conn.commit()
             conn.close()
             
+            self.db.warnings_repo.invalidate(guild_id)
+            self.expiry.schedule(warning_id, utc_timestamp(expires_at))
+            self.bot.event_bus.publish(
+                'warning_issued', guild_id,
+                user_id=user_id, warning_id=warning_id, warned_by=warned_by,
+                active_count=current_warnings + 1
+            )
             return (True, warning_id)
         except Exception as e:
             print(f"Error adding warning: {e}")
@@ -105,9 +125,22 @@ class WarningSystem(commands.Cog):
             ''', (removed_by, reason, warning_id))
             
             affected = cursor.rowcount
+            
+            warning = None
+            if affected > 0:
+                cursor.execute('SELECT guild_id, user_id FROM warnings WHERE id = ?', (warning_id,))
+                warning = cursor.fetchone()
+            
             conn.commit()
             conn.close()
             
+            if warning:
+                self.db.warnings_repo.invalidate(warning[0])
+                self.expiry.cancel(warning_id)
+                self.bot.event_bus.publish(
+                    'warning_removed', warning[0],
+                    user_id=warning[1], warning_id=warning_id, removed_by=removed_by
+                )
             return affected > 0
         except Exception as e:
             print(f"Error removing warning: {e}")
@@ -139,96 +172,92 @@ class WarningSystem(commands.Cog):
         conn.close()
         return results
     
-    def get_all_warnings(self, guild_id: int, active_only: bool = True):
-        """Получить все выговоры на сервере"""
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        if active_only:
-            cursor.execute('''
-                SELECT user_id, COUNT(*) as warning_count
-                FROM warnings
-                WHERE guild_id = ? AND is_active = 1
-                GROUP BY user_id
-                ORDER BY warning_count DESC, user_id
-            ''', (guild_id,))
-        else:
-            cursor.execute('''
-                SELECT user_id, 
-                       SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active_count,
-                       COUNT(*) as total_count
-                FROM warnings
-                WHERE guild_id = ?
-                GROUP BY user_id
-                ORDER BY active_count DESC, total_count DESC
-            ''', (guild_id,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+    def get_all_warnings(self, guild_id: int):
+        """Пользователи с активными выговорами на сервере (из кэшированной сводки): [(user_id, активных)]"""
+        return self.db.warnings_repo.active_users(guild_id)
     
-    @tasks.loop(hours=1)
-    async def auto_remove_warnings(self):
-        """Автоматическое снятие просроченных выговоров (каждый час)"""
+    async def expire_warnings(self, warning_ids: list):
+        """
+        Снять выговоры, срок которых наступил (вызывается планировщиком только для них).
+        Ошибка БД пробрасывается - планировщик повторит эти выговоры позже.
+        """
         import sqlite3
+        await self.bot.wait_until_ready()
+        remaining = {}
         try:
             conn = sqlite3.connect(self.db.db_path)
             cursor = conn.cursor()
             
-            # Находим просроченные выговоры
-            cursor.execute('''
+            placeholders = ','.join('?' * len(warning_ids))
+            cursor.execute(f'''
                 SELECT id, guild_id, user_id FROM warnings
-                WHERE is_active = 1 AND expires_at <= CURRENT_TIMESTAMP
-            ''')
-            
+                WHERE id IN ({placeholders}) AND is_active = 1
+            ''', warning_ids)
             expired = cursor.fetchall()
             
             if expired:
-                # Снимаем их
-                cursor.execute('''
+                cursor.execute(f'''
                     UPDATE warnings
                     SET is_active = 0, removed_at = CURRENT_TIMESTAMP,
                         removal_reason = 'Автоматически снят по истечении срока'
-                    WHERE is_active = 1 AND expires_at <= CURRENT_TIMESTAMP
-                ''')
-                
+                    WHERE id IN ({placeholders}) AND is_active = 1
+                ''', warning_ids)
                 conn.commit()
-                print(f"🔄 Автоматически снято {len(expired)} выговоров")
                 
-                # Опционально: уведомить пользователей в DM
-                for warning_id, guild_id, user_id in expired:
-                    try:
-                        guild = self.bot.get_guild(guild_id)
-                        if guild:
-                            member = guild.get_member(user_id)
-                            if member:
-                                embed = discord.Embed(
-                                    title="✅ Выговор снят",
-                                    description=f"С вас автоматически снят один выговор на сервере **{guild.name}**",
-                                    color=0x2ECC71,
-                                    timestamp=datetime.utcnow()
-                                )
-                                
-                                # Проверяем сколько осталось
-                                remaining = self.get_active_warnings_count(guild_id, user_id)
-                                embed.add_field(
-                                    name="📊 Текущий статус",
-                                    value=f"Активных выговоров: **{remaining}**/3",
-                                    inline=False
-                                )
-                                
-                                await member.send(embed=embed)
-                    except:
-                        pass  # Если не удалось отправить DM - не критично
-            
+                # Сколько осталось - одним запросом по warning_counters для всей пачки
+                user_ids = list({user_id for _, _, user_id in expired})
+                cursor.execute(f'''
+                    SELECT guild_id, user_id, active_count FROM warning_counters
+                    WHERE user_id IN ({','.join('?' * len(user_ids))})
+                ''', user_ids)
+                remaining = {(guild_id, user_id): count for guild_id, user_id, count in cursor.fetchall()}
             conn.close()
         except Exception as e:
-            print(f"Error in auto_remove_warnings: {e}")
+            print(f"Error expiring warnings: {e}")
+            raise
+        
+        if not expired:
+            return
+        print(f"🔄 Автоматически снято {len(expired)} выговоров")
+        
+        for guild_id in {guild_id for _, guild_id, _ in expired}:
+            self.db.warnings_repo.invalidate(guild_id)
+        
+        expired_per_user = {}
+        for warning_id, guild_id, user_id in expired:
+            self.bot.event_bus.publish('warning_expired', guild_id, user_id=user_id, warning_id=warning_id)
+            expired_per_user[(guild_id, user_id)] = expired_per_user.get((guild_id, user_id), 0) + 1
+        
+        # Уведомления в DM - через очередь (соединение с БД уже закрыто).
+        # Если предыдущее уведомление ещё не отправлено, число снятых суммируется,
+        # а остаток берётся из последней пачки
+        for (guild_id, user_id), count in expired_per_user.items():
+            guild = self.bot.get_guild(guild_id)
+            if not guild or not guild.get_member(user_id):
+                continue
+            
+            self.bot.notifications.notify(
+                user_id,
+                functools.partial(self.expired_embed, guild, remaining.get((guild_id, user_id), 0)),
+                dedup_key=('warning_expired', guild_id),
+                count=count
+            )
     
-    @auto_remove_warnings.before_loop
-    async def before_auto_remove(self):
-        await self.bot.wait_until_ready()
+    def expired_embed(self, guild, active: int, count: int) -> discord.Embed:
+        """DM о снятых по сроку выговорах: count - сумма схлопнутых уведомлений, active - остаток"""
+        removed = "один выговор" if count == 1 else f"выговоров: {count}"
+        embed = discord.Embed(
+            title="✅ Выговор снят",
+            description=f"С вас автоматически снят{'' if count == 1 else 'о'} {removed} на сервере **{guild.name}**",
+            color=0x2ECC71,
+            timestamp=datetime.utcnow()
+        )
+        embed.add_field(
+            name="📊 Текущий статус",
+            value=f"Активных выговоров: **{active}**/3",
+            inline=False
+        )
+        return embed
     
     @commands.command(name='warn')
     @is_admin_or_whitelisted()
@@ -312,7 +341,7 @@ class WarningSystem(commands.Cog):
         
         await ctx.send(embed=embed)
         
-        # Пытаемся отправить DM пользователю
+        # DM пользователю - через очередь уведомлений
         try:
             dm_embed = discord.Embed(
                 title="⚠️ Вы получили выговор",
@@ -346,28 +375,20 @@ class WarningSystem(commands.Cog):
                     inline=False
                 )
             
-            await member.send(embed=dm_embed)
-        except:
-            await ctx.send("⚠️ Не удалось отправить уведомление пользователю в DM")
+            async def dm_failed():
+                await ctx.send("⚠️ Не удалось отправить уведомление пользователю в DM")
+            
+            self.bot.notifications.notify(member.id, dm_embed, on_failed=dm_failed)
+        except Exception as e:
+            print(f"Error queueing warning DM: {e}")
     
     @commands.command(name='unwarn')
     @is_admin_or_whitelisted()
     async def unwarn_user(self, ctx, warning_id: int, *, reason: str = "Снят модератором"):
         """Снять выговор по ID. Формат: !unwarn ID [причина]"""
         
-        # Получаем информацию о выговоре
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, warned_by, reason, is_active
-            FROM warnings
-            WHERE id = ?
-        ''', (warning_id,))
-        
-        warning_data = cursor.fetchone()
-        conn.close()
+        # Получаем информацию о выговоре (только этого сервера)
+        warning_data = self.db.warnings_repo.get_warning(ctx.guild.id, warning_id)
         
         if not warning_data:
             await ctx.send(f"❌ Выговор с ID `{warning_id}` не найден")
@@ -442,9 +463,9 @@ class WarningSystem(commands.Cog):
                         inline=False
                     )
                     
-                    await member.send(embed=dm_embed)
-                except:
-                    pass
+                    self.bot.notifications.notify(member.id, dm_embed)
+                except Exception as e:
+                    print(f"Error queueing unwarn DM: {e}")
         else:
             await ctx.send(f"❌ Не удалось снять выговор `{warning_id}`")
     
@@ -471,8 +492,8 @@ class WarningSystem(commands.Cog):
                 await ctx.send(f"✅ У {target.mention} нет выговоров!")
             return
         
-        # Считаем активные
-        active_count = sum(1 for w in warnings if (len(w) == 5 or w[5] == 1))
+        # Счётчики - из warning_counters
+        active_count, total_count = self.get_warning_counts(ctx.guild.id, target.id)
         
         embed = discord.Embed(
             title=f"📋 Выговоры пользователя",
@@ -485,7 +506,7 @@ class WarningSystem(commands.Cog):
         
         embed.add_field(
             name="📊 Статус",
-            value=f"**Активных:** {active_count}/3\n**Всего:** {len(warnings)}",
+            value=f"**Активных:** {active_count}/3\n**Всего:** {total_count}",
             inline=False
         )
         
@@ -540,7 +561,7 @@ class WarningSystem(commands.Cog):
     async def warnings_list(self, ctx):
         """Список всех пользователей с выговорами на сервере"""
         
-        warnings_data = self.get_all_warnings(ctx.guild.id, active_only=True)
+        warnings_data = self.get_all_warnings(ctx.guild.id)
         
         if not warnings_data:
             await ctx.send("✅ На сервере нет пользователей с активными выговорами!")
@@ -603,35 +624,12 @@ class WarningSystem(commands.Cog):
     async def warnings_active_stats(self, ctx):
         """Статистика активных выговоров на сервере"""
         
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        # Общая статистика
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                COUNT(DISTINCT user_id) as unique_users
-            FROM warnings
-            WHERE guild_id = ? AND is_active = 1
-        ''', (ctx.guild.id,))
-        
-        stats = cursor.fetchone()
-        total_warnings, unique_users = stats
+        summary = self.db.warnings_repo.summary(ctx.guild.id)
+        total_warnings = summary['active_warnings']
+        unique_users = summary['active_users']
         
         # Топ нарушителей
-        cursor.execute('''
-            SELECT user_id, COUNT(*) as warning_count
-            FROM warnings
-            WHERE guild_id = ? AND is_active = 1
-            GROUP BY user_id
-            ORDER BY warning_count DESC
-            LIMIT 100
-        ''', (ctx.guild.id,))
-        
-        top_offenders = cursor.fetchall()
-        
-        conn.close()
+        top_offenders = self.db.warnings_repo.active_users(ctx.guild.id)[:100]
         
         embed = discord.Embed(
             title="📊 Статистика активных выговоров сервера",
@@ -668,48 +666,12 @@ class WarningSystem(commands.Cog):
     async def warnings_all_stats(self, ctx):
         """Полная статистика выговоров на сервере"""
         
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        
-        # Общая статистика
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active,
-                COUNT(DISTINCT user_id) as unique_users
-            FROM warnings
-            WHERE guild_id = ?
-        ''', (ctx.guild.id,))
-        
-        stats = cursor.fetchone()
-        total_warnings, active_warnings, unique_users = stats
-        
-        # Топ нарушителей (всего)
-        cursor.execute('''
-            SELECT user_id, COUNT(*) as total_count
-            FROM warnings
-            WHERE guild_id = ?
-            GROUP BY user_id
-            ORDER BY total_count DESC
-            LIMIT 5
-        ''', (ctx.guild.id,))
-        
-        top_offenders = cursor.fetchall()
-        
-        # Топ модераторов
-        cursor.execute('''
-            SELECT warned_by, COUNT(*) as warnings_given
-            FROM warnings
-            WHERE guild_id = ?
-            GROUP BY warned_by
-            ORDER BY warnings_given DESC
-            LIMIT 5
-        ''', (ctx.guild.id,))
-        
-        top_moderators = cursor.fetchall()
-        
-        conn.close()
+        summary = self.db.warnings_repo.summary(ctx.guild.id)
+        total_warnings = summary['total_warnings']
+        active_warnings = summary['active_warnings']
+        unique_users = summary['unique_users']
+        top_offenders = summary['top_total']
+        top_moderators = summary['top_moderators']
         
         embed = discord.Embed(
             title="📊 Статистика выговоров сервера",
@@ -0,0 +1,101 @@
+import io
+import json
+
+# pyarrow - опциональная зависимость: без него API отдаёт только JSON
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# ?format=... -> MIME тип ответа
+COLUMNAR_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+# ========================================
+# СХЕМЫ
+# ========================================
+
+def users_stats_schema():
+    """Колонки /users-stats (поля записей build_users_stats)"""
+    return pa.schema([
+        ('user_id', pa.int64()),
+        ('username', pa.string()),
+        ('display_name', pa.string()),
+        ('avatar', pa.string()),
+        ('roles', pa.list_(pa.int64())),
+        ('total_messages', pa.int64()),
+        ('total_voice_time', pa.int64()),
+        ('period_messages', pa.int64()),
+        ('period_voice_time', pa.int64()),
+    ])
+
+
+def members_schema():
+    """Колонки /members (поля записей build_members)"""
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('display_name', pa.string()),
+        ('avatar', pa.string()),
+        ('bot', pa.bool_()),
+        ('roles', pa.list_(pa.int64())),
+    ])
+
+
+# ========================================
+# СЕРИАЛИЗАЦИЯ
+# ========================================
+
+def records_to_table(records: list, schema, metadata: dict = None):
+    """
+    Список dict -> pyarrow.Table по колонкам схемы.
+    metadata (total_count, фильтры и т.п.) кладётся в метаданные схемы как JSON.
+    """
+    columns = [
+        pa.array([record.get(field.name) for record in records], type=field.type)
+        for field in schema
+    ]
+    table = pa.Table.from_arrays(columns, schema=schema)
+    if metadata:
+        table = table.replace_schema_metadata({
+            key: json.dumps(value, ensure_ascii=False) for key, value in metadata.items()
+        })
+    return table
+
+
+def serialize_table(table, fmt: str) -> bytes:
+    """Таблица в Arrow IPC stream или Parquet"""
+    sink = io.BytesIO()
+    if fmt == 'parquet':
+        pq.write_table(table, sink, compression='snappy')
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode_records(records: list, schema, fmt: str, metadata: dict = None) -> bytes:
+    """Записи в колоночный формат одним вызовом"""
+    return serialize_table(records_to_table(records, schema, metadata), fmt)
+
+
+def read_table(data: bytes, fmt: str = 'arrow'):
+    """Обратное преобразование (для клиентов: dashboard, админ-панель)"""
+    if fmt == 'parquet':
+        return pq.read_table(io.BytesIO(data))
+    return pa.ipc.open_stream(data).read_all()
+
+
+def table_metadata(table) -> dict:
+    """Метаданные, записанные records_to_table"""
+    raw = table.schema.metadata or {}
+    return {key.decode(): json.loads(value) for key, value in raw.items()}
@@ -5,6 +5,8 @@ load_dotenv()
 
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 DISCORD_PREFIX = os.getenv('DISCORD_PREFIX', '!')
+# Часовой пояс для почасовой активности в /panel (UTC+N)
+ACTIVITY_TZ_OFFSET = int(os.getenv('ACTIVITY_TZ_OFFSET', '3'))
 
 if not DISCORD_TOKEN:
     raise ValueError("DISCORD_TOKEN не установлен в файле .env")
@@ -5,9 +5,23 @@ import plotly.express as px
 import plotly.graph_objects as go
 from urllib.parse import urlencode
 import os
+import sys
+import json
+import time
+import threading
+from collections import deque
 from dotenv import load_dotenv
 from datetime import datetime, date
 
+# pyarrow опционален: с ним таблицы приходят в Arrow IPC, без него - JSON
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_client import BotAPIClient
+
 load_dotenv()
 
 # Конфигурация Discord OAuth
@@ -16,8 +30,24 @@ DISCORD_CLIENT_SECRET = os.getenv("DISCORD_CLIENT_SECRET", "YOUR_CLIENT_SECRET")
 DISCORD_REDIRECT_URI = os.getenv("DISCORD_REDIRECT_URI", "http://localhost:8501")
 BOT_API_URL = "http://localhost:5555/api"
 
+# Бот хранит дневную активность 30 дней (DAILY_RETENTION_DAYS) - период графиков не больше
+TS_RETENTION_DAYS = 30
+# Снимок небольших секций сервера; таблица участников между загрузками дополняется live-дельтами
+OVERVIEW_TTL = 30
+# SSE соединение сервера закрывается, если его страница не открыта LIVE_FEED_IDLE_SECONDS
+LIVE_FEED_IDLE_SECONDS = 120
+
 st.set_page_config(page_title="GuildBrew Dashboard", page_icon="📊", layout="wide")
 
+
+@st.cache_resource
+def get_api_client():
+    """Общий для всех сессий клиент API бота (пул соединений, кэш, параллельная загрузка)"""
+    return BotAPIClient(BOT_API_URL)
+
+
+api = get_api_client()
+
 # ==================== DISCORD OAUTH ====================
 
 def get_discord_auth_url():
@@ -54,9 +84,9 @@ def get_user_info(access_token):
 def get_guild_branding(guild_id):
     """Получает настройки брендинга сервера"""
     try:
-        response = requests.get(f"{BOT_API_URL}/admin/guild/{guild_id}/settings", timeout=5)
-        if response.status_code == 200:
-            return response.json()
+        status, data = api.get_json(f"/admin/guild/{guild_id}/settings", ttl=60, timeout=5)
+        if status == 200:
+            return data
         return {}
     except:
         return {}
@@ -64,9 +94,8 @@ def get_guild_branding(guild_id):
 def get_user_whitelisted_guilds(user_id):
     """Получает серверы где пользователь в whitelist"""
     try:
-        response = requests.get(f"{BOT_API_URL}/user/guilds/{user_id}", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
+        status, data = api.get_json(f"/user/guilds/{user_id}", ttl=60, timeout=5)
+        if status == 200:
             return data.get('guilds', [])
         return []
     except:
@@ -183,73 +212,315 @@ if not whitelisted_guilds:
 
 # ==================== КЭШИРОВАНИЕ ДАННЫХ ====================
 
-@st.cache_data(ttl=30)
-def get_guild_members(guild_id):
+EMPTY_OVERVIEW = {
+    'generated_ts': 0,  # нет снимка - live-события не с чем сравнивать
+    'roles': [],
+    'inactive': {'inactive_user_ids': [], 'total_members': 0, 'active_members': 0, 'inactive_members': 0},
+    'warnings': {'total_warnings': 0, 'active_warnings': 0, 'unique_users': 0, 'top_offenders': []}
+}
+
+
+def get_guild_overview(guild_id, include_roles=(), exclude_roles=(), since_date=None, sort_by='voice',
+                       days=7, activity_type='both', sections=('roles', 'inactive', 'warnings')):
+    """
+    Небольшие секции страницы одним запросом (один снимок сервера на стороне бота).
+    Большие таблицы (участники, статистика) грузятся отдельно в колоночном формате.
+    """
+    try:
+        params = {
+            'sections': ','.join(sections),
+            'include_roles': list(include_roles),
+            'exclude_roles': list(exclude_roles),
+            'sort_by': sort_by or 'voice',
+            'days': days,
+            'activity_type': activity_type
+        }
+        if since_date:
+            params['since_date'] = since_date.strftime('%Y-%m-%d')
+
+        status, data = api.get_json(f"/guild/{guild_id}/overview", params=params, ttl=OVERVIEW_TTL)
+        if status == 200:
+            return {**EMPTY_OVERVIEW, **data}
+        return dict(EMPTY_OVERVIEW)
+    except:
+        return dict(EMPTY_OVERVIEW)
+
+
+USERS_STATS_COLUMNS = [
+    'user_id', 'username', 'display_name', 'avatar', 'roles',
+    'total_messages', 'total_voice_time', 'period_messages', 'period_voice_time'
+]
+MEMBERS_COLUMNS = ['id', 'name', 'display_name', 'avatar', 'bot', 'roles']
+
+
+def fetch_frame(path, params, columns, records_key=None):
+    """
+    DataFrame с API бота. При наличии pyarrow таблица приходит в Arrow IPC
+    и собирается в pandas без JSON декодирования и построчного создания DataFrame.
+    Если у бота нет pyarrow (400) - обычный JSON.
+
+    Returns:
+        (DataFrame, метаданные ответа: total_count, пагинация, итоги...)
+    """
+    empty = (pd.DataFrame(columns=columns), {})
+
+    if pa is not None:
+        response = api.get(path, params={**params, 'format': 'arrow'})
+        if response.status_code == 200:
+            table = pa.ipc.open_stream(response.content).read_all()
+            meta = {k.decode(): json.loads(v) for k, v in (table.schema.metadata or {}).items()}
+            return table.to_pandas(), meta
+        if response.status_code != 400:
+            return empty
+
+    response = api.get(path, params=params)
+    if response.status_code != 200:
+        return empty
+    data = response.json()
+    if records_key is None:
+        return pd.DataFrame(data, columns=columns), {}
+    meta = {k: v for k, v in data.items() if k != records_key}
+    return pd.DataFrame(data.get(records_key, []), columns=columns), meta
+
+
+def cached_frame(path, params, columns, records_key=None, ttl=300):
+    """fetch_frame через общий кэш клиента (пустые ответы не кэшируются)"""
+    key = ('frame', path, tuple(sorted((k, str(v)) for k, v in params.items())))
+    frame, meta = api.cached(key, lambda: fetch_frame(path, params, columns, records_key), ttl)
+    if frame.empty:
+        api.invalidate(key)
+    return frame, meta
+
+
+def get_users_stats_frame(guild_id, include_roles=(), exclude_roles=(), since_date=None, sort_by='voice',
+                          order='desc', search='', page=1, per_page=None):
+    """
+    Статистика участников с фильтрами. Сортировка, поиск и пагинация - на стороне бота,
+    с per_page приходит только запрошенная страница.
+
+    Returns:
+        (DataFrame, метаданные: total_count, page, pages, summary)
+    """
     try:
-        response = requests.get(f"{BOT_API_URL}/guild/{guild_id}/members", timeout=5)
-        members = response.json()
-        return {m['id']: m for m in members if not m.get('bot', False)}
+        params = {
+            'include_roles': list(include_roles),
+            'exclude_roles': list(exclude_roles),
+            'sort_by': sort_by or 'voice',
+            'order': order
+        }
+        if since_date:
+            params['since_date'] = since_date.strftime('%Y-%m-%d')
+        if search:
+            params['search'] = search
+        if per_page:
+            params['page'] = page
+            params['per_page'] = per_page
+        return cached_frame(f"/guild/{guild_id}/users-stats", params, USERS_STATS_COLUMNS, records_key='users')
     except:
-        return {}
+        return pd.DataFrame(columns=USERS_STATS_COLUMNS), {}
 
-@st.cache_data(ttl=60)
-def get_inactive_users(guild_id, days, activity_type='both'):
+
+def get_members_frame(guild_id):
+    """Участники сервера"""
+    try:
+        return cached_frame(f"/guild/{guild_id}/members", {}, MEMBERS_COLUMNS)[0]
+    except:
+        return pd.DataFrame(columns=MEMBERS_COLUMNS)
+
+
+class LiveFeed:
+    """
+    Фоновый читатель SSE потока событий сервера.
+    Один на процесс dashboard и сервер (общий для всех сессий) - бот держит
+    одно соединение, а страницы применяют накопленные дельты к своим данным.
+    Если страницу сервера никто не открывал LIVE_FEED_IDLE_SECONDS, соединение
+    закрывается и освобождает поток API бота.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=2000)
+        self.connected = False
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.resync_ts = 0.0  # когда бот попросил перечитать данные целиком
+        self.settings_ts = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.last_used > LIVE_FEED_IDLE_SECONDS
+
+    def _run(self):
+        url = f"{BOT_API_URL}/guild/{self.guild_id}/events"
+        while not self.idle:
+            try:
+                with requests.get(url, stream=True, timeout=(5, 60)) as response:
+                    if response.status_code != 200:
+                        raise ConnectionError(f"status {response.status_code}")
+                    self.connected = True
+                    data_lines = []
+                    # Бот шлёт heartbeat каждые 15 секунд - простой проверяем на каждой строке
+                    for line in response.iter_lines(decode_unicode=True):
+                        if self.idle:
+                            break
+                        if line is None:
+                            continue
+                        if line == '':
+                            if data_lines:
+                                self._apply(json.loads('\n'.join(data_lines)))
+                                data_lines = []
+                        elif line.startswith('data:'):
+                            data_lines.append(line[5:].strip())
+            except Exception:
+                pass
+            self.connected = False
+            if not self.idle:
+                time.sleep(3)
+        self.closed = True
+
+    def _apply(self, event):
+        with self.lock:
+            if event['type'] == 'resync':
+                self.resync_ts = event['ts']
+            elif event['type'] == 'settings_changed':
+                self.settings_ts = event['ts']
+            self.events.append(event)
+
+    def since(self, ts):
+        """События после момента ts (время снимка данных на странице)"""
+        with self.lock:
+            return [e for e in self.events if e['ts'] > ts]
+
+
+class LiveFeeds:
+    """LiveFeed по серверам; закрытый по простою создаётся заново при следующем открытии"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.feeds = {}
+
+    def get(self, guild_id):
+        with self.lock:
+            feed = self.feeds.get(guild_id)
+            if feed is None or feed.closed or feed.idle:
+                self.feeds = {g: f for g, f in self.feeds.items() if not f.closed}
+                feed = self.feeds[guild_id] = LiveFeed(guild_id)
+            feed.touch()
+            return feed
+
+
+@st.cache_resource
+def get_live_feeds():
+    return LiveFeeds()
+
+
+def get_live_feed(guild_id):
+    """Фоновый поток событий сервера (отмечает, что страница сервера открыта)"""
+    return get_live_feeds().get(guild_id)
+
+
+def summarize_live_events(events):
+    """Свести события в дельты: сообщения по пользователям, войс, выговоры"""
+    summary = {'messages': {}, 'messages_total': 0, 'voice': {}, 'warnings_delta': 0, 'recent': []}
+    for event in events:
+        event_type = event['type']
+        if event_type == 'messages':
+            summary['messages_total'] += event.get('total', 0)
+            for user_id, count in event.get('counts', {}).items():
+                summary['messages'][int(user_id)] = summary['messages'].get(int(user_id), 0) + count
+            continue
+        if event_type == 'voice_join':
+            summary['voice'][event['user_id']] = True
+        elif event_type == 'voice_leave':
+            summary['voice'][event['user_id']] = False
+        elif event_type == 'warning_issued':
+            summary['warnings_delta'] += 1
+        elif event_type in ('warning_removed', 'warning_expired'):
+            summary['warnings_delta'] -= 1
+        summary['recent'].append(event)
+    return summary
+
+
+def get_timeseries(guild_id, days=TS_RETENTION_DAYS, granularity='day', roles=()):
+    """Активность по дням/неделям (агрегирована и прорежена ботом)"""
     try:
-        response = requests.get(f"{BOT_API_URL}/guild/{guild_id}/inactive/{days}/{activity_type}", timeout=5)
-        return response.json()
+        params = {'days': days, 'granularity': granularity, 'roles': list(roles)}
+        status, data = api.get_json(f"/guild/{guild_id}/timeseries", params=params)
+        if status == 200:
+            return data
+        return None
     except:
-        return {'inactive_user_ids': [], 'total_members': 0, 'active_members': 0, 'inactive_members': 0}
+        return None
+
 
-@st.cache_data(ttl=60)
-def get_warnings(guild_id):
+def get_distribution(guild_id, include_roles=(), exclude_roles=(), since_date=None):
+    """Сводка распределений активности (гистограммы, перцентили, Джини) - считает бот"""
     try:
-        response = requests.get(f"{BOT_API_URL}/guild/{guild_id}/warnings", timeout=5)
-        return response.json()
+        params = {
+            'include_roles': list(include_roles),
+            'exclude_roles': list(exclude_roles),
+            'metrics': 'total_messages,total_voice_time',
+            'bins': 20,
+            'scale': 'log'
+        }
+        if since_date:
+            params['since_date'] = since_date.strftime('%Y-%m-%d')
+        status, data = api.get_json(f"/guild/{guild_id}/distribution", params=params)
+        if status == 200:
+            return data
+        return None
     except:
-        return {'total_warnings': 0, 'active_warnings': 0, 'unique_users': 0, 'top_offenders': []}
+        return None
+
 
-@st.cache_data(ttl=300)
-def get_guild_roles(guild_id):
+def bin_labels(edges, scale=1, digits=0):
+    """Подписи бинов гистограммы: 'от–до'"""
+    return [f"{edges[i] / scale:.{digits}f}–{edges[i + 1] / scale:.{digits}f}" for i in range(len(edges) - 1)]
+
+
+def get_activity_hours(guild_id, series='messages', tz=3):
+    """Активность по часам суток за 30 дней (кольцевые буферы бота)"""
     try:
-        response = requests.get(f"{BOT_API_URL}/guild/{guild_id}/roles", timeout=5)
-        return response.json()
+        status, data = api.get_json(
+            f"/guild/{guild_id}/activity-hours", params={'series': series, 'tz': tz}, ttl=60
+        )
+        if status == 200:
+            return data
+        return None
     except:
-        return []
+        return None
 
 
-def get_users_stats(guild_id, include_roles=None, exclude_roles=None, since_date=None, sort_by='voice'):
-    """Получает статистику всех пользователей с фильтрами"""
+def get_export_csv(guild_id, include_roles=None, exclude_roles=None, since_date=None,
+                   sort_by='voice', order='desc'):
+    """
+    Скачивает CSV экспорт, который бот формирует потоково (тот же формат, что и !gb_export).
+    Вызывается только по кнопке - полный экспорт сервера не грузится вместе со страницей.
+    """
     try:
-        params = {}
-        if include_roles:
-            for role_id in include_roles:
-                params.setdefault('include_roles', []).append(role_id)
-        if exclude_roles:
-            for role_id in exclude_roles:
-                params.setdefault('exclude_roles', []).append(role_id)
+        params = {
+            'format': 'csv',
+            'members_only': 1,
+            'sort_by': sort_by or 'voice',
+            'order': order or 'desc',
+            'include_roles': include_roles or [],
+            'exclude_roles': exclude_roles or [],
+        }
         if since_date:
             params['since_date'] = since_date.strftime('%Y-%m-%d')
-        if sort_by:
-            params['sort_by'] = sort_by
-
-        # Build URL with repeated params for lists
-        url = f"{BOT_API_URL}/guild/{guild_id}/users-stats"
-        if params:
-            param_parts = []
-            for key, value in params.items():
-                if isinstance(value, list):
-                    for v in value:
-                        param_parts.append(f"{key}={v}")
-                else:
-                    param_parts.append(f"{key}={value}")
-            url += "?" + "&".join(param_parts)
-
-        response = requests.get(url, timeout=30)
-        if response.status_code == 200:
-            return response.json()
-        return {'users': [], 'total_count': 0}
+
+        with api.get(f"/guild/{guild_id}/export", params=params, timeout=60, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            return b''.join(response.iter_content(chunk_size=64 * 1024))
     except:
-        return {'users': [], 'total_count': 0}
+        return None
 
 
 def format_voice_time(seconds):
@@ -262,13 +533,32 @@ def format_voice_time(seconds):
         return f"{hours}ч {minutes}м"
     return f"{minutes}м"
 
-def make_discord_link(user_id, members_cache):
-    member = members_cache.get(user_id)
-    if member:
-        name = member['display_name']
-        avatar = member.get('avatar') or 'https://cdn.discordapp.com/embed/avatars/0.png'
-        return f'<img src="{avatar}" width="24" style="border-radius:50%; vertical-align:middle; margin-right:8px;"><a href="https://discord.com/users/{user_id}" target="_blank" style="text-decoration:none; color:#5865F2; font-weight:500;">{name}</a>'
-    return f'<a href="https://discord.com/users/{user_id}" target="_blank" style="color:#5865F2;">User {user_id}</a>'
+DEFAULT_AVATAR = 'https://cdn.discordapp.com/embed/avatars/0.png'
+
+# Колонки таблиц: аватар картинкой, ссылка на профиль Discord
+USER_COLUMN_CONFIG = {
+    'Аватар': st.column_config.ImageColumn('', width='small'),
+    'Профиль': st.column_config.LinkColumn('Профиль', display_text='🌐 Открыть', width='small'),
+}
+
+
+def user_columns(user_ids, members_cache):
+    """Колонки Аватар / Пользователь / Профиль для списка ID (st.dataframe + USER_COLUMN_CONFIG)"""
+    avatars, names = [], []
+    for user_id in user_ids:
+        member = members_cache.get(user_id)
+        avatars.append((member.get('avatar') if member else None) or DEFAULT_AVATAR)
+        names.append(member['display_name'] if member else f'User {user_id}')
+    return {
+        'Аватар': avatars,
+        'Пользователь': names,
+        'Профиль': [f"https://discord.com/users/{user_id}" for user_id in user_ids]
+    }
+
+
+def reset_stats_page():
+    """Фильтры/поиск/сортировка изменились - возвращаемся на первую страницу"""
+    st.session_state.stats_page = 1
 
 # ==================== ВЫБОР СЕРВЕРА ====================
 
@@ -279,11 +569,58 @@ guild = st.sidebar.selectbox(
 )
 
 guild_id = guild['id']
-members_cache = get_guild_members(guild_id)
+
+# Данные табов грузятся параллельно (время = самый медленный запрос);
+# значения фильтров берём из session_state (виджеты ниже)
+stats_filters = {
+    'include_roles': tuple(st.session_state.get('stats_include_roles') or ()),
+    'exclude_roles': tuple(st.session_state.get('stats_exclude_roles') or ()),
+    'since_date': st.session_state.get('stats_since_date'),
+    'sort_by': st.session_state.get('stats_sort_by', 'voice')
+}
+stats_page = {
+    'order': st.session_state.get('stats_order', 'desc'),
+    'search': st.session_state.get('stats_search', ''),
+    'page': st.session_state.get('stats_page', 1),
+    'per_page': st.session_state.get('stats_per_page', 50)
+}
+timeseries_filters = {
+    'days': st.session_state.get('ts_days', TS_RETENTION_DAYS),
+    'granularity': st.session_state.get('ts_granularity', 'day'),
+    'roles': tuple(st.session_state.get('ts_roles') or ())
+}
+heatmap_filters = {
+    'series': st.session_state.get('heatmap_series', 'messages'),
+    'tz': st.session_state.get('heatmap_tz', 3)
+}
+inactive_filters = {
+    'days': st.session_state.get('inactive_days', 7),
+    'activity_type': st.session_state.get('activity_type', 'both')
+}
+# Загрузчики выполняются в потоках клиента - session_state в них не читаем
+page_data = api.fetch_all({
+    'overview': lambda: get_guild_overview(guild_id, **inactive_filters),
+    'users': lambda: get_users_stats_frame(guild_id, **stats_filters, **stats_page),
+    'distribution': lambda: get_distribution(
+        guild_id,
+        include_roles=stats_filters['include_roles'],
+        exclude_roles=stats_filters['exclude_roles'],
+        since_date=stats_filters['since_date']
+    ),
+    'members': lambda: get_members_frame(guild_id),
+    'branding': lambda: get_guild_branding(guild_id),
+    'timeseries': lambda: get_timeseries(guild_id, **timeseries_filters),
+    'activity_hours': lambda: get_activity_hours(guild_id, **heatmap_filters),
+})
+overview = page_data['overview']
+users_df, users_meta = page_data['users']
+members_df = page_data['members']
+humans_df = members_df[~members_df['bot'].astype(bool)]
+members_cache = dict(zip(humans_df['id'], humans_df.to_dict('records')))
 
 # ==================== БРЕНДИНГ ====================
 
-branding = get_guild_branding(guild_id)
+branding = page_data['branding']
 bot_name = branding.get('bot_name', 'GuildBrew')
 
 # ==================== HEADER ====================
@@ -317,6 +654,53 @@ if st.sidebar.button("🚪 Выйти", use_container_width=True, type="primary"
 
 # ==================== ТАБЫ ====================
 
+# ==================== LIVE ====================
+
+overview_ts = overview.get('generated_ts', 0)
+
+EVENT_LABELS = {
+    'voice_join': '🎤 зашёл в войс',
+    'voice_leave': '🔇 вышел из войса',
+    'warning_issued': '⚠️ получил выговор',
+    'warning_removed': '✅ выговор снят',
+    'warning_expired': '⌛ выговор истёк',
+    'settings_changed': '⚙️ настройки изменены',
+}
+
+
+@st.fragment(run_every=5)
+def live_panel():
+    """Live-дельты поверх загруженного снимка (без повторной загрузки данных)"""
+    live_feed = get_live_feed(guild_id)
+    # Бот попросил перечитать всё (подписчик отстал) или поменялись настройки.
+    # Без снимка (бот не ответил) сравнивать не с чем - иначе перезагрузка на каждом цикле
+    if overview_ts and max(live_feed.resync_ts, live_feed.settings_ts) > overview_ts:
+        api.invalidate(prefix=f"/guild/{guild_id}/")
+        api.invalidate(prefix=f"/admin/guild/{guild_id}/")
+        st.rerun()
+
+    summary = summarize_live_events(live_feed.since(overview_ts))
+
+    with st.expander(f"🔴 Live {'(подключено)' if live_feed.connected else '(переподключение...)'}", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("💬 Новых сообщений", summary['messages_total'])
+        col2.metric("🎤 Зашли в войс", sum(1 for joined in summary['voice'].values() if joined))
+        col3.metric("⚠️ Изменение активных выговоров", f"{summary['warnings_delta']:+d}")
+
+        if summary['messages']:
+            top_writers = sorted(summary['messages'].items(), key=lambda x: x[1], reverse=True)[:5]
+            st.markdown("**Самые активные сейчас:** " + ", ".join(
+                f"{members_cache.get(uid, {}).get('display_name', uid)} (+{count})" for uid, count in top_writers
+            ))
+
+        for event in reversed(summary['recent'][-10:]):
+            name = members_cache.get(event.get('user_id'), {}).get('display_name', event.get('user_id', ''))
+            when = datetime.fromtimestamp(event['ts']).strftime('%H:%M:%S')
+            st.caption(f"{when} • {name} {EVENT_LABELS.get(event['type'], event['type'])}")
+
+
+live_panel()
+
 tab1, tab2, tab3, tab4 = st.tabs(["📊 Пользователи", "😴 Неактивные", "⚠️ Выговоры", "📈 Графики"])
 
 # ==================== ТАБ 1: ПОЛЬЗОВАТЕЛИ ====================
@@ -324,7 +708,7 @@ with tab1:
     st.header("📊 Статистика пользователей")
 
     # Получаем роли сервера для фильтров
-    roles = get_guild_roles(guild_id)
+    roles = overview['roles']
     role_options = {r['id']: r['name'] for r in roles}
 
     # Фильтры в колонках
@@ -337,7 +721,8 @@ with tab1:
             options=list(role_options.keys()),
             format_func=lambda x: role_options.get(x, str(x)),
             help="Показать только пользователей с выбранными ролями (любая из)",
-            key="stats_include_roles"
+            key="stats_include_roles",
+            on_change=reset_stats_page
         )
 
     with filter_col2:
@@ -346,7 +731,8 @@ with tab1:
             options=list(role_options.keys()),
             format_func=lambda x: role_options.get(x, str(x)),
             help="Скрыть пользователей с выбранными ролями",
-            key="stats_exclude_roles"
+            key="stats_exclude_roles",
+            on_change=reset_stats_page
         )
 
     with filter_col3:
@@ -354,117 +740,154 @@ with tab1:
             "📅 Показать активность с",
             value=None,
             help="Если не указано - показывает всю статистику",
-            key="stats_since_date"
+            key="stats_since_date",
+            on_change=reset_stats_page
         )
 
-    # Вторая строка фильтров
-    filter_col4, filter_col5 = st.columns([1, 3])
+    # Вторая строка: поиск, сортировка, размер страницы
+    filter_col4, filter_col5, filter_col6, filter_col7 = st.columns([2, 1, 1, 1])
 
     with filter_col4:
-        sort_options = {'voice': '🎤 По времени в войсе', 'messages': '💬 По сообщениям'}
+        st.text_input(
+            "🔎 Поиск",
+            placeholder="Имя, username или ID",
+            key="stats_search",
+            on_change=reset_stats_page
+        )
+
+    with filter_col5:
+        sort_options = {
+            'voice': '🎤 По времени в войсе',
+            'messages': '💬 По сообщениям',
+            'total_voice': '🎤 По войсу за всё время',
+            'total_messages': '💬 По сообщениям за всё время',
+            'name': '🔤 По имени'
+        }
         sort_by = st.selectbox(
             "📊 Сортировка",
             options=list(sort_options.keys()),
             format_func=lambda x: sort_options[x],
             help="Выберите по какому параметру сортировать список",
-            key="stats_sort_by"
+            key="stats_sort_by",
+            on_change=reset_stats_page
         )
 
-    st.markdown("---")
+    with filter_col6:
+        st.selectbox(
+            "↕️ Порядок",
+            options=['desc', 'asc'],
+            format_func=lambda x: 'По убыванию' if x == 'desc' else 'По возрастанию',
+            key="stats_order",
+            on_change=reset_stats_page
+        )
 
-    # Получаем данные
-    stats_data = get_users_stats(
-        guild_id,
-        include_roles=include_roles if include_roles else None,
-        exclude_roles=exclude_roles if exclude_roles else None,
-        since_date=since_date if since_date else None,
-        sort_by=sort_by
-    )
+    with filter_col7:
+        st.selectbox(
+            "📄 На странице",
+            options=[25, 50, 100, 250],
+            index=1,
+            key="stats_per_page",
+            on_change=reset_stats_page
+        )
+
+    st.markdown("---")
 
-    users = stats_data.get('users', [])
-    total_count = stats_data.get('total_count', 0)
+    # Итоги по всей выборке считает бот, таблица - только текущая страница
+    total_count = users_meta.get('total_count', 0)
+    summary = users_meta.get('summary', {})
 
     # Метрики
-    if users:
+    if total_count:
         col1, col2, col3, col4 = st.columns(4)
-        total_messages = sum(u.get('period_messages', 0) for u in users)
-        total_voice_hours = sum(u.get('period_voice_time', 0) for u in users) / 3600
-        active_msg_users = len([u for u in users if u.get('period_messages', 0) > 0])
-        active_voice_users = len([u for u in users if u.get('period_voice_time', 0) > 0])
-
         col1.metric("👥 Всего пользователей", total_count)
-        col2.metric("💬 Всего сообщений", f"{total_messages:,}")
-        col3.metric("🎤 Часов в войсе", f"{total_voice_hours:.1f}")
-        col4.metric("✅ Активных (чат/войс)", f"{active_msg_users}/{active_voice_users}")
+        col2.metric("💬 Всего сообщений", f"{summary.get('period_messages', 0):,}")
+        col3.metric("🎤 Часов в войсе", f"{summary.get('period_voice_time', 0) / 3600:.1f}")
+        col4.metric("✅ Активных (чат/войс)", f"{summary.get('active_messages', 0)}/{summary.get('active_voice', 0)}")
 
     st.markdown(f"**Найдено пользователей:** {total_count}")
 
-    if users:
-        # Подготавливаем данные для таблицы
-        table_data = []
-        for i, user in enumerate(users, 1):
-            user_id = user.get('user_id')
-            display_name = user.get('display_name') or user.get('username', 'Unknown')
-            username = user.get('username', 'unknown')
-
-            # Ссылки на профиль: 💬 = приложение Discord, 🌐 = веб
-            discord_links = f'<a href="discord://-/users/{user_id}" title="Открыть в приложении">💬</a> <a href="https://discord.com/users/{user_id}" target="_blank" title="Открыть в браузере">🌐</a>'
-
-            table_data.append({
-                '#': i,
-                'Пользователь': f'{display_name} {discord_links}',
-                'Username': f"@{username}",
-                'Сообщений': user.get('period_messages', 0),
-                'Время в войсе': format_voice_time(user.get('period_voice_time', 0)),
-                'Всего сообщений': user.get('total_messages', 0),
-                'Всего в войсе': format_voice_time(user.get('total_voice_time', 0)),
-                'user_id': user_id,
-                'display_name_raw': display_name
-            })
-
-        df = pd.DataFrame(table_data)
-
-        # Стили для таблицы
-        st.markdown("""
-        <style>
-        .stats-table { width: 100%; border-collapse: collapse; }
-        .stats-table th { background: #262730; padding: 10px; text-align: left; border-bottom: 2px solid #4a4a5a; }
-        .stats-table td { padding: 8px 10px; border-bottom: 1px solid #3a3a4a; }
-        .stats-table tr:hover { background: #2a2a3a; }
-        .stats-table a { text-decoration: none; margin: 0 2px; }
-        </style>
-        """, unsafe_allow_html=True)
+    if total_count:
+        pages = users_meta.get('pages', 1)
+        page = users_meta.get('page', 1)
+        per_page = users_meta.get('per_page') or len(users_df)
+        # Бот мог ограничить номер страницы (выборка стала меньше)
+        st.session_state.stats_page = page
+
+        offset = (page - 1) * per_page
+        display_names = users_df['display_name'].fillna(users_df['username']).fillna('Unknown')
+
+        page_df = pd.DataFrame({
+            '#': range(offset + 1, offset + len(users_df) + 1),
+            'Аватар': users_df['avatar'].fillna(DEFAULT_AVATAR),
+            'Пользователь': display_names,
+            'Профиль': 'https://discord.com/users/' + users_df['user_id'].astype(str),
+            'Username': '@' + users_df['username'].fillna('unknown'),
+            'Сообщений': users_df['period_messages'],
+            'Часов в войсе': users_df['period_voice_time'] / 3600,
+            'Всего сообщений': users_df['total_messages'],
+            'Всего часов в войсе': users_df['total_voice_time'] / 3600
+        })
+
+        users_ts = users_meta.get('generated_ts', 0)
+
+        @st.fragment(run_every=5)
+        def users_table():
+            """Страница таблицы + сообщения из live-потока после снимка (порядок строк - как в снимке)"""
+            table = page_df
+            if users_ts:
+                deltas = summarize_live_events(get_live_feed(guild_id).since(users_ts))['messages']
+                if deltas:
+                    new_messages = users_df['user_id'].map(deltas).fillna(0).astype(int)
+                    table = page_df.assign(**{
+                        'Сообщений': page_df['Сообщений'] + new_messages,
+                        'Всего сообщений': page_df['Всего сообщений'] + new_messages
+                    })
+
+            st.dataframe(
+                table,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    **USER_COLUMN_CONFIG,
+                    'Часов в войсе': st.column_config.NumberColumn(format="%.1f"),
+                    'Всего часов в войсе': st.column_config.NumberColumn(format="%.1f"),
+                }
+            )
 
-        # HTML таблица с ссылками
-        html_table = '<table class="stats-table"><thead><tr>'
-        html_table += '<th>#</th><th>Пользователь</th><th>Username</th><th>Сообщений</th><th>Время в войсе</th><th>Всего сообщений</th><th>Всего в войсе</th>'
-        html_table += '</tr></thead><tbody>'
-
-        for _, row in df.iterrows():
-            html_table += f'<tr>'
-            html_table += f'<td>{row["#"]}</td>'
-            html_table += f'<td>{row["Пользователь"]}</td>'
-            html_table += f'<td>{row["Username"]}</td>'
-            html_table += f'<td>{row["Сообщений"]}</td>'
-            html_table += f'<td>{row["Время в войсе"]}</td>'
-            html_table += f'<td>{row["Всего сообщений"]}</td>'
-            html_table += f'<td>{row["Всего в войсе"]}</td>'
-            html_table += '</tr>'
-
-        html_table += '</tbody></table>'
-
-        st.markdown(html_table, unsafe_allow_html=True)
-
-        # Экспорт в CSV (без HTML)
-        csv_df = df[['#', 'display_name_raw', 'Username', 'Сообщений', 'Время в войсе', 'Всего сообщений', 'Всего в войсе', 'user_id']].copy()
-        csv_df.columns = ['#', 'Пользователь', 'Username', 'Сообщений', 'Время в войсе', 'Всего сообщений', 'Всего в войсе', 'User ID']
-        csv_data = csv_df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Скачать CSV",
-            data=csv_data,
-            file_name=f"stats_{guild['name']}_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime='text/csv'
-        )
+        users_table()
+
+        page_col1, page_col2 = st.columns([1, 4])
+        with page_col1:
+            st.number_input("Страница", min_value=1, max_value=pages, step=1, key="stats_page")
+        with page_col2:
+            st.caption(f"Страница {page} из {pages} • показаны {offset + 1}–{offset + len(users_df)} из {total_count}")
+
+        # Экспорт в CSV - бот формирует его потоково с теми же фильтрами и сортировкой,
+        # что и таблица; загружается только по кнопке
+        export_args = (guild_id, stats_filters['include_roles'], stats_filters['exclude_roles'],
+                       stats_filters['since_date'], stats_filters['sort_by'], stats_page['order'])
+        if st.button("📄 Сформировать CSV", key="stats_export_prepare"):
+            with st.spinner("Формирую CSV экспорт..."):
+                st.session_state.stats_export = (export_args, get_export_csv(
+                    guild_id,
+                    include_roles=list(stats_filters['include_roles']) or None,
+                    exclude_roles=list(stats_filters['exclude_roles']) or None,
+                    since_date=stats_filters['since_date'],
+                    sort_by=stats_filters['sort_by'],
+                    order=stats_page['order']
+                ))
+
+        prepared = st.session_state.get('stats_export')
+        if prepared and prepared[0] == export_args:  # экспорт для других фильтров не предлагаем
+            if prepared[1]:
+                st.download_button(
+                    label="📥 Скачать CSV",
+                    data=prepared[1],
+                    file_name=f"stats_{guild['name']}_{datetime.now().strftime('%Y%m%d')}.csv",
+                    mime='text/csv'
+                )
+            else:
+                st.warning("Не удалось сформировать CSV экспорт")
     else:
         st.info("Нет данных для отображения. Попробуйте изменить фильтры.")
 
@@ -472,7 +895,7 @@ with tab1:
 with tab2:
     st.header("😴 Неактивные пользователи")
     
-    roles = get_guild_roles(guild_id)
+    roles = overview['roles']
     
     # Фильтры
     col1, col2 = st.columns([1, 1])
@@ -515,7 +938,7 @@ with tab2:
             key="exclude_roles"
         )
 
-    inactive_data = get_inactive_users(guild_id, inactive_days, activity_type)
+    inactive_data = dict(overview['inactive'])
     inactive_ids = inactive_data.get('inactive_user_ids', [])
     
     # Применяем фильтры по ролям
@@ -612,13 +1035,16 @@ with tab2:
                 })
         
         inactive_df = pd.DataFrame(inactive_list)
-        inactive_df['Пользователь'] = inactive_df['user_id'].apply(
-            lambda x: make_discord_link(x, members_cache)
-        )
-        
-        st.markdown(
-            inactive_df[['Пользователь', 'roles']].rename(columns={'roles': 'Роли'}).to_html(escape=False, index=False),
-            unsafe_allow_html=True
+
+        # Виртуализированная таблица: браузер рисует только видимые строки
+        st.dataframe(
+            pd.DataFrame({
+                **user_columns(inactive_df['user_id'].tolist(), members_cache),
+                'Роли': inactive_df['roles']
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config=USER_COLUMN_CONFIG
         )
         
         csv = inactive_df[['user_id', 'name', 'roles']].to_csv(index=False)
@@ -638,7 +1064,7 @@ with tab2:
 with tab3:
     st.header("⚠️ Система выговоров")
     
-    warnings_data = get_warnings(guild_id)
+    warnings_data = overview['warnings']
     
     col1, col2, col3 = st.columns(3)
     
@@ -654,14 +1080,15 @@ with tab3:
         st.subheader("🔥 Топ-10 нарушителей")
         
         offenders_df = pd.DataFrame(top_offenders)
-        offenders_df['Пользователь'] = offenders_df['user_id'].apply(
-            lambda x: make_discord_link(x, members_cache)
-        )
-        offenders_df['Активных выговоров'] = offenders_df['warning_count']
-        
-        st.markdown(
-            offenders_df[['Пользователь', 'Активных выговоров']].to_html(escape=False, index=False),
-            unsafe_allow_html=True
+
+        st.dataframe(
+            pd.DataFrame({
+                **user_columns(offenders_df['user_id'].tolist(), members_cache),
+                'Активных выговоров': offenders_df['warning_count']
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config=USER_COLUMN_CONFIG
         )
         
         fig = px.bar(
@@ -682,50 +1109,213 @@ with tab3:
 with tab4:
     st.header("📈 Визуализация данных")
 
-    # Получаем данные для графиков
-    graph_stats = get_users_stats(guild_id)
-    graph_users = graph_stats.get('users', [])
+    # Динамика активности - ряды приходят уже агрегированными (несколько сотен точек)
+    st.subheader("📅 Активность по времени")
+    role_names = {r['id']: r['name'] for r in overview['roles']}
+
+    ts_col1, ts_col2, ts_col3 = st.columns([1, 1, 2])
+    with ts_col1:
+        st.selectbox(
+            "Период",
+            options=[7, 14, TS_RETENTION_DAYS],
+            index=2,
+            format_func=lambda d: f"{d} дней",
+            key="ts_days"
+        )
+    with ts_col2:
+        st.radio(
+            "Шаг",
+            options=['day', 'week'],
+            format_func=lambda g: 'День' if g == 'day' else 'Неделя',
+            horizontal=True,
+            key="ts_granularity"
+        )
+    with ts_col3:
+        st.multiselect(
+            "Разбивка по ролям",
+            options=list(role_names.keys()),
+            format_func=lambda x: role_names.get(x, str(x)),
+            max_selections=5,
+            key="ts_roles"
+        )
+
+    timeseries = page_data['timeseries']
+    if timeseries and timeseries['series']['date']:
+        ts_df = pd.DataFrame(timeseries['series'])
+        ts_df['date'] = pd.to_datetime(ts_df['date'])
+        ts_df['voice_hours'] = ts_df['voice_time'] / 3600
+
+        if timeseries['bucket_days'] not in (1, 7):
+            st.caption(f"Одна точка = {timeseries['bucket_days']} дней")
+
+        ts_chart1, ts_chart2 = st.columns(2)
+        with ts_chart1:
+            fig = px.line(
+                ts_df, x='date', y=['messages', 'active_users'],
+                title='Сообщения и активные пользователи',
+                labels={'date': 'Дата', 'value': 'Количество', 'variable': ''}
+            )
+            fig.for_each_trace(lambda t: t.update(name={'messages': 'Сообщения', 'active_users': 'Активные'}[t.name]))
+            st.plotly_chart(fig, use_container_width=True)
+        with ts_chart2:
+            fig = px.bar(
+                ts_df, x='date', y='voice_hours',
+                title='Часы в войсе',
+                labels={'date': 'Дата', 'voice_hours': 'Часов'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        if timeseries['roles']:
+            role_metric = st.radio(
+                "Показатель по ролям",
+                options=['messages', 'voice_time', 'active_users'],
+                format_func=lambda m: {'messages': 'Сообщения', 'voice_time': 'Часы в войсе', 'active_users': 'Активные'}[m],
+                horizontal=True,
+                key="ts_role_metric"
+            )
+            roles_df = pd.concat([
+                pd.DataFrame({
+                    'date': ts_df['date'],
+                    'Роль': role['name'],
+                    'value': [v / 3600 for v in role['voice_time']] if role_metric == 'voice_time' else role[role_metric]
+                })
+                for role in timeseries['roles']
+            ])
+            fig = px.line(
+                roles_df, x='date', y='value', color='Роль',
+                title='Активность по ролям',
+                labels={'date': 'Дата', 'value': 'Значение'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Нет данных за выбранный период")
+
+    st.markdown("---")
+
+    # Когда сервер онлайн - тепловая карта час × день
+    st.subheader("🕒 Активность по часам")
+    hm_col1, hm_col2, hm_col3 = st.columns([1, 1, 1])
+    with hm_col1:
+        st.radio(
+            "Показатель",
+            options=['messages', 'voice'],
+            format_func=lambda s: 'Сообщения' if s == 'messages' else 'Участники в войсе',
+            horizontal=True,
+            key="heatmap_series"
+        )
+    with hm_col2:
+        heatmap_view = st.radio(
+            "Разрез",
+            options=['weekdays', 'days'],
+            format_func=lambda v: 'Дни недели (среднее)' if v == 'weekdays' else 'Последние 30 дней',
+            horizontal=True,
+            key="heatmap_view"
+        )
+    with hm_col3:
+        st.selectbox(
+            "Часовой пояс",
+            options=list(range(-12, 15)),
+            index=15,
+            format_func=lambda tz: f"UTC{tz:+d}",
+            key="heatmap_tz"
+        )
+
+    activity_hours = page_data['activity_hours']
+    if activity_hours and any(any(row) for row in activity_hours['days']):
+        if heatmap_view == 'weekdays':
+            matrix, rows = activity_hours['weekdays'], activity_hours['weekday_names']
+        else:
+            matrix, rows = activity_hours['days'], activity_hours['dates']
+        value_label = 'Сообщений' if activity_hours['series'] == 'messages' else 'Участников в войсе'
+
+        fig = px.imshow(
+            matrix,
+            x=[f"{hour:02d}" for hour in activity_hours['hours']],
+            y=rows,
+            labels={'x': 'Час', 'y': '', 'color': value_label},
+            color_continuous_scale='Viridis',
+            aspect='auto'
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
-    if graph_users:
-        df = pd.DataFrame(graph_users)
+        if activity_hours['peak_hours']:
+            st.caption("🔥 Пиковые часы: " + ", ".join(f"{p['hour']:02d}:00" for p in activity_hours['peak_hours']))
+    else:
+        st.info("Пока нет данных об активности по часам")
+
+    st.markdown("---")
+
+    # Распределения считает бот (фильтры вкладки пользователей) - размер ответа не зависит от сервера
+    distribution = page_data['distribution']
+    if distribution and distribution['count']:
+        messages_dist = distribution['metrics']['total_messages']
+        voice_dist = distribution['metrics']['total_voice_time']
+
+        st.subheader("📊 Распределение активности")
+        stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
+        stat_col1.metric("💬 Медиана сообщений", f"{messages_dist['percentiles']['p50']:.0f}",
+                         help=f"p90: {messages_dist['percentiles']['p90']:.0f} • p99: {messages_dist['percentiles']['p99']:.0f}")
+        stat_col2.metric("🎤 Медиана часов в войсе", f"{voice_dist['percentiles']['p50'] / 3600:.1f}",
+                         help=f"p90: {voice_dist['percentiles']['p90'] / 3600:.1f} • p99: {voice_dist['percentiles']['p99'] / 3600:.1f}")
+        stat_col3.metric("⚖️ Джини (сообщения / войс)", f"{messages_dist['gini']:.2f} / {voice_dist['gini']:.2f}",
+                         help="0 - активность распределена поровну, 1 - вся активность у одного участника")
+        stat_col4.metric("🔝 Доля топ-10% (сообщения / войс)",
+                         f"{messages_dist['top_share']['top_10']:.0%} / {voice_dist['top_share']['top_10']:.0%}")
 
         col1, col2 = st.columns(2)
 
         with col1:
-            st.subheader("📊 Распределение сообщений")
-            fig1 = px.histogram(
-                df,
-                x='total_messages',
-                nbins=20,
+            hist = messages_dist['histogram']
+            fig1 = px.bar(
+                x=bin_labels(hist['edges']),
+                y=hist['counts'],
                 title='Распределение пользователей по количеству сообщений',
-                labels={'total_messages': 'Количество сообщений', 'count': 'Пользователей'}
+                labels={'x': 'Количество сообщений', 'y': 'Пользователей'}
             )
             st.plotly_chart(fig1, use_container_width=True)
 
         with col2:
-            st.subheader("🎤 Распределение времени в войсе")
-            df['voice_hours'] = df['total_voice_time'] / 3600
-            fig2 = px.histogram(
-                df,
-                x='voice_hours',
-                nbins=20,
+            hist = voice_dist['histogram']
+            fig2 = px.bar(
+                x=bin_labels(hist['edges'], scale=3600, digits=1),
+                y=hist['counts'],
                 title='Распределение пользователей по времени в войсе',
-                labels={'voice_hours': 'Часов в войсе', 'count': 'Пользователей'}
+                labels={'x': 'Часов в войсе', 'y': 'Пользователей'}
             )
             st.plotly_chart(fig2, use_container_width=True)
 
-        st.subheader("📈 Корреляция: Сообщения vs Время в войсе")
-        fig3 = px.scatter(
-            df,
-            x='total_messages',
-            y='voice_hours',
-            title='Зависимость времени в войсе от количества сообщений',
-            labels={'total_messages': 'Сообщений', 'voice_hours': 'Часов в войсе'},
-            opacity=0.6
-        )
-        st.plotly_chart(fig3, use_container_width=True)
+        col3, col4 = st.columns(2)
+
+        with col3:
+            st.subheader("📉 Кривая Лоренца")
+            lorenz_df = pd.concat([
+                pd.DataFrame({'Участники': messages_dist['lorenz']['population'],
+                              'Доля': messages_dist['lorenz']['share'], 'Метрика': 'Сообщения'}),
+                pd.DataFrame({'Участники': voice_dist['lorenz']['population'],
+                              'Доля': voice_dist['lorenz']['share'], 'Метрика': 'Войс'}),
+                pd.DataFrame({'Участники': [0, 1], 'Доля': [0, 1], 'Метрика': 'Равномерно'})
+            ])
+            fig3 = px.line(
+                lorenz_df, x='Участники', y='Доля', color='Метрика',
+                labels={'Участники': 'Доля участников (от наименее активных)', 'Доля': 'Доля активности'}
+            )
+            st.plotly_chart(fig3, use_container_width=True)
+
+        with col4:
+            st.subheader("📈 Сообщения vs Время в войсе")
+            joint = distribution['joint']
+            fig4 = px.imshow(
+                [list(row) for row in zip(*joint['counts'])],  # строки - бины войса
+                x=bin_labels(joint['x_edges']),
+                y=bin_labels(joint['y_edges'], scale=3600, digits=1),
+                labels={'x': 'Сообщений', 'y': 'Часов в войсе', 'color': 'Пользователей'},
+                color_continuous_scale='Blues',
+                origin='lower',
+                aspect='auto'
+            )
+            st.plotly_chart(fig4, use_container_width=True)
     else:
         st.info("Нет данных для визуализации")
 
 st.markdown("---")
-st.markdown(f"**{bot_name} Dashboard** • Обновляется каждую минуту")
\ No newline at end of file
+st.markdown(f"**{bot_name} Dashboard** • Live-события каждые 5 секунд • таблицы перечитываются раз в 5 минут")
\ No newline at end of file
@@ -2,15 +2,26 @@ import sqlite3
 import os
 import uuid
 import csv
+import threading
 from io import StringIO
 from datetime import datetime, timedelta
+from warnings_repo import WarningsRepository
+
+# Сколько дней хранятся дневные таблицы активности (см. cleanup_old_data)
+DAILY_RETENTION_DAYS = 30
 
 class Database:
     """Класс для работы с базой данных"""
 
     def __init__(self, db_path='bot_database.db'):
         self.db_path = db_path
+        # Кэш настроек серверов (брендинг панели читается на каждый клик) - сбрасывается при изменении
+        self._settings_cache = {}
+        self._settings_lock = threading.Lock()
+        self._settings_generations = {}  # guild_id -> номер версии (растёт при изменении)
         self.init_db()
+        # Сводки выговоров (кэш сбрасывается при записи в warnings)
+        self.warnings_repo = WarningsRepository(db_path)
         # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: закрываем зависшие сессии при старте
         self._cleanup_on_init()
 
@@ -110,6 +121,100 @@ class Database:
             )
         ''')
 
+        # Счётчики выговоров на (сервер, пользователь) и на модератора.
+        # Поддерживаются триггерами в той же транзакции, что и запись в warnings -
+        # сводки читаются по индексу вместо COUNT(*) по всей истории
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'warning_counters'")
+        backfill_warning_counters = cursor.fetchone() is None
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS warning_counters (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                active_count INTEGER NOT NULL DEFAULT 0,
+                total_count INTEGER NOT NULL DEFAULT 0,
+                last_warned_at TIMESTAMP,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS warning_moderators (
+                guild_id INTEGER NOT NULL,
+                moderator_id INTEGER NOT NULL,
+                warnings_given INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, moderator_id)
+            )
+        ''')
+
+        # Топы нарушителей и модераторов - упорядоченные индексы
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_warning_counters_active
+            ON warning_counters (guild_id, active_count DESC, total_count DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_warning_counters_total
+            ON warning_counters (guild_id, total_count DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_warning_moderators_given
+            ON warning_moderators (guild_id, warnings_given DESC)
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_warnings_counters_insert
+            AFTER INSERT ON warnings
+            BEGIN
+                INSERT INTO warning_counters (guild_id, user_id, active_count, total_count, last_warned_at)
+                VALUES (NEW.guild_id, NEW.user_id, NEW.is_active = 1, 1, NEW.warned_at)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                    active_count = active_count + excluded.active_count,
+                    total_count = total_count + 1,
+                    last_warned_at = MAX(COALESCE(last_warned_at, ''), excluded.last_warned_at);
+                INSERT INTO warning_moderators (guild_id, moderator_id, warnings_given)
+                VALUES (NEW.guild_id, NEW.warned_by, 1)
+                ON CONFLICT (guild_id, moderator_id) DO UPDATE SET
+                    warnings_given = warnings_given + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_warnings_counters_active
+            AFTER UPDATE OF is_active ON warnings
+            WHEN OLD.is_active IS NOT NEW.is_active
+            BEGIN
+                UPDATE warning_counters
+                SET active_count = active_count + (NEW.is_active = 1) - (OLD.is_active = 1)
+                WHERE guild_id = NEW.guild_id AND user_id = NEW.user_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_warnings_counters_delete
+            AFTER DELETE ON warnings
+            BEGIN
+                UPDATE warning_counters
+                SET active_count = active_count - (OLD.is_active = 1),
+                    total_count = total_count - 1
+                WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id;
+                UPDATE warning_moderators
+                SET warnings_given = warnings_given - 1
+                WHERE guild_id = OLD.guild_id AND moderator_id = OLD.warned_by;
+            END
+        ''')
+
+        if backfill_warning_counters:
+            # Первый запуск после обновления - пересчитываем из существующих выговоров
+            cursor.execute('''
+                INSERT INTO warning_counters (guild_id, user_id, active_count, total_count, last_warned_at)
+                SELECT guild_id, user_id, SUM(is_active = 1), COUNT(*), MAX(warned_at)
+                FROM warnings
+                GROUP BY guild_id, user_id
+            ''')
+            cursor.execute('''
+                INSERT INTO warning_moderators (guild_id, moderator_id, warnings_given)
+                SELECT guild_id, warned_by, COUNT(*)
+                FROM warnings
+                GROUP BY guild_id, warned_by
+            ''')
+
         # Таблица статистики напитков
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS drink_stats (
@@ -122,6 +227,39 @@ class Database:
             )
         ''')
 
+        # Итоги напитков на (сервер, пользователь, напиток) - поддерживаются триггером,
+        # рейтинг !drink_top строится по ним, а не по всей истории drink_stats
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'drink_totals'")
+        backfill_drink_totals = cursor.fetchone() is None
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS drink_totals (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                drink_type TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id, drink_type)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_drink_stats_totals_insert
+            AFTER INSERT ON drink_stats
+            BEGIN
+                INSERT INTO drink_totals (guild_id, user_id, drink_type, total)
+                VALUES (NEW.guild_id, NEW.user_id, NEW.drink_type, NEW.amount)
+                ON CONFLICT (guild_id, user_id, drink_type) DO UPDATE SET
+                    total = total + excluded.total;
+            END
+        ''')
+
+        if backfill_drink_totals:
+            cursor.execute('''
+                INSERT INTO drink_totals (guild_id, user_id, drink_type, total)
+                SELECT guild_id, user_id, drink_type, SUM(amount)
+                FROM drink_stats
+                GROUP BY guild_id, user_id, drink_type
+            ''')
+
         # Таблица настроек сервера (для кастомизации бота)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS guild_settings (
@@ -138,6 +276,26 @@ class Database:
             )
         ''')
 
+        # Почасовая активность: кольцевые буферы int32 (см. activity_hours.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS activity_hourly (
+                guild_id INTEGER PRIMARY KEY,
+                last_hour INTEGER NOT NULL,
+                messages BLOB NOT NULL,
+                voice BLOB NOT NULL
+            )
+        ''')
+
+        # Индексы для выборок по серверу и диапазону дат (графики, периоды статистики)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_daily_guild_date
+            ON user_messages_daily (guild_id, message_date)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_voice_daily_guild_date
+            ON user_voice_daily (guild_id, voice_date)
+        ''')
+
         conn.commit()
         conn.close()
 
@@ -213,8 +371,26 @@ class Database:
     # GUILD SETTINGS МЕТОДЫ
     # ========================================
 
+    def _invalidate_settings(self, guild_id: int):
+        """Сбросить кэш настроек сервера после записи"""
+        with self._settings_lock:
+            self._settings_cache.pop(guild_id, None)
+            self._settings_generations[guild_id] = self._settings_generations.get(guild_id, 0) + 1
+
+    def _cache_settings(self, guild_id: int, generation: int, settings: dict):
+        """Закэшировать прочитанные настройки, если пока читали, их не изменили"""
+        with self._settings_lock:
+            if self._settings_generations.get(guild_id, 0) == generation:
+                self._settings_cache[guild_id] = settings
+
     def get_guild_settings(self, guild_id: int) -> dict:
         """Получить настройки сервера (с дефолтными значениями если не заданы)"""
+        with self._settings_lock:
+            cached = self._settings_cache.get(guild_id)
+            generation = self._settings_generations.get(guild_id, 0)
+        if cached is not None:
+            return dict(cached)
+
         defaults = {
             'guild_id': guild_id,
             'bot_name': 'GuildBrew',
@@ -244,9 +420,10 @@ class Database:
             conn.close()
 
             if not result:
-                return defaults
+                self._cache_settings(guild_id, generation, defaults)
+                return dict(defaults)
 
-            return {
+            settings = {
                 'guild_id': result[0],
                 'bot_name': result[1] or defaults['bot_name'],
                 'primary_color': result[2] or defaults['primary_color'],
@@ -258,6 +435,8 @@ class Database:
                 'created_at': result[8],
                 'updated_at': result[9]
             }
+            self._cache_settings(guild_id, generation, settings)
+            return dict(settings)
         except Exception as e:
             print(f"Error getting guild settings: {e}")
             return defaults
@@ -309,6 +488,7 @@ class Database:
 
             conn.commit()
             conn.close()
+            self._invalidate_settings(guild_id)
             return True
         except Exception as e:
             print(f"Error updating guild settings: {e}")
@@ -327,11 +507,31 @@ class Database:
 
             conn.commit()
             conn.close()
+            self._invalidate_settings(guild_id)
             return True
         except Exception as e:
             print(f"Error resetting guild settings: {e}")
             return False
 
+    def get_all_logo_urls(self) -> set | None:
+        """Все logo_url, на которые ссылаются настройки серверов (для очистки файлов)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT DISTINCT logo_url
+                FROM guild_settings
+                WHERE logo_url IS NOT NULL
+            ''')
+
+            results = {row[0] for row in cursor.fetchall()}
+            conn.close()
+            return results
+        except Exception as e:
+            print(f"Error getting logo urls: {e}")
+            return None
+
     # ========================================
     # СТАТИСТИКА МЕТОДЫ
     # ========================================
@@ -653,27 +853,27 @@ class Database:
             return []
 
     def cleanup_old_data(self):
-        """Удалить данные старше 30 дней"""
+        """Удалить данные старше DAILY_RETENTION_DAYS дней"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             cursor.execute('''
                 DELETE FROM user_messages_daily
-                WHERE message_date < DATE('now', '-30 days')
-            ''')
+                WHERE message_date < DATE('now', '-' || ? || ' days')
+            ''', (DAILY_RETENTION_DAYS,))
             deleted_messages = cursor.rowcount
 
             cursor.execute('''
                 DELETE FROM user_voice_sessions
-                WHERE join_time < DATETIME('now', '-30 days')
-            ''')
+                WHERE join_time < DATETIME('now', '-' || ? || ' days')
+            ''', (DAILY_RETENTION_DAYS,))
             deleted_voice = cursor.rowcount
 
             cursor.execute('''
                 DELETE FROM user_voice_daily
-                WHERE voice_date < DATE('now', '-30 days')
-            ''')
+                WHERE voice_date < DATE('now', '-' || ? || ' days')
+            ''', (DAILY_RETENTION_DAYS,))
             deleted_voice_daily = cursor.rowcount
 
             conn.commit()
@@ -837,6 +1037,52 @@ class Database:
         inactive_user_ids = list(all_users - active_users)
         return inactive_user_ids
 
+    # ========================================
+    # ПОЧАСОВАЯ АКТИВНОСТЬ
+    # ========================================
+
+    def get_hourly_activity(self) -> list:
+        """Буферы почасовой активности всех серверов: [(guild_id, last_hour, messages, voice)]"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT guild_id, last_hour, messages, voice FROM activity_hourly')
+            results = cursor.fetchall()
+            conn.close()
+            return results
+        except Exception as e:
+            print(f"Error loading hourly activity: {e}")
+            return []
+
+    def save_hourly_activity(self, rows: list) -> bool:
+        """Сохранить буферы: rows = [(guild_id, last_hour, messages_blob, voice_blob)]"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR REPLACE INTO activity_hourly (guild_id, last_hour, messages, voice)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"Error saving hourly activity: {e}")
+            return False
+
+    def delete_hourly_activity(self, guild_id: int) -> bool:
+        """Удалить буферы сервера"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM activity_hourly WHERE guild_id = ?', (guild_id,))
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"Error deleting hourly activity: {e}")
+            return False
+
     # ========================================
     # МЕТОДЫ ДЛЯ ВЫГОВОРОВ
     # ========================================
@@ -855,6 +1101,7 @@ class Database:
             warning_id = cursor.lastrowid
             conn.commit()
             conn.close()
+            self.warnings_repo.invalidate(guild_id)
             return warning_id
         except Exception as e:
             print(f"Error adding warning: {e}")
@@ -878,6 +1125,8 @@ class Database:
             success = cursor.rowcount > 0
             conn.commit()
             conn.close()
+            if success:
+                self.warnings_repo.invalidate()
             return success
         except Exception as e:
             print(f"Error removing warning: {e}")
@@ -914,28 +1163,16 @@ class Database:
             expired_count = cursor.rowcount
             conn.commit()
             conn.close()
+            if expired_count:
+                self.warnings_repo.invalidate()
             return expired_count
         except Exception as e:
             print(f"Error expiring warnings: {e}")
             return 0
 
     def get_all_active_warnings(self, guild_id: int) -> list:
-        """Получить все активные выговоры на сервере"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT user_id, COUNT(*) as warning_count
-            FROM warnings
-            WHERE guild_id = ? AND is_active = 1
-            AND expires_at > CURRENT_TIMESTAMP
-            GROUP BY user_id
-            ORDER BY warning_count DESC
-        ''', (guild_id,))
-
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        """Получить все активные выговоры на сервере: [(user_id, активных)]"""
+        return self.warnings_repo.active_users(guild_id)
 
     # ========================================
     # МЕТОДЫ ДЛЯ НАПИТКОВ
@@ -974,10 +1211,9 @@ class Database:
             ''', (guild_id, user_id, days))
         else:
             cursor.execute('''
-                SELECT drink_type, SUM(amount) as total
-                FROM drink_stats
+                SELECT drink_type, total
+                FROM drink_totals
                 WHERE guild_id = ? AND user_id = ?
-                GROUP BY drink_type
             ''', (guild_id, user_id))
 
         results = cursor.fetchall()
@@ -0,0 +1,196 @@
+import os
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Базовый URL Discord API (можно переопределить для тестов на локальном mock-сервере)
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE', 'https://discord.com/api/v10')
+
+DEFAULT_TIMEOUT = 10          # секунд на запрос
+MAX_RETRIES = 3               # повторов при 429 / 5xx
+MAX_RETRY_AFTER = 30          # дольше ждать не будем - отдаём 429 вызывающему
+RETRY_STATUSES = {502, 503, 504}
+
+
+class DiscordRESTClient:
+    """
+    Общий HTTP клиент для Discord REST API.
+
+    - один requests.Session с пулом соединений (без TCP/TLS handshake на каждый вызов)
+    - учёт rate limit бакетов по заголовкам X-RateLimit-*
+    - автоматическое ожидание retry_after при 429 (в том числе global)
+    - таймауты по умолчанию на все запросы
+    """
+
+    def __init__(self, base_url: str = None, timeout: float = DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, pool_size: int = 10):
+        self.base_url = (base_url or DISCORD_API_BASE).rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': 'GuildBrew (https://github.com/vytr/guildbrew, 1.0)'})
+
+        self._lock = threading.Lock()
+        self._route_buckets = {}    # route key -> bucket hash из X-RateLimit-Bucket
+        self._buckets = {}          # bucket key -> (remaining, reset_at по time.monotonic)
+        self._global_reset_at = 0.0
+
+    # ==================== RATE LIMITS ====================
+
+    @staticmethod
+    def _route_key(method: str, path: str, headers: dict) -> tuple:
+        """Ключ маршрута: метод + путь (с major параметрами) + отпечаток авторизации"""
+        auth = (headers or {}).get('Authorization', '')
+        auth_fp = hashlib.sha1(auth.encode('utf-8')).hexdigest()[:12] if auth else ''
+        return (method.upper(), path, auth_fp)
+
+    def _bucket_key(self, route_key: tuple):
+        bucket_hash = self._route_buckets.get(route_key)
+        if bucket_hash:
+            return (bucket_hash, route_key[1], route_key[2])
+        return route_key
+
+    def _wait_for_bucket(self, route_key: tuple) -> float:
+        """Сколько нужно подождать перед запросом по этому маршруту"""
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self._global_reset_at - now)
+            state = self._buckets.get(self._bucket_key(route_key))
+            if state:
+                remaining, reset_at = state
+                if remaining <= 0 and reset_at > now:
+                    wait = max(wait, reset_at - now)
+        return wait
+
+    def _update_bucket(self, route_key: tuple, response: requests.Response):
+        """Обновить состояние бакета по заголовкам ответа"""
+        headers = response.headers
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+
+        with self._lock:
+            if bucket_hash:
+                self._route_buckets[route_key] = bucket_hash
+            if remaining is not None and reset_after is not None:
+                try:
+                    self._buckets[self._bucket_key(route_key)] = (
+                        int(remaining),
+                        time.monotonic() + float(reset_after)
+                    )
+                except ValueError:
+                    pass
+
+    def _handle_429(self, route_key: tuple, response: requests.Response) -> float:
+        """Разобрать 429 ответ, вернуть retry_after в секундах"""
+        retry_after = None
+        is_global = response.headers.get('X-RateLimit-Global', '').lower() == 'true'
+        try:
+            data = response.json()
+            retry_after = float(data.get('retry_after'))
+            is_global = is_global or bool(data.get('global'))
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+        if retry_after is None:
+            try:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+
+        reset_at = time.monotonic() + retry_after
+        with self._lock:
+            if is_global:
+                self._global_reset_at = max(self._global_reset_at, reset_at)
+            else:
+                self._buckets[self._bucket_key(route_key)] = (0, reset_at)
+
+        print(f"⏳ Discord rate limit ({'global' if is_global else route_key[1]}): retry after {retry_after:.2f}s")
+        return retry_after
+
+    # ==================== ЗАПРОСЫ ====================
+
+    def request(self, method: str, path: str, headers: dict = None, timeout: float = None,
+                **kwargs) -> requests.Response:
+        """
+        Запрос к Discord API. path - относительный путь (например /users/@me).
+        Возвращает requests.Response; при исчерпании повторов возвращает последний 429.
+        """
+        url = f"{self.base_url}{path}"
+        route_key = self._route_key(method, path, headers)
+        timeout = timeout or self.timeout
+
+        attempt = 0
+        while True:
+            wait = self._wait_for_bucket(route_key)
+            if wait > MAX_RETRY_AFTER:
+                # Не держим worker поток Waitress слишком долго - отдаём 429 как есть
+                return self._synthetic_429(url, wait)
+            if wait > 0:
+                time.sleep(wait)
+
+            response = self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+            self._update_bucket(route_key, response)
+
+            if response.status_code == 429:
+                retry_after = self._handle_429(route_key, response)
+                if attempt >= self.max_retries or retry_after > MAX_RETRY_AFTER:
+                    return response
+                attempt += 1
+                time.sleep(retry_after)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                attempt += 1
+                time.sleep(min(2 ** attempt * 0.5, 5))
+                continue
+
+            return response
+
+    @staticmethod
+    def _synthetic_429(url: str, retry_after: float) -> requests.Response:
+        """Ответ 429 без обращения к сети (бакет исчерпан надолго)"""
+        response = requests.Response()
+        response.status_code = 429
+        response.url = url
+        response.headers['Retry-After'] = f"{retry_after:.2f}"
+        response._content = f'{{"message": "You are being rate limited.", "retry_after": {retry_after:.2f}, "global": false}}'.encode('utf-8')
+        return response
+
+    def fetch_url(self, url: str, max_bytes: int = None, timeout: float = None) -> requests.Response:
+        """Скачать внешний URL через общий пул соединений (без учёта Discord бакетов)"""
+        response = self.session.get(url, timeout=timeout or self.timeout, stream=True)
+        try:
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise ValueError(f"Response larger than {max_bytes} bytes")
+                chunks.append(chunk)
+            response._content = b''.join(chunks)
+        finally:
+            response.close()
+        return response
+
+    # ==================== ХЕЛПЕРЫ ====================
+
+    def get_current_user(self, access_token: str) -> requests.Response:
+        """GET /users/@me с OAuth2 Bearer токеном"""
+        return self.request('GET', '/users/@me', headers={'Authorization': f'Bearer {access_token}'})
+
+    def modify_current_member(self, guild_id: int, bot_token: str, payload: dict,
+                              timeout: float = 30) -> requests.Response:
+        """PATCH /guilds/{guild_id}/members/@me от имени бота"""
+        headers = {
+            'Authorization': f'Bot {bot_token}',
+            'Content-Type': 'application/json'
+        }
+        return self.request('PATCH', f'/guilds/{guild_id}/members/@me',
+                            headers=headers, json=payload, timeout=timeout)
@@ -0,0 +1,111 @@
+import numpy as np
+
+METRICS = ('period_messages', 'period_voice_time', 'total_messages', 'total_voice_time')
+PERCENTILES = (50, 90, 99)
+LORENZ_POINTS = 101
+
+
+def gini(sorted_values: np.ndarray) -> float:
+    """Коэффициент Джини (0 - все одинаково активны, 1 - вся активность у одного)"""
+    n = sorted_values.size
+    total = sorted_values.sum()
+    if n == 0 or total == 0:
+        return 0.0
+    ranks = np.arange(1, n + 1)
+    return float((2 * np.dot(ranks, sorted_values)) / (n * total) - (n + 1) / n)
+
+
+def lorenz_curve(sorted_values: np.ndarray, points: int = LORENZ_POINTS) -> dict:
+    """Кривая Лоренца, прореженная до points точек: доля участников -> доля активности"""
+    n = sorted_values.size
+    total = sorted_values.sum()
+    population = np.linspace(0, 1, points)
+    if n == 0 or total == 0:
+        return {'population': population.round(4).tolist(), 'share': population.round(4).tolist()}
+    cumulative = np.concatenate(([0.0], np.cumsum(sorted_values) / total))
+    share = np.interp(population * n, np.arange(n + 1), cumulative)
+    return {'population': population.round(4).tolist(), 'share': share.round(4).tolist()}
+
+
+def bin_edges(values: np.ndarray, bins: int, log: bool) -> np.ndarray:
+    """Границы бинов; в лог. шкале - равные интервалы по log1p (длинный хвост активности)"""
+    top = float(values.max()) if values.size else 0.0
+    if top <= 0:
+        return np.linspace(0, 1, bins + 1)
+    if log:
+        edges = np.expm1(np.linspace(0, np.log1p(top), bins + 1))
+        edges[-1] = top  # expm1(log1p(x)) может быть чуть меньше x - максимум выпал бы из бинов
+        return edges
+    return np.linspace(0, top, bins + 1)
+
+
+def summarize(values: np.ndarray, bins: int = 20, log: bool = True) -> dict:
+    """Гистограмма, перцентили, Джини и доли топа для одной метрики"""
+    sorted_values = np.sort(values)[::-1]  # по убыванию - для долей топа
+    ascending = sorted_values[::-1]
+    n = values.size
+    total = float(values.sum()) if n else 0.0
+
+    counts, edges = np.histogram(values, bins=bin_edges(values, bins, log))
+
+    def top_share(fraction: float) -> float:
+        if n == 0 or total == 0:
+            return 0.0
+        k = max(int(np.ceil(n * fraction)), 1)
+        return round(float(sorted_values[:k].sum()) / total, 4)
+
+    return {
+        'count': int(n),
+        'zero_count': int(np.count_nonzero(values == 0)),
+        'total': total,
+        'mean': round(float(values.mean()), 2) if n else 0.0,
+        'max': float(sorted_values[0]) if n else 0.0,
+        'percentiles': {
+            f"p{p}": round(float(np.percentile(values, p)), 2) if n else 0.0
+            for p in PERCENTILES
+        },
+        'gini': round(gini(ascending), 4),
+        'top_share': {'top_1': top_share(0.01), 'top_10': top_share(0.10)},
+        'histogram': {
+            'edges': edges.round(2).tolist(),
+            'counts': counts.tolist(),
+            'scale': 'log' if log else 'linear'
+        },
+        'lorenz': lorenz_curve(ascending)
+    }
+
+
+def joint_histogram(x: np.ndarray, y: np.ndarray, bins: int = 20, log: bool = True) -> dict:
+    """Совместное распределение двух метрик (замена scatter plot) - матрица bins x bins"""
+    counts, x_edges, y_edges = np.histogram2d(
+        x, y, bins=[bin_edges(x, bins, log), bin_edges(y, bins, log)]
+    )
+    return {
+        'x_edges': x_edges.round(2).tolist(),
+        'y_edges': y_edges.round(2).tolist(),
+        'counts': counts.astype(int).tolist()  # counts[i][j]: x в бине i, y в бине j
+    }
+
+
+def build_distribution(records: list, metrics=METRICS, bins: int = 20, log: bool = True,
+                       joint: tuple = ('total_messages', 'total_voice_time')) -> dict:
+    """
+    Сводка распределений по записям users-stats.
+    В ответе только агрегаты - размер не зависит от количества участников.
+    """
+    columns = {
+        metric: np.fromiter((r[metric] for r in records), dtype=np.float64, count=len(records))
+        for metric in set(metrics) | set(joint or ())
+    }
+    result = {
+        'count': len(records),
+        'metrics': {metric: summarize(columns[metric], bins, log) for metric in metrics}
+    }
+    if joint:
+        x_metric, y_metric = joint
+        result['joint'] = {
+            'x': x_metric,
+            'y': y_metric,
+            **joint_histogram(columns[x_metric], columns[y_metric], bins, log)
+        }
+    return result
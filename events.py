@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import queue
+import threading
+import itertools
+
+# Размер очереди одного подписчика; при переполнении подписчик получает 'resync'
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Как часто сбрасываем накопленные счётчики сообщений (секунды)
+FLUSH_INTERVAL = 2.0
+# Максимум одновременных подписчиков (каждый SSE клиент держит поток Waitress)
+# и подписчиков одного сервера - dashboard держит одно соединение на сервер,
+# так что лишние подписки одного сервера не занимают места других серверов
+MAX_SUBSCRIBERS = int(os.getenv('EVENT_MAX_SUBSCRIBERS', '16'))
+MAX_SUBSCRIBERS_PER_GUILD = int(os.getenv('EVENT_MAX_SUBSCRIBERS_PER_GUILD', '2'))
+
+
+class Subscription:
+    """Подписка на события одного сервера (или всех, если guild_id=None)"""
+
+    def __init__(self, bus, guild_id: int = None, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.bus = bus
+        self.guild_id = guild_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._overflow_lock = threading.Lock()
+
+    def offer(self, event: dict):
+        """Положить событие в очередь; медленный подписчик получает resync вместо потока дельт"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            resync = {
+                'id': event['id'],
+                'type': 'resync',
+                'guild_id': event.get('guild_id'),
+                'ts': event['ts']
+            }
+            # Публикуют из нескольких потоков - одновременные переполнения
+            # не должны перемешивать очистку и resync
+            with self._overflow_lock:
+                self.dropped += 1
+                # Очищаем очередь - клиенту всё равно нужно перечитать состояние целиком
+                try:
+                    while True:
+                        self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(resync)
+                except queue.Full:
+                    pass  # очередь успели заполнить снова - resync уйдёт при следующем переполнении
+
+    def get(self, timeout: float = None) -> dict | None:
+        """Следующее событие или None по таймауту"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """
+    Потокобезопасная шина событий для live-обновлений dashboard.
+
+    Публикуют cogs (в потоке event loop бота), читают SSE клиенты Flask
+    (в потоках Waitress). Инкременты сообщений не отправляются по одному -
+    они копятся и раз в FLUSH_INTERVAL уходят одним событием 'messages'.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_subscribers: int = MAX_SUBSCRIBERS,
+                 max_per_guild: int = MAX_SUBSCRIBERS_PER_GUILD):
+        self.flush_interval = flush_interval
+        self.max_subscribers = max_subscribers
+        self.max_per_guild = max_per_guild
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._sequence = itertools.count(1)
+        self._pending_messages = {}  # guild_id -> {user_id: count}
+        self._stop = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+
+    # ==================== ПОДПИСКА ====================
+
+    def subscribe(self, guild_id: int = None) -> Subscription | None:
+        """Новая подписка (None если достигнут общий лимит или лимит сервера)"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if sum(1 for s in self._subscribers if s.guild_id == guild_id) >= self.max_per_guild:
+                return None
+            subscription = Subscription(self, guild_id)
+            self._subscribers.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def max_queue_depth(self) -> int:
+        """Самая длинная очередь среди подписчиков (медленный клиент)"""
+        with self._lock:
+            return max((s.queue.qsize() for s in self._subscribers), default=0)
+
+    def has_subscribers(self, guild_id: int = None) -> bool:
+        """Есть ли кому отправлять события этого сервера"""
+        subscribers = self._subscribers
+        if guild_id is None:
+            return bool(subscribers)
+        return any(s.guild_id is None or s.guild_id == guild_id for s in subscribers)
+
+    # ==================== ПУБЛИКАЦИЯ ====================
+
+    def publish(self, event_type: str, guild_id: int, **data):
+        """Отправить событие подписчикам сервера"""
+        if not self.has_subscribers(guild_id):
+            return
+
+        event = {
+            'id': next(self._sequence),
+            'type': event_type,
+            'guild_id': guild_id,
+            'ts': time.time(),
+            **data
+        }
+
+        with self._lock:
+            targets = [s for s in self._subscribers if s.guild_id is None or s.guild_id == guild_id]
+        for subscription in targets:
+            subscription.offer(event)
+
+    def increment_messages(self, guild_id: int, user_id: int, count: int = 1):
+        """Накопить инкремент счётчика сообщений (уйдёт в следующем flush)"""
+        if not self.has_subscribers(guild_id):
+            return
+        with self._lock:
+            counts = self._pending_messages.setdefault(guild_id, {})
+            counts[user_id] = counts.get(user_id, 0) + count
+
+    def flush(self):
+        """Отправить накопленные счётчики сообщений"""
+        with self._lock:
+            pending = self._pending_messages
+            self._pending_messages = {}
+
+        for guild_id, counts in pending.items():
+            self.publish(
+                'messages',
+                guild_id,
+                counts={str(user_id): n for user_id, n in counts.items()},
+                total=sum(counts.values())
+            )
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Event bus flush error: {e}")
+
+    def close(self):
+        """Остановить фоновый flush"""
+        self._stop.set()
+
+
+def format_sse(event: dict) -> str:
+    """Событие в формате Server-Sent Events"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
@@ -0,0 +1,116 @@
+import time
+import heapq
+import asyncio
+from datetime import datetime, timezone
+
+# Если callback упал, наступившие ключи ставятся заново через
+# RETRY_BASE * 2^(неудачных попыток) секунд, но не реже раза в RETRY_MAX
+RETRY_BASE = 30.0
+RETRY_MAX = 3600.0
+
+
+def utc_timestamp(value) -> float:
+    """datetime (naive = UTC) или ISO строка из БД -> unix time"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ExpiryScheduler:
+    """
+    Таймеры истечения на min-heap (срок, ключ).
+
+    Одна задача спит ровно до ближайшего срока и передаёт в callback только
+    наступившие ключи - без периодического сканирования таблицы.
+    Отмена ленивая: запись остаётся в куче, но пропускается при извлечении.
+    Если callback выбросил исключение, его ключи повторяются с растущей задержкой.
+    """
+
+    def __init__(self, callback):
+        self._callback = callback  # async callback(list[ключ])
+        self._heap = []            # [(срок, ключ)]
+        self._deadlines = {}       # ключ -> актуальный срок
+        self._failures = {}        # ключ -> неудачных вызовов callback подряд
+        self._cancelled = set()    # ключи, отменённые пока работал текущий callback
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    # ==================== ТАЙМЕРЫ ====================
+
+    def schedule(self, key, deadline: float):
+        """Поставить (или перенести) таймер ключа на момент deadline (unix time)"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        self._compact()
+        if self._wakeup is not None and self._heap[0] == (deadline, key):
+            self._wakeup.set()  # новый ближайший срок - пересчитать сон
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+        self._failures.pop(key, None)
+        self._cancelled.add(key)
+
+    def _compact(self):
+        """Перестроить кучу, если отменённых записей стало больше актуальных"""
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, k) for k, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    # ==================== ЗАДАЧА ====================
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            due = self._pop_due(now)
+            if due:
+                self._cancelled.clear()
+                try:
+                    await self._callback(due)
+                except Exception as e:
+                    print(f"Error in expiry callback: {e}")
+                    self._retry_later(due)
+                else:
+                    for key in due:
+                        self._failures.pop(key, None)
+                continue
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _retry_later(self, keys: list):
+        """Поставить необработанные ключи заново с экспоненциальной задержкой"""
+        now = time.time()
+        for key in keys:
+            if key in self._deadlines or key in self._cancelled:
+                continue  # пока callback работал, таймер ключа переставили или отменили
+            failures = self._failures.get(key, 0)
+            self._failures[key] = failures + 1
+            self.schedule(key, now + min(RETRY_BASE * 2 ** failures, RETRY_MAX))
@@ -0,0 +1,161 @@
+import os
+import asyncio
+import zipfile
+import tempfile
+import functools
+import discord
+from concurrent.futures import ThreadPoolExecutor
+
+# Генерация файлов идёт в отдельном пуле (не в общем executor бота),
+# одновременно на одном сервере - не больше EXPORTS_PER_GUILD экспортов
+EXPORT_WORKERS = 2
+EXPORTS_PER_GUILD = 1
+
+# Статус-сообщение обновляем не чаще раза в PROGRESS_INTERVAL секунд (лимиты Discord на edit)
+PROGRESS_INTERVAL = 2.0
+
+
+class ExportTooLarge(Exception):
+    """Файл не помещается в лимит загрузки даже после сжатия"""
+
+
+async def edit_status(message, content: str):
+    """Обновить статус-сообщение, не падая если его удалили"""
+    if message is None:
+        return
+    try:
+        await message.edit(content=content)
+    except discord.HTTPException:
+        pass
+
+
+class ExportProgress:
+    """
+    Прогресс экспорта в статус-сообщении.
+    report() вызывается из рабочего потока, edit() - из event loop по таймеру.
+    """
+
+    def __init__(self, message, label: str):
+        self.message = message
+        self.label = label
+        self._state = None  # (done, total) - присваивание кортежа атомарно
+        self._shown = None
+        self._task = None
+
+    def report(self, done: int, total: int = None):
+        self._state = (done, total)
+
+    def render(self) -> str:
+        done, total = self._state
+        if total:
+            return f"{self.label}: {done:,}/{total:,} ({done / total:.0%})"
+        return f"{self.label}: {done:,}"
+
+    def start(self):
+        self._task = asyncio.create_task(self._updater())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _updater(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            state = self._state
+            if state is not None and state != self._shown:
+                self._shown = state
+                await edit_status(self.message, self.render())
+
+
+class ExportService:
+    """
+    Выполнение экспортов (CSV, XLSX) вне event loop.
+
+    - генерация в собственном пуле потоков: бот отвечает на события, пока строится файл
+    - семафор на сервер: повторные клики не запускают параллельные тяжёлые экспорты
+    - прогресс в статус-сообщении
+    - файл больше лимита загрузки сервера сжимается в zip
+    """
+
+    def __init__(self, max_workers: int = EXPORT_WORKERS, per_guild: int = EXPORTS_PER_GUILD):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._per_guild = per_guild
+        self._semaphores = {}  # guild_id -> asyncio.Semaphore
+
+    def _semaphore(self, guild_id: int) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(guild_id)
+        if semaphore is None:
+            semaphore = self._semaphores[guild_id] = asyncio.Semaphore(self._per_guild)
+        return semaphore
+
+    def busy(self, guild_id: int) -> bool:
+        return self._semaphore(guild_id).locked()
+
+    async def run(self, guild_id: int, job, *args, status=None, label: str = "⏳ Экспорт", **kwargs):
+        """
+        Выполнить job(*args, progress=..., **kwargs) в пуле экспорта.
+        status - сообщение для прогресса (ctx.send(...) или followup.send(..., wait=True)).
+        """
+        semaphore = self._semaphore(guild_id)
+        if semaphore.locked():
+            await edit_status(status, "⏳ Экспорт в очереди: на сервере уже выполняется другой экспорт...")
+
+        async with semaphore:
+            progress = ExportProgress(status, label) if status is not None else None
+            if progress:
+                progress.start()
+            try:
+                loop = asyncio.get_running_loop()
+                call = functools.partial(job, *args, progress=progress.report if progress else None, **kwargs)
+                return await loop.run_in_executor(self._executor, call)
+            finally:
+                if progress:
+                    await progress.stop()
+
+    async def to_discord_file(self, fileobj, filename: str, limit: int) -> discord.File:
+        """
+        discord.File в пределах лимита загрузки (guild.filesize_limit).
+        Больше лимита - сжимаем в zip (в пуле экспорта); не помещается и так - ExportTooLarge.
+        """
+        loop = asyncio.get_running_loop()
+        fileobj, filename = await loop.run_in_executor(
+            self._executor, fit_upload_limit, fileobj, filename, limit
+        )
+        return discord.File(fileobj, filename=filename)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def file_size(fileobj) -> int:
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+
+def fit_upload_limit(fileobj, filename: str, limit: int):
+    """Вернуть (файл, имя) - исходный файл или zip архив с ним"""
+    if file_size(fileobj) <= limit:
+        return fileobj, filename
+
+    archive = tempfile.TemporaryFile()
+    fileobj.seek(0)
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        with zf.open(filename, 'w', force_zip64=True) as entry:
+            while True:
+                chunk = fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                entry.write(chunk)
+    fileobj.close()
+
+    size = file_size(archive)
+    if size > limit:
+        archive.close()
+        raise ExportTooLarge(f"{size / 1024 / 1024:.1f} MB > {limit / 1024 / 1024:.0f} MB")
+
+    archive.seek(0)
+    return archive, f"{os.path.splitext(filename)[0]}.zip"
@@ -0,0 +1,402 @@
+import io
+import csv
+import json
+import zlib
+import shutil
+import sqlite3
+import tempfile
+
+# Сколько строк забираем из курсора за раз и сколько байт копим перед отдачей чанка
+FETCH_BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+
+# Как часто (в записях) сообщаем о прогрессе генерации файла
+PROGRESS_EVERY = 1000
+
+# Сортировки строк статистики в SQL: sort_by -> (основная колонка, вторичная)
+# ('name' сортируется после объединения с участниками - см. sort_records)
+STATS_ROW_ORDER = {
+    'voice': ('period_voice_time', 'period_messages'),
+    'messages': ('period_messages', 'period_voice_time'),
+    'total_voice': ('total_voice_time', 'total_messages'),
+    'total_messages': ('total_messages', 'total_voice_time'),
+}
+
+
+# ========================================
+# ИСТОЧНИК ДАННЫХ
+# ========================================
+
+def iter_stats_rows(db_path: str, guild_id: int, days: int = None, since_date: str = None,
+                    sort_by: str = 'voice', order: str = 'desc'):
+    """
+    Статистика всех пользователей одним запросом (period суммы через LEFT JOIN).
+    Строки читаются из курсора пачками - в памяти не держится весь результат.
+    Пока генератор не исчерпан, курсор держит блокировку чтения БД: потребитель,
+    идущий со скоростью сети (HTTP ответ), должен сначала прочитать строки целиком.
+
+    Yields:
+        (user_id, total_messages, total_voice_time, period_messages, period_voice_time)
+    """
+    if days:
+        date_expr = "DATE('now', '-' || ? || ' days')"
+        date_param = days
+    elif since_date:
+        date_expr = "?"
+        date_param = since_date
+    else:
+        date_expr = None
+
+    direction = 'ASC' if order == 'asc' else 'DESC'
+    order_by = ', '.join(f"{column} {direction}" for column in STATS_ROW_ORDER.get(sort_by, STATS_ROW_ORDER['voice']))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+
+        if date_expr:
+            cursor.execute(f'''
+                SELECT t.user_id,
+                       COALESCE(t.total_messages, 0) AS total_messages,
+                       COALESCE(t.total_voice_time, 0) AS total_voice_time,
+                       COALESCE(m.period_messages, 0) AS period_messages,
+                       COALESCE(v.period_voice_time, 0) AS period_voice_time
+                FROM user_stats_total t
+                LEFT JOIN (
+                    SELECT user_id, SUM(message_count) AS period_messages
+                    FROM user_messages_daily
+                    WHERE guild_id = ? AND message_date >= {date_expr}
+                    GROUP BY user_id
+                ) m ON m.user_id = t.user_id
+                LEFT JOIN (
+                    SELECT user_id, SUM(voice_time) AS period_voice_time
+                    FROM user_voice_daily
+                    WHERE guild_id = ? AND voice_date >= {date_expr}
+                    GROUP BY user_id
+                ) v ON v.user_id = t.user_id
+                WHERE t.guild_id = ?
+                ORDER BY {order_by}
+            ''', (guild_id, date_param, guild_id, date_param, guild_id))
+        else:
+            cursor.execute(f'''
+                SELECT user_id,
+                       COALESCE(total_messages, 0) AS total_messages,
+                       COALESCE(total_voice_time, 0) AS total_voice_time,
+                       COALESCE(total_messages, 0) AS period_messages,
+                       COALESCE(total_voice_time, 0) AS period_voice_time
+                FROM user_stats_total
+                WHERE guild_id = ?
+                ORDER BY {order_by}
+            ''', (guild_id,))
+
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def member_snapshot(guild) -> dict:
+    """Снимок участников сервера {user_id: member} (ссылки на объекты из кэша discord.py)"""
+    return {m.id: m for m in guild.members}
+
+
+def iter_export_records(rows, members: dict, allowed_ids: set = None,
+                        members_only: bool = False, include_bots: bool = True):
+    """
+    Объединить строки статистики со снимком участников.
+    allowed_ids - участники, прошедшие фильтр ролей (см. RoleIndex.filter_ids).
+    Ролей покинувших сервер мы не знаем - фильтр к ним не применяется,
+    их отсекает только members_only (при фильтре по include_roles).
+
+    Yields:
+        dict с полями rank, user_id, username, display_name, top_role, roles, role_ids, in_guild,
+        period_messages, total_messages, period_voice_time, total_voice_time
+    """
+    rank = 0
+    for user_id, total_messages, total_voice_time, period_messages, period_voice_time in rows:
+        member = members.get(user_id)
+        if member is not None and allowed_ids is not None and user_id not in allowed_ids:
+            continue
+
+        if member is None:
+            if members_only:
+                continue
+            username = f"Unknown (ID: {user_id})"
+            record = {
+                'user_id': user_id,
+                'username': username,
+                'display_name': username,
+                'top_role': 'Unknown',
+                'roles': 'Unknown',
+                'role_ids': [],
+                'in_guild': False
+            }
+        else:
+            if member.bot and not include_bots:
+                continue
+
+            roles = [r for r in member.roles if r.name != "@everyone"]
+            record = {
+                'user_id': user_id,
+                'username': member.name,
+                'display_name': member.display_name,
+                'top_role': member.top_role.name if member.top_role.name != "@everyone" else "No Role",
+                'roles': ", ".join(r.name for r in roles) or "No Roles",
+                'role_ids': [r.id for r in roles],
+                'in_guild': True
+            }
+
+        rank += 1
+        record['rank'] = rank
+        record['period_messages'] = period_messages
+        record['total_messages'] = total_messages
+        record['period_voice_time'] = period_voice_time
+        record['total_voice_time'] = total_voice_time
+        yield record
+
+
+def sort_records(records, key, reverse: bool = False) -> list:
+    """Отсортировать записи iter_export_records в памяти (например по имени) и перенумеровать rank"""
+    records = sorted(records, key=key, reverse=reverse)
+    for rank, record in enumerate(records, 1):
+        record['rank'] = rank
+    return records
+
+
+# ========================================
+# ФОРМАТЫ
+# ========================================
+
+# Колонки полного экспорта: (заголовок, функция от записи)
+STATS_CSV_COLUMNS = [
+    ('Rank', lambda r: r['rank']),
+    ('Username', lambda r: r['username']),
+    ('Display Name', lambda r: r['display_name']),
+    ('User ID', lambda r: r['user_id']),
+    ('Top Role', lambda r: r['top_role']),
+    ('All Roles', lambda r: r['roles']),
+    ('Messages (Period)', lambda r: r['period_messages']),
+    ('Messages (Total)', lambda r: r['total_messages']),
+    ('Voice Time (Period, hours)', lambda r: round(r['period_voice_time'] / 3600, 2)),
+    ('Voice Time (Total, hours)', lambda r: round(r['total_voice_time'] / 3600, 2)),
+]
+
+NDJSON_FIELDS = [
+    'rank', 'user_id', 'username', 'display_name', 'top_role', 'role_ids',
+    'period_messages', 'total_messages', 'period_voice_time', 'total_voice_time'
+]
+
+
+def stream_csv(records, columns: list = None, preamble: list = None, bom: bool = False):
+    """Генератор CSV чанков (str) примерно по CHUNK_SIZE"""
+    columns = columns or STATS_CSV_COLUMNS
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if bom:
+        buffer.write('\ufeff')
+    for row in preamble or []:
+        writer.writerow(row)
+    writer.writerow([header for header, _ in columns])
+
+    for record in records:
+        writer.writerow([getter(record) for _, getter in columns])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(records, fields: list = None):
+    """Генератор NDJSON чанков (str) - одна JSON запись на строку"""
+    fields = fields or NDJSON_FIELDS
+    parts = []
+    size = 0
+    for record in records:
+        line = json.dumps({f: record.get(f) for f in fields}, ensure_ascii=False) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts)
+
+
+def encode_stream(chunks, compress: bool = False, encoding: str = 'utf-8'):
+    """Кодировать str чанки в bytes, опционально сжимая gzip на лету"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode(encoding)
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip контейнер
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ========================================
+# ФАЙЛЫ ДЛЯ DISCORD
+# ========================================
+
+def write_csv_tempfile(records, columns: list = None, preamble_fn=None, progress=None, total: int = None):
+    """
+    Записать CSV во временный файл на диске (память не растёт с размером сервера).
+    preamble_fn(count) возвращает строки шапки - количество известно только после записи.
+    progress(done, total) вызывается каждые PROGRESS_EVERY записей (см. ExportService).
+
+    Returns:
+        (файл открытый на чтение с начала, количество записей)
+    """
+    count = 0
+
+    def counted(items):
+        nonlocal count
+        for item in items:
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(count, total)
+            yield item
+
+    body = tempfile.TemporaryFile()
+    for chunk in encode_stream(stream_csv(counted(records), columns)):
+        body.write(chunk)
+
+    result = tempfile.TemporaryFile()
+    preamble = preamble_fn(count) if preamble_fn else []
+    if preamble:
+        head = io.StringIO()
+        writer = csv.writer(head)
+        for row in preamble:
+            writer.writerow(row)
+        result.write(('\ufeff' + head.getvalue()).encode('utf-8'))
+    else:
+        result.write('\ufeff'.encode('utf-8'))
+
+    body.seek(0)
+    shutil.copyfileobj(body, result)
+    body.close()
+
+    result.seek(0)
+    return result, count
+
+
+# ========================================
+# XLSX
+# ========================================
+
+def voter_activity(db_path: str, guild_id: int, user_ids: set, days: int) -> dict:
+    """
+    Активность участников за период одним проходом по статистике сервера
+    (вместо отдельных запросов get_user_stats на каждого).
+
+    Returns:
+        {user_id: {'messages': int, 'voice_time': int}} - для всех user_ids
+    """
+    activity = {user_id: {'messages': 0, 'voice_time': 0} for user_id in user_ids}
+    for user_id, _, _, period_messages, period_voice_time in iter_stats_rows(db_path, guild_id, days=days):
+        if user_id in activity:
+            activity[user_id] = {'messages': period_messages or 0, 'voice_time': period_voice_time or 0}
+    return activity
+
+
+def _hyperlink(url: str, text: str) -> str:
+    """Формула HYPERLINK (в write-only режиме openpyxl не нужен объект ячейки с координатами)"""
+    return f'=HYPERLINK("{url}","{text.replace(chr(34), chr(34) * 2)[:200]}")'
+
+
+def write_poll_xlsx_tempfile(header: list, answers: list, voters_by_answer: dict, activity: dict,
+                             progress=None):
+    """
+    Детальный экспорт опроса в XLSX (openpyxl write-only: строки пишутся потоком,
+    без модели всех ячеек в памяти).
+
+    Args:
+        header: [(подпись, значение)] - шапка отчёта
+        answers: [(answer_id, текст варианта)]
+        voters_by_answer: {answer_id: [(user_id, display_name)]} - уже отсортированы
+        activity: {user_id: {'messages', 'voice_time'}} (см. voter_activity)
+
+    Returns:
+        временный файл, открытый на чтение с начала
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Poll Results Detailed")
+
+    # Ширина колонок задаётся до первой строки
+    for i in range(len(answers)):
+        ws.column_dimensions[get_column_letter(2 + i)].width = 35
+
+    bold = Font(bold=True)
+    yellow_fill = PatternFill(start_color='FFD966', end_color='FFD966', fill_type='solid')
+    thin = Side(style='thin')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    link_font = Font(color='0563C1', underline='single')
+    center = Alignment(horizontal='center', vertical='center')
+    middle = Alignment(vertical='center')
+
+    def cell(value, **style):
+        c = WriteOnlyCell(ws, value=value)
+        for name, attr in style.items():
+            setattr(c, name, attr)
+        return c
+
+    # Шапка
+    ws.append([cell('Discord Poll Export (Fetched from Discord)', font=Font(bold=True, size=14))])
+    for label, value in header:
+        ws.append([label, value] if label else [])
+
+    # Статистика по вариантам
+    total_votes = sum(len(v) for v in voters_by_answer.values())
+    ws.append([])
+    ws.append([cell('Option', font=bold), cell('Votes', font=bold), cell('Percentage', font=bold)])
+    for answer_id, text in answers:
+        count = len(voters_by_answer.get(answer_id, []))
+        percentage = (count / total_votes * 100) if total_votes > 0 else 0
+        ws.append([text, count, f"{percentage:.1f}%"])
+    ws.append([])
+
+    # Колонки вариантов: проголосовавшие с активностью
+    ws.append([None] + [
+        cell(text, fill=yellow_fill, font=Font(bold=True, size=11), alignment=center, border=thin_border)
+        for _, text in answers
+    ])
+
+    columns = [voters_by_answer.get(answer_id, []) for answer_id, _ in answers]
+    max_votes = max((len(voters) for voters in columns), default=0)
+    for row_index in range(max_votes):
+        row = [None]
+        for voters in columns:
+            if row_index >= len(voters):
+                row.append(None)
+                continue
+            user_id, display_name = voters[row_index]
+            stats = activity.get(user_id, {'messages': 0, 'voice_time': 0})
+            voice_hours = int(stats['voice_time'] // 3600)
+            voice_minutes = int((stats['voice_time'] % 3600) // 60)
+            text = f"{display_name} | {stats['messages']} msg | {voice_hours}h {voice_minutes}m"
+            row.append(cell(_hyperlink(f"https://discord.com/users/{user_id}", text),
+                            font=link_font, alignment=middle, border=thin_border))
+        ws.append(row)
+        if progress and (row_index + 1) % PROGRESS_EVERY == 0:
+            progress(row_index + 1, max_votes)
+
+    result = tempfile.TemporaryFile()
+    wb.save(result)
+    result.seek(0)
+    return result
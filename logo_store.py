@@ -0,0 +1,221 @@
+import os
+import io
+import re
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from metrics import record_cache
+
+# Папка для готовых аватарок (256x256 PNG), имя файла = sha256 исходника
+AVATAR_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads', 'avatars')
+AVATAR_SIZE = 256
+PROCESS_TIMEOUT = 60  # секунд на обработку одного изображения
+GC_GRACE_SECONDS = 300  # свежие файлы не удаляем (загрузка может быть ещё не записана в БД)
+
+# Имя файла логотипа = sha256 содержимого + расширение
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def normalize_logo(image_data: bytes, max_size: int = AVATAR_SIZE) -> bytes:
+    """
+    Подготовить изображение для аватарки Discord: RGB/RGBA, максимум 256x256, PNG.
+    Выполняется в отдельном процессе (функция должна быть на уровне модуля).
+    """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_data))
+
+    # Конвертируем в RGB если нужно (для RGBA/P режимов сохраняем альфа-канал)
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGBA')
+    else:
+        img = img.convert('RGB')
+
+    # Ресайзим (Discord рекомендует квадратные аватарки)
+    if img.width > max_size or img.height > max_size:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format='PNG', optimize=True)
+    return output_buffer.getvalue()
+
+
+def content_hash(data: bytes) -> str:
+    """sha256 содержимого файла"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_content_addressed(filename: str) -> bool:
+    """Имя файла - хэш содержимого (файл никогда не меняется)"""
+    return bool(HASHED_NAME_RE.match(filename))
+
+
+def save_content_addressed(folder: str, data: bytes, ext: str) -> str:
+    """
+    Сохранить файл под именем sha256(data).ext.
+    Одинаковые файлы хранятся один раз. Возвращает имя файла.
+    """
+    os.makedirs(folder, exist_ok=True)
+    filename = f"{content_hash(data)}.{ext}"
+    path = os.path.join(folder, filename)
+    try:
+        # Файл уже есть - обновляем mtime: сборщик мусора не тронет его
+        # GC_GRACE_SECONDS, пока новая ссылка не записана в БД
+        os.utime(path)
+        return filename
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return filename
+
+
+class FileLRUCache:
+    """
+    Потокобезопасный LRU кэш небольших файлов в памяти.
+    Ограничен суммарным размером в байтах; большие файлы не кэшируются.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_file_size: int = 512 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._items = OrderedDict()  # filename -> (data, etag)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, filename: str):
+        with self._lock:
+            item = self._items.get(filename)
+            if item is not None:
+                self._items.move_to_end(filename)
+            return item
+
+    def put(self, filename: str, data: bytes, etag: str):
+        if len(data) > self.max_file_size:
+            return
+        with self._lock:
+            old = self._items.pop(filename, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._items[filename] = (data, etag)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._items:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def discard(self, filename: str):
+        with self._lock:
+            old = self._items.pop(filename, None)
+            if old is not None:
+                self._size -= len(old[0])
+
+
+class LogoStore:
+    """
+    Кэш нормализованных аватарок.
+
+    Обработка Pillow выполняется в пуле процессов (не блокирует GIL и
+    worker потоки Waitress), результат хранится на диске под ключом
+    sha256 исходного файла - повторное применение того же логотипа
+    не требует никакой обработки.
+    """
+
+    def __init__(self, folder: str = AVATAR_FOLDER, max_workers: int = 2):
+        self.folder = folder
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._url_hashes = {}  # внешний URL -> sha256 исходника
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Ленивое создание пула процессов (spawn - безопасно рядом с потоками и asyncio)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def rendition_path(self, source_hash: str) -> str:
+        return os.path.join(self.folder, f"{source_hash}.png")
+
+    def get_cached(self, source_hash: str) -> bytes | None:
+        """Готовая аватарка по хэшу исходника (или None)"""
+        path = self.rendition_path(source_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_cached_for_url(self, url: str) -> bytes | None:
+        """Готовая аватарка для ранее скачанного внешнего URL"""
+        source_hash = self._url_hashes.get(url)
+        return self.get_cached(source_hash) if source_hash else None
+
+    def process(self, image_data: bytes, source_url: str = None) -> dict:
+        """
+        Получить аватарку для исходного изображения.
+        Если рендишн с таким хэшем уже есть - возвращается без обработки.
+
+        Returns:
+            {'hash', 'data', 'cached', 'processing_ms'}
+        """
+        source_hash = content_hash(image_data)
+        if source_url:
+            self._url_hashes[source_url] = source_hash
+
+        cached = self.get_cached(source_hash)
+        record_cache('avatar_rendition', cached is not None)
+        if cached is not None:
+            return {'hash': source_hash, 'data': cached, 'cached': True, 'processing_ms': 0.0}
+
+        started = time.perf_counter()
+        future = self._get_executor().submit(normalize_logo, image_data)
+        rendition = future.result(timeout=PROCESS_TIMEOUT)
+        processing_ms = (time.perf_counter() - started) * 1000
+
+        # Атомарная запись: сначала во временный файл, затем rename
+        path = self.rendition_path(source_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(rendition)
+        os.replace(tmp_path, path)
+
+        print(f"🖼️ Logo normalized {source_hash[:12]}: {len(image_data)} → {len(rendition)} bytes in {processing_ms:.1f} ms")
+        return {'hash': source_hash, 'data': rendition, 'cached': False, 'processing_ms': round(processing_ms, 1)}
+
+    def collect_garbage(self, referenced_hashes: set) -> int:
+        """Удалить аватарки, исходники которых больше нигде не используются"""
+        keep = set(referenced_hashes) | set(self._url_hashes.values())
+        removed = 0
+        now = time.time()
+        for filename in os.listdir(self.folder):
+            source_hash = filename.split('.', 1)[0]
+            path = os.path.join(self.folder, filename)
+            if filename.endswith('.png') and source_hash not in keep:
+                try:
+                    if now - os.path.getmtime(path) < GC_GRACE_SECONDS:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def shutdown(self):
+        """Остановить пул процессов"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
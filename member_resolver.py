@@ -0,0 +1,179 @@
+import threading
+from bisect import bisect_left, insort
+
+# Сколько совпадений по префиксу просматриваем в каждом индексе (короткий префикс
+# вроде "a" совпадает с тысячами участников - ранжируем только первые)
+PREFIX_SCAN_LIMIT = 50
+DEFAULT_CANDIDATES = 5
+
+
+def parse_member_id(text: str):
+    """ID из упоминания <@123>, <@!123> или просто числа; None если это не ID"""
+    text = text.strip()
+    if text.startswith('<@') and text.endswith('>'):
+        text = text[2:-1].lstrip('!')
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+class GuildNames:
+    """Отсортированные массивы (casefold имя, member_id) одного сервера"""
+
+    __slots__ = ('names', 'display_names', 'keys')
+
+    def __init__(self):
+        self.names = []          # [(name, member_id)] по возрастанию
+        self.display_names = []  # [(display_name, member_id)] по возрастанию
+        self.keys = {}           # member_id -> (name, display_name)
+
+    def add(self, member_id: int, name: str, display_name: str):
+        self.keys[member_id] = (name, display_name)
+        insort(self.names, (name, member_id))
+        insort(self.display_names, (display_name, member_id))
+
+    def remove(self, member_id: int):
+        keys = self.keys.pop(member_id, None)
+        if keys is None:
+            return
+        for array, key in ((self.names, keys[0]), (self.display_names, keys[1])):
+            index = bisect_left(array, (key, member_id))
+            if index < len(array) and array[index] == (key, member_id):
+                del array[index]
+
+
+class MemberResolver:
+    """
+    Поиск участника по вводу пользователя (ID, упоминание, имя) для модальных окон панели.
+
+    Имена и display_name хранятся в отсортированных массивах (casefold), поэтому
+    точное совпадение и поиск по началу имени - бинарный поиск O(log n),
+    а не перебор всех участников сервера. Поддерживается событиями участников (см. Stats cog).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guilds = {}  # guild_id -> GuildNames
+
+    @staticmethod
+    def _keys(member) -> tuple:
+        return member.name.casefold(), member.display_name.casefold()
+
+    # ==================== ПОСТРОЕНИЕ ====================
+
+    def build_guild(self, guild):
+        """Полностью перестроить индекс сервера"""
+        index = GuildNames()
+        for member in guild.members:
+            name, display_name = self._keys(member)
+            index.keys[member.id] = (name, display_name)
+            index.names.append((name, member.id))
+            index.display_names.append((display_name, member.id))
+        index.names.sort()
+        index.display_names.sort()
+
+        with self._lock:
+            self._guilds[guild.id] = index
+
+    def ensure_guild(self, guild):
+        """Построить индекс, если сервер ещё не проиндексирован"""
+        if guild.id not in self._guilds:
+            self.build_guild(guild)
+
+    def remove_guild(self, guild_id: int):
+        with self._lock:
+            self._guilds.pop(guild_id, None)
+
+    # ==================== ОБНОВЛЕНИЯ ====================
+
+    def update_member(self, member):
+        """Добавить участника или обновить его имена (ник, display_name, username)"""
+        keys = self._keys(member)
+        with self._lock:
+            index = self._guilds.get(member.guild.id)
+            if index is None:
+                return  # сервер ещё не проиндексирован - будет построен целиком
+            if index.keys.get(member.id) == keys:
+                return
+            index.remove(member.id)
+            index.add(member.id, *keys)
+
+    def remove_member(self, guild_id: int, member_id: int):
+        """Участник покинул сервер"""
+        with self._lock:
+            index = self._guilds.get(guild_id)
+            if index is not None:
+                index.remove(member_id)
+
+    # ==================== ПОИСК ====================
+
+    @staticmethod
+    def _scan(array: list, query: str, limit: int):
+        """Записи массива, начинающиеся с query: бинарный поиск начала + не больше limit записей"""
+        start = bisect_left(array, (query,))
+        for key, member_id in array[start:start + limit]:
+            if not key.startswith(query):
+                break
+            yield key, member_id
+
+    def candidates(self, guild, query: str, limit: int = DEFAULT_CANDIDATES) -> list:
+        """
+        Участники, чьё имя или display_name начинается с query (без учёта регистра),
+        по убыванию релевантности: точное совпадение имени, точное совпадение
+        display_name, затем самые короткие (наиболее близкие к запросу) имена.
+        """
+        query = query.strip().lstrip('@').casefold()
+        if not query:
+            return []
+        self.ensure_guild(guild)
+
+        ranked = {}  # member_id -> ранг (меньше - лучше)
+        with self._lock:
+            index = self._guilds.get(guild.id)
+            if index is None:
+                return []
+            for field, array in enumerate((index.names, index.display_names)):
+                for key, member_id in self._scan(array, query, PREFIX_SCAN_LIMIT):
+                    rank = (0 if key == query else 1, len(key), field, key)
+                    if member_id not in ranked or rank < ranked[member_id]:
+                        ranked[member_id] = rank
+
+        members = []
+        for member_id in sorted(ranked, key=ranked.get):
+            member = guild.get_member(member_id)
+            if member is not None:
+                members.append(member)
+                if len(members) >= limit:
+                    break
+        return members
+
+    def resolve(self, guild, text: str, limit: int = DEFAULT_CANDIDATES) -> tuple:
+        """
+        Разобрать ввод: ID, упоминание, @username, username или display_name.
+
+        Returns:
+            (user_id, member, candidates):
+            - ID/упоминание: user_id задан всегда, member - если участник на сервере
+            - имя: единственное точное совпадение (или единственный кандидат по префиксу)
+              -> member; иначе user_id = None и candidates - ранжированные варианты
+        """
+        user_id = parse_member_id(text)
+        if user_id is not None:
+            return user_id, guild.get_member(user_id), []
+
+        candidates = self.candidates(guild, text, limit)
+        if not candidates:
+            return None, None, []
+
+        query = text.strip().lstrip('@').casefold()
+        exact = [m for m in candidates if query in self._keys(m)]
+        if candidates[0].name.casefold() == query:
+            member = candidates[0]  # username уникален - однозначно
+        elif len(exact) == 1:
+            member = exact[0]
+        elif len(candidates) == 1:
+            member = candidates[0]
+        else:
+            return None, None, candidates
+        return member.id, member, []
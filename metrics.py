@@ -0,0 +1,289 @@
+import time
+import math
+import threading
+import functools
+
+# Границы бакетов гистограмм (секунды) - как в стандартном Prometheus клиенте
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra: dict = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs += [f'{name}="{_escape(value)}"' for name, value in extra.items()]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}"
+        ]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться"""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class CallbackGauge(_Metric):
+    """
+    Gauge, значение которого вычисляется при каждом scrape.
+    callback возвращает число или {кортеж значений меток: число}.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> list:
+        try:
+            result = self.callback()
+        except Exception:
+            return []
+        if result is None:
+            return []
+        if not isinstance(result, dict):
+            return [f"{self.name} {_format_value(result)}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))} {_format_value(v)}"
+            for key, v in result.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Распределение значений по бакетам (латентность)"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # key -> [counts по бакетам, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер для замера длительности блока"""
+        return _Timer(self, labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(float(bound))})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Набор метрик, отдаваемых на /metrics"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name, documentation, callback, labelnames=()) -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, callback, labelnames))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# ========================================
+# МЕТРИКИ БОТА
+# ========================================
+
+registry = Registry()
+
+API_REQUESTS = registry.counter(
+    'guildbrew_api_requests_total', 'API requests by route, method and status code',
+    ('method', 'route', 'status')
+)
+API_LATENCY = registry.histogram(
+    'guildbrew_api_request_duration_seconds', 'API request latency by route',
+    ('method', 'route')
+)
+GATEWAY_EVENTS = registry.counter(
+    'guildbrew_gateway_events_total', 'Discord gateway events received by type',
+    ('event',)
+)
+DB_QUERY_DURATION = registry.histogram(
+    'guildbrew_db_query_duration_seconds', 'Database method duration',
+    ('method',)
+)
+DB_ERRORS = registry.counter(
+    'guildbrew_db_errors_total', 'Database methods that raised an exception',
+    ('method',)
+)
+CACHE_REQUESTS = registry.counter(
+    'guildbrew_cache_requests_total', 'Cache lookups by cache name and result (hit/miss)',
+    ('cache', 'result')
+)
+DM_NOTIFICATIONS = registry.counter(
+    'guildbrew_dm_notifications_total', 'Direct message notifications by result (sent/retried/forbidden/failed)',
+    ('result',)
+)
+EVENT_LOOP_LAG = registry.histogram(
+    'guildbrew_event_loop_lag_seconds', 'Delay of the asyncio event loop beyond the scheduled wakeup',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+EVENT_LOOP_LAG_LAST = registry.gauge(
+    'guildbrew_event_loop_lag_last_seconds', 'Last measured event loop lag'
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Учесть попадание / промах кэша"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def instrument_database(db):
+    """
+    Обернуть публичные методы экземпляра Database замером времени.
+    Внутренние вызовы (self.method) тоже проходят через обёртку.
+    """
+    for name in dir(type(db)):
+        if name.startswith('_'):
+            continue
+        method = getattr(db, name)
+        if not callable(method):
+            continue
+
+        def wrap(method, name):
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                except Exception:
+                    DB_ERRORS.inc(method=name)
+                    raise
+                finally:
+                    DB_QUERY_DURATION.observe(time.perf_counter() - started, method=name)
+            return timed
+
+        setattr(db, name, wrap(method, name))
+    return db
@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import discord
+from metrics import DM_NOTIFICATIONS
+
+# Одновременно отправляем не больше DM_CONCURRENCY сообщений, каждый обработчик
+# делает паузу DM_INTERVAL секунд между отправками (массовое снятие выговоров
+# не должно упираться в глобальный rate limit Discord)
+DM_CONCURRENCY = 3
+DM_INTERVAL = 1.0
+
+# Повторы при 429 / 5xx: RETRY_BASE * 2^попытка секунд (или retry_after от Discord)
+DM_MAX_RETRIES = 3
+RETRY_BASE = 5.0
+
+
+class Notification:
+    __slots__ = ('user_id', 'embed', 'on_failed', 'count', 'attempts')
+
+    def __init__(self, user_id: int, embed, on_failed=None, count: int = 1):
+        self.user_id = user_id
+        self.embed = embed          # discord.Embed или render(count) -> discord.Embed
+        self.on_failed = on_failed  # async callback() если доставить не удалось
+        self.count = count          # сумма count схлопнутых уведомлений
+        self.attempts = 0
+
+    def render(self) -> discord.Embed:
+        return self.embed(self.count) if callable(self.embed) else self.embed
+
+
+class NotificationQueue:
+    """
+    Фоновая очередь личных сообщений (DM).
+
+    - notify() не ждёт сети: сообщение ставится в очередь и отправляется обработчиками
+    - ограничение параллельности и пауза между отправками
+    - повтор с экспоненциальной задержкой при 429 / ошибках сервера Discord
+    - дедупликация: пока сообщение с тем же (user_id, dedup_key) ждёт отправки,
+      новое заменяет его - пользователь получает только актуальный статус;
+      count схлопнутых сообщений суммируется, и embed-функция render(count)
+      собирает одно сообщение обо всех при отправке
+    """
+
+    def __init__(self, bot, concurrency: int = DM_CONCURRENCY, interval: float = DM_INTERVAL,
+                 max_retries: int = DM_MAX_RETRIES):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue()
+        self._pending = {}  # (user_id, dedup_key) -> Notification
+        self._ids = itertools.count()
+        self._workers = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    # ==================== ОЧЕРЕДЬ ====================
+
+    def notify(self, user_id: int, embed, dedup_key=None, on_failed=None, count: int = 1):
+        """
+        Поставить DM в очередь. dedup_key=None - сообщение не схлопывается с другими.
+        embed - discord.Embed или render(count) -> discord.Embed (вызывается при отправке).
+        """
+        if dedup_key is None:
+            dedup_key = ('once', next(self._ids))
+        key = (user_id, dedup_key)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.embed = embed
+            pending.on_failed = on_failed
+            pending.count += count
+            return
+
+        self._pending[key] = Notification(user_id, embed, on_failed, count)
+        self._queue.put_nowait(key)
+
+    def _retry(self, key, notification: Notification, delay: float):
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Пока отправляли, пришло более новое сообщение - отправится оно, вместе с этим count
+            pending.count += notification.count
+            return
+        self._pending[key] = notification
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, key)
+
+    # ==================== ОБРАБОТЧИКИ ====================
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def _worker(self):
+        await self.bot.wait_until_ready()
+        while True:
+            key = await self._queue.get()
+            notification = self._pending.pop(key, None)
+            if notification is None:
+                continue
+            try:
+                await self._deliver(key, notification)
+            except Exception as e:
+                DM_NOTIFICATIONS.inc(result='failed')
+                print(f"Error sending DM to {notification.user_id}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _deliver(self, key, notification: Notification):
+        try:
+            user = self.bot.get_user(notification.user_id) or await self.bot.fetch_user(notification.user_id)
+            await user.send(embed=notification.render())
+            DM_NOTIFICATIONS.inc(result='sent')
+            return
+        except discord.Forbidden:
+            DM_NOTIFICATIONS.inc(result='forbidden')  # закрытые DM - не повторяем
+        except discord.NotFound:
+            DM_NOTIFICATIONS.inc(result='failed')
+        except discord.HTTPException as e:
+            if (e.status == 429 or e.status >= 500) and notification.attempts < self.max_retries:
+                delay = max(RETRY_BASE * 2 ** notification.attempts, getattr(e, 'retry_after', 0) or 0)
+                notification.attempts += 1
+                DM_NOTIFICATIONS.inc(result='retried')
+                self._retry(key, notification, delay)
+                return
+            DM_NOTIFICATIONS.inc(result='failed')
+            print(f"Error sending DM to {notification.user_id}: {e}")
+
+        if notification.on_failed is not None:
+            try:
+                await notification.on_failed()
+            except Exception as e:
+                print(f"Error in DM failure callback: {e}")
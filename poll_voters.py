@@ -0,0 +1,175 @@
+import asyncio
+import sqlite3
+import discord
+
+# Варианты ответа загружаются параллельно, но не больше POLL_CRAWL_CONCURRENCY
+# одновременно (все запросы voters одного сообщения делят rate limit bucket)
+POLL_CRAWL_CONCURRENCY = 3
+
+# Контрольная точка сохраняется после каждой страницы API (100 голосов)
+CHECKPOINT_EVERY = 100
+
+# Повторы при 429 / 5xx: RETRY_BASE * 2^попытка секунд, продолжение с контрольной точки
+CRAWL_MAX_RETRIES = 3
+RETRY_BASE = 2.0
+
+
+class PollVoterCrawler:
+    """
+    Загрузка проголосовавших в завершённом опросе с контрольными точками.
+
+    Голоса каждого варианта сохраняются в poll_voters постранично вместе с
+    последним загруженным ID (poll_voter_crawl). Повторный экспорт продолжает
+    с места ошибки, а уже загруженные варианты читает из БД без запросов к API -
+    голоса завершённого опроса больше не меняются.
+    """
+
+    def __init__(self, db_path: str, concurrency: int = POLL_CRAWL_CONCURRENCY):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.init_tables()
+
+    def init_tables(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS poll_voter_crawl (
+                message_id INTEGER NOT NULL,
+                answer_id INTEGER NOT NULL,
+                last_voter_id INTEGER,
+                done INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (message_id, answer_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS poll_voters (
+                message_id INTEGER NOT NULL,
+                answer_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                display_name TEXT,
+                PRIMARY KEY (message_id, answer_id, user_id)
+            )
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    # ==================== КОНТРОЛЬНЫЕ ТОЧКИ ====================
+
+    def load_checkpoint(self, message_id: int, answer_id: int) -> tuple:
+        """(last_voter_id, done, [(user_id, display_name)]) - уже загруженное по варианту"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT last_voter_id, done FROM poll_voter_crawl
+            WHERE message_id = ? AND answer_id = ?
+        ''', (message_id, answer_id))
+        row = cursor.fetchone()
+
+        cursor.execute('''
+            SELECT user_id, display_name FROM poll_voters
+            WHERE message_id = ? AND answer_id = ?
+            ORDER BY user_id
+        ''', (message_id, answer_id))
+        voters = cursor.fetchall()
+
+        conn.close()
+        last_voter_id, done = row if row else (None, 0)
+        return last_voter_id, bool(done), voters
+
+    def save_checkpoint(self, message_id: int, answer_id: int, page: list, done: bool = False):
+        """Сохранить страницу голосов и продвинуть контрольную точку - одной транзакцией"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO poll_voters (message_id, answer_id, user_id, display_name)
+            VALUES (?, ?, ?, ?)
+        ''', [(message_id, answer_id, user_id, name) for user_id, name in page])
+
+        cursor.execute('''
+            INSERT INTO poll_voter_crawl (message_id, answer_id, last_voter_id, done)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (message_id, answer_id) DO UPDATE SET
+                last_voter_id = COALESCE(excluded.last_voter_id, last_voter_id),
+                done = excluded.done,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (message_id, answer_id, page[-1][0] if page else None, int(done)))
+
+        conn.commit()
+        conn.close()
+
+    # ==================== ЗАГРУЗКА ====================
+
+    async def crawl(self, message_id: int, poll: discord.Poll, progress=None) -> tuple:
+        """
+        Голоса всех вариантов опроса.
+        progress(done, total) - прогресс по числу загруженных голосов.
+
+        Returns:
+            (voters_by_answer, failed): {answer_id: [(user_id, display_name)]}
+            и список answer_id, которые загрузить не удалось (продолжатся при повторе)
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total = sum(answer.vote_count for answer in poll.answers)
+        loaded = {}  # answer_id -> загружено голосов (для прогресса)
+
+        def report(answer_id: int, count: int):
+            loaded[answer_id] = count
+            if progress:
+                progress(sum(loaded.values()), total)
+
+        async def crawl_answer(answer):
+            async with semaphore:
+                return await self._crawl_answer(message_id, answer, report)
+
+        results = await asyncio.gather(*(crawl_answer(answer) for answer in poll.answers))
+
+        voters_by_answer = {}
+        failed = []
+        for answer, (voters, done) in zip(poll.answers, results):
+            voters_by_answer[answer.id] = voters
+            if not done:
+                failed.append(answer.id)
+        return voters_by_answer, failed
+
+    async def _crawl_answer(self, message_id: int, answer, report) -> tuple:
+        """([(user_id, display_name)], загружено ли полностью)"""
+        last_voter_id, done, voters = self.load_checkpoint(message_id, answer.id)
+        report(answer.id, len(voters))
+        if done:
+            return voters, True
+
+        attempt = 0
+        while True:
+            page = []
+            try:
+                after = discord.Object(id=last_voter_id) if last_voter_id else None
+                async for voter in answer.voters(after=after):
+                    page.append((voter.id, voter.display_name))
+                    if len(page) >= CHECKPOINT_EVERY:
+                        self.save_checkpoint(message_id, answer.id, page)
+                        voters.extend(page)
+                        last_voter_id = page[-1][0]
+                        page = []
+                        report(answer.id, len(voters))
+
+                self.save_checkpoint(message_id, answer.id, page, done=True)
+                voters.extend(page)
+                report(answer.id, len(voters))
+                return voters, True
+
+            except discord.HTTPException as e:
+                # Неполную страницу не сохраняем - повтор продолжит с last_voter_id
+                if (e.status == 429 or e.status >= 500) and attempt < CRAWL_MAX_RETRIES:
+                    await asyncio.sleep(RETRY_BASE * 2 ** attempt)
+                    attempt += 1
+                    continue
+                print(f"Error fetching voters for answer {answer.id}: {e}")
+                return voters, False
+            except Exception as e:
+                print(f"Error fetching voters for answer {answer.id}: {e}")
+                return voters, False
@@ -0,0 +1,357 @@
+import time
+import heapq
+import asyncio
+import discord
+from datetime import datetime
+from exports import write_csv_tempfile
+from export_service import ExportTooLarge, edit_status
+
+# Отчёт по (сервер, период, роль) живёт недолго: повторные клики, пагинация
+# и экспорт используют уже посчитанный результат
+REPORT_TTL = 120
+PAGE_SIZE = 20
+
+# Уровни активности за период
+VERY_ACTIVE_MESSAGES = 100
+VERY_ACTIVE_VOICE = 3600 * 10
+ACTIVE_MESSAGES = 20
+ACTIVE_VOICE = 3600 * 2
+
+
+class ActivityReport:
+    """Неактивные участники и сводка активности за период - считается один раз на ключ кэша"""
+
+    def __init__(self, guild, days: int, role, member_ids: set, stats: list):
+        self.guild_id = guild.id
+        self.days = days
+        self.role_id = role.id if role else None
+        self.role_name = role.name if role else None
+        self.created_at = time.monotonic()
+        self.generated_at = datetime.utcnow()
+
+        # Статистика по роли - только участники с ролью
+        if role:
+            stats = [s for s in stats if s['user_id'] in member_ids]
+
+        self.total_members = len(member_ids)
+        self.total_messages = 0
+        self.total_voice_time = 0
+        self.very_active = 0
+        self.active = 0
+        self.low_active = 0
+        active_ids = set()
+
+        for s in stats:
+            messages, voice = s['period_messages'], s['period_voice_time']
+            self.total_messages += messages
+            self.total_voice_time += voice
+            if messages >= VERY_ACTIVE_MESSAGES or voice >= VERY_ACTIVE_VOICE:
+                self.very_active += 1
+            elif messages >= ACTIVE_MESSAGES or voice >= ACTIVE_VOICE:
+                self.active += 1
+            elif messages > 0 or voice > 0:
+                self.low_active += 1
+            else:
+                continue
+            active_ids.add(s['user_id'])
+
+        self.active_count = len(active_ids)
+        self.top_messages = [
+            (s['user_id'], s['period_messages'])
+            for s in heapq.nlargest(3, stats, key=lambda s: s['period_messages'])
+        ]
+
+        # Неактивные - в стабильном порядке (по имени), чтобы страницы не «прыгали»
+        inactive = [m for m in (guild.get_member(uid) for uid in member_ids - active_ids) if m is not None]
+        inactive.sort(key=lambda m: m.display_name.casefold())
+        self.inactive_ids = [m.id for m in inactive]
+
+    @property
+    def pages(self) -> int:
+        return max((len(self.inactive_ids) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.created_at > REPORT_TTL
+
+
+class ReportCache:
+    """
+    Кэш отчётов активности с коротким TTL.
+    Одновременные запросы одного отчёта ждут один расчёт; запрос статистики
+    к БД выполняется в пуле потоков и не блокирует event loop.
+    """
+
+    def __init__(self, db, role_index):
+        self.db = db
+        self.role_index = role_index
+        self._reports = {}  # (guild_id, days, role_id) -> ActivityReport
+        self._pending = {}  # (guild_id, days, role_id) -> asyncio.Future
+
+    async def get(self, guild, days: int, role=None) -> ActivityReport:
+        key = (guild.id, days, role.id if role else None)
+        report = self._reports.get(key)
+        if report is not None and not report.expired:
+            return report
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._build(guild, days, role))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _build(self, guild, days: int, role) -> ActivityReport:
+        member_ids = self.role_index.filter_ids(guild, include_roles=[role.id] if role else None)
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(None, self.db.get_all_users_stats, guild.id, days)
+
+        report = ActivityReport(guild, days, role, member_ids, stats)
+        self._prune()
+        self._reports[(guild.id, days, report.role_id)] = report
+        return report
+
+    def _prune(self):
+        for key in [k for k, r in self._reports.items() if r.expired]:
+            del self._reports[key]
+
+
+# ========================================
+# EMBEDS
+# ========================================
+
+def summary_embed(report: ActivityReport, guild, footer: str) -> discord.Embed:
+    """Сводка активности сервера"""
+    title_suffix = f" (роль: {report.role_name})" if report.role_name else ""
+    embed = discord.Embed(
+        title=f"📊 Сводка активности сервера{title_suffix}",
+        description=f"Анализ активности за последние **{report.days} дней**",
+        color=0x3498DB,
+        timestamp=report.generated_at
+    )
+
+    voice = report.total_voice_time
+    embed.add_field(
+        name="📈 Общая активность",
+        value=f"**Сообщений:** {report.total_messages:,}\n**Время в войсе:** {int(voice // 3600)}ч {int((voice % 3600) // 60)}м",
+        inline=True
+    )
+    embed.add_field(
+        name="👥 Участники",
+        value=f"**Всего:** {report.total_members}\n**Активных:** {report.active_count}",
+        inline=True
+    )
+    embed.add_field(name="\u200b", value="\u200b", inline=True)
+
+    inactive = len(report.inactive_ids)
+    embed.add_field(
+        name="🎯 Уровни активности",
+        value=f"🔥 **Очень активные:** {report.very_active}\n⚡ **Активные:** {report.active}\n💬 **Низкая активность:** {report.low_active}\n😴 **Неактивные:** {inactive}",
+        inline=False
+    )
+
+    total = report.total_members
+    if total > 0:
+        bar_length = 20
+        lines = []
+        for emoji, count in (("🔥", report.very_active), ("⚡", report.active),
+                             ("💬", report.low_active), ("😴", inactive)):
+            pct = count / total * 100
+            filled = min(int(pct / 100 * bar_length), bar_length)
+            lines.append(f"{emoji} `{'█' * filled}{'░' * (bar_length - filled)}` {pct:.1f}%")
+        embed.add_field(name="📊 Распределение активности", value="\n".join(lines), inline=False)
+
+    top_text = []
+    for i, (user_id, messages) in enumerate(report.top_messages, 1):
+        member = guild.get_member(user_id)
+        if member:
+            emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
+            top_text.append(f"{emoji} {member.mention}: {messages} сообщений")
+    if top_text:
+        embed.add_field(name="🏆 Топ-3 по сообщениям", value="\n".join(top_text), inline=False)
+
+    embed.set_footer(text=footer)
+    return embed
+
+
+def inactive_embed(report: ActivityReport, guild, page: int) -> discord.Embed:
+    """Одна страница списка неактивных"""
+    title_suffix = f" (роль: {report.role_name})" if report.role_name else ""
+    embed = discord.Embed(
+        title=f"😴 Неактивные пользователи{title_suffix}",
+        description=f"Пользователи без активности за последние **{report.days} дней**",
+        color=0xE67E22,
+        timestamp=report.generated_at
+    )
+
+    start = page * PAGE_SIZE
+    lines = []
+    for i, user_id in enumerate(report.inactive_ids[start:start + PAGE_SIZE], start + 1):
+        member = guild.get_member(user_id)
+        if member is None:
+            lines.append(f"{i}. <@{user_id}> • `покинул сервер`")
+            continue
+        top_role = member.top_role.name if member.top_role.name != "@everyone" else "Нет роли"
+        lines.append(f"{i}. {member.mention} • `{top_role}`")
+
+    inactive = len(report.inactive_ids)
+    embed.add_field(
+        name=f"👥 {start + 1}-{start + len(lines)} из {inactive}",
+        value="\n".join(lines),
+        inline=False
+    )
+
+    total = report.total_members
+    inactive_percent = (inactive / total * 100) if total > 0 else 0
+    embed.add_field(
+        name="📊 Статистика",
+        value=f"**Всего участников:** {total}\n**Неактивных:** {inactive} ({inactive_percent:.1f}%)\n**Активных:** {report.active_count} ({100 - inactive_percent:.1f}%)",
+        inline=False
+    )
+
+    embed.set_footer(text=f"Страница {page + 1}/{report.pages} • 📤 Экспорт - полный список в CSV")
+    return embed
+
+
+# Колонки CSV неактивных: (заголовок, функция от записи)
+INACTIVE_CSV_COLUMNS = [
+    ('Rank', lambda r: r['rank']),
+    ('Username', lambda r: r['username']),
+    ('Display Name', lambda r: r['display_name']),
+    ('User ID', lambda r: r['user_id']),
+    ('Top Role', lambda r: r['top_role']),
+    ('All Roles', lambda r: r['roles']),
+    ('Joined Server', lambda r: r['joined']),
+    ('Account Created', lambda r: r['created']),
+]
+
+
+def inactive_preamble(report: ActivityReport, guild_name: str) -> list:
+    rows = [
+        ['Inactive Users Report'],
+        ['Server:', guild_name],
+        ['Period:', f'{report.days} days'],
+    ]
+    if report.role_name:
+        rows.append(['Filtered by role:', report.role_name])
+    rows.append(['Total Members:', report.total_members])
+    rows.append(['Inactive Members:', len(report.inactive_ids)])
+    rows.append(['Report Date:', report.generated_at.strftime('%Y-%m-%d %H:%M:%S UTC')])
+    rows.append([])
+    return rows
+
+
+def inactive_records(report: ActivityReport, guild) -> list:
+    """Снимок неактивных участников для CSV (в event loop; файл пишется в пуле экспорта)"""
+    records = []
+    for user_id in report.inactive_ids:
+        member = guild.get_member(user_id)
+        if member is None:
+            continue
+        records.append({
+            'rank': len(records) + 1,
+            'username': member.name,
+            'display_name': member.display_name,
+            'user_id': member.id,
+            'top_role': member.top_role.name if member.top_role.name != "@everyone" else "No Role",
+            'roles': ", ".join(r.name for r in member.roles if r.name != "@everyone") or "No Roles",
+            'joined': member.joined_at.strftime('%Y-%m-%d') if member.joined_at else "Unknown",
+            'created': member.created_at.strftime('%Y-%m-%d'),
+        })
+    return records
+
+
+# ========================================
+# ПАГИНАЦИЯ
+# ========================================
+
+class InactiveReportView(discord.ui.View):
+    """
+    Листание списка неактивных: рендерится только текущая страница.
+    Кнопки (и экспорт) доступны только тому, кто запросил отчёт - права
+    проверялись у команды, а сообщение может быть видно всему каналу.
+    """
+
+    def __init__(self, report: ActivityReport, guild, export_service, author_id: int):
+        super().__init__(timeout=300)
+        self.report = report
+        self.guild = guild
+        self.export_service = export_service
+        self.author_id = author_id
+        self.page = 0
+        self.update_buttons()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.author_id:
+            return True
+        await interaction.response.send_message(
+            "❌ Этим отчётом может пользоваться только тот, кто его запросил", ephemeral=True
+        )
+        return False
+
+    def embed(self) -> discord.Embed:
+        return inactive_embed(self.report, self.guild, self.page)
+
+    def update_buttons(self):
+        self.prev_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.report.pages - 1
+        self.page_label.label = f"{self.page + 1}/{self.report.pages}"
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = min(max(page, 0), self.report.pages - 1)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="⏮", style=discord.ButtonStyle.gray, row=0)
+    async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, 0)
+
+    @discord.ui.button(label="◀️", style=discord.ButtonStyle.blurple, row=0)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.gray, disabled=True, row=0)
+    async def page_label(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(label="▶️", style=discord.ButtonStyle.blurple, row=0)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+    @discord.ui.button(label="⏭", style=discord.ButtonStyle.gray, row=0)
+    async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.report.pages - 1)
+
+    @discord.ui.button(label="📤 Экспорт в CSV", style=discord.ButtonStyle.green, row=1)
+    async def export(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.defer(ephemeral=True)
+
+        # Экспорт из того же отчёта - без повторного расчёта; файл пишется в пуле экспорта
+        records = inactive_records(self.report, self.guild)
+        preamble = inactive_preamble(self.report, self.guild.name)
+        status_msg = await interaction.followup.send("⏳ Готовлю экспорт...", ephemeral=True, wait=True)
+        csv_file, count = await self.export_service.run(
+            self.guild.id, write_csv_tempfile, records,
+            columns=INACTIVE_CSV_COLUMNS, preamble_fn=lambda _: preamble,
+            status=status_msg, label="⏳ Экспорт неактивных", total=len(records)
+        )
+
+        role_suffix = f"_role_{self.report.role_name}" if self.report.role_name else ""
+        try:
+            file = await self.export_service.to_discord_file(
+                csv_file, f'inactive_users_{self.guild.name}_{self.report.days}days{role_suffix}.csv',
+                self.guild.filesize_limit
+            )
+        except ExportTooLarge as e:
+            await edit_status(status_msg, f"❌ Файл экспорта слишком большой для загрузки в Discord ({e})")
+            return
+
+        role_text = f" с ролью **{self.report.role_name}**" if self.report.role_name else ""
+        try:
+            await interaction.followup.send(
+                f"📊 Экспорт неактивных пользователей{role_text} ({count} пользователей за {self.report.days} дней)",
+                file=file,
+                ephemeral=True
+            )
+            await edit_status(status_msg, "✅ Экспорт готов")
+        finally:
+            file.close()
@@ -0,0 +1,153 @@
+import threading
+
+
+class RoleIndex:
+    """
+    Индекс ролей по серверам: role_id -> {member_id} и member_id -> {role_id}.
+
+    Поддерживается событиями участников и ролей (см. Stats cog), поэтому
+    фильтры include/exclude по ролям - это объединения и разности множеств,
+    без перебора всех участников и их списков ролей.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._role_members = {}  # guild_id -> {role_id: set(member_id)}
+        self._member_roles = {}  # guild_id -> {member_id: frozenset(role_id)}
+        self._humans = {}        # guild_id -> set(member_id) без ботов
+
+    # ==================== ПОСТРОЕНИЕ ====================
+
+    @staticmethod
+    def _role_ids(member) -> frozenset:
+        """Роли участника без @everyone (его id совпадает с id сервера)"""
+        guild_id = member.guild.id
+        return frozenset(r.id for r in member.roles if r.id != guild_id)
+
+    def build_guild(self, guild):
+        """Полностью перестроить индекс сервера"""
+        role_members = {}
+        member_roles = {}
+        humans = set()
+
+        for member in guild.members:
+            role_ids = self._role_ids(member)
+            member_roles[member.id] = role_ids
+            if not member.bot:
+                humans.add(member.id)
+            for role_id in role_ids:
+                role_members.setdefault(role_id, set()).add(member.id)
+
+        with self._lock:
+            self._role_members[guild.id] = role_members
+            self._member_roles[guild.id] = member_roles
+            self._humans[guild.id] = humans
+
+    def ensure_guild(self, guild):
+        """Построить индекс, если сервер ещё не проиндексирован"""
+        if guild.id not in self._member_roles:
+            self.build_guild(guild)
+
+    def remove_guild(self, guild_id: int):
+        with self._lock:
+            self._role_members.pop(guild_id, None)
+            self._member_roles.pop(guild_id, None)
+            self._humans.pop(guild_id, None)
+
+    # ==================== ОБНОВЛЕНИЯ ====================
+
+    def update_member(self, member):
+        """Добавить участника или обновить его роли"""
+        guild_id = member.guild.id
+        new_roles = self._role_ids(member)
+
+        with self._lock:
+            if guild_id not in self._member_roles:
+                return  # сервер ещё не проиндексирован - будет построен целиком
+
+            role_members = self._role_members[guild_id]
+            old_roles = self._member_roles[guild_id].get(member.id, frozenset())
+
+            for role_id in old_roles - new_roles:
+                members = role_members.get(role_id)
+                if members is not None:
+                    members.discard(member.id)
+            for role_id in new_roles - old_roles:
+                role_members.setdefault(role_id, set()).add(member.id)
+
+            self._member_roles[guild_id][member.id] = new_roles
+            if not member.bot:
+                self._humans[guild_id].add(member.id)
+
+    def remove_member(self, guild_id: int, member_id: int):
+        """Участник покинул сервер"""
+        with self._lock:
+            if guild_id not in self._member_roles:
+                return
+
+            old_roles = self._member_roles[guild_id].pop(member_id, frozenset())
+            role_members = self._role_members[guild_id]
+            for role_id in old_roles:
+                members = role_members.get(role_id)
+                if members is not None:
+                    members.discard(member_id)
+            self._humans[guild_id].discard(member_id)
+
+    def remove_role(self, guild_id: int, role_id: int):
+        """Роль удалена с сервера"""
+        with self._lock:
+            if guild_id not in self._role_members:
+                return
+
+            members = self._role_members[guild_id].pop(role_id, set())
+            member_roles = self._member_roles[guild_id]
+            for member_id in members:
+                if member_id in member_roles:
+                    member_roles[member_id] = member_roles[member_id] - {role_id}
+
+    # ==================== ЗАПРОСЫ ====================
+
+    def filter_ids(self, guild, include_roles=None, exclude_roles=None, humans_only: bool = True) -> set:
+        """
+        ID участников, у которых есть хотя бы одна роль из include_roles
+        и нет ни одной из exclude_roles. Без include_roles - все участники.
+        """
+        self.ensure_guild(guild)
+
+        with self._lock:
+            role_members = self._role_members.get(guild.id, {})
+            humans = self._humans.get(guild.id, set())
+
+            if include_roles:
+                result = set()
+                for role_id in include_roles:
+                    result |= role_members.get(role_id, set())
+                if humans_only:
+                    result &= humans
+            elif humans_only:
+                result = set(humans)
+            else:
+                result = set(self._member_roles.get(guild.id, {}))
+
+            for role_id in exclude_roles or []:
+                members = role_members.get(role_id)
+                if not members:
+                    continue
+                # Перебираем меньшее из двух множеств
+                if len(members) < len(result):
+                    result.difference_update(members)
+                else:
+                    result = {uid for uid in result if uid not in members}
+
+        return result
+
+    def members(self, guild, include_roles=None, exclude_roles=None, humans_only: bool = True) -> list:
+        """Объекты участников по фильтру ролей, по имени (порядок множества ID произвольный)"""
+        ids = self.filter_ids(guild, include_roles, exclude_roles, humans_only)
+        members = [m for m in (guild.get_member(uid) for uid in ids) if m is not None]
+        members.sort(key=lambda m: (m.display_name.casefold(), m.id))
+        return members
+
+    def role_ids(self, guild_id: int, member_id: int) -> frozenset:
+        """Роли участника из индекса"""
+        return self._member_roles.get(guild_id, {}).get(member_id, frozenset())
@@ -0,0 +1,165 @@
+"""
+DiscordRESTClient против локального HTTP stub вместо Discord API.
+
+    python -m unittest discover tests
+"""
+import json
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import discord_rest
+from discord_rest import DiscordRESTClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Отвечает по сценарию server.responses[(метод, путь)]: список (статус, заголовки, тело)"""
+
+    def _respond(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        key = (self.command, self.path)
+        with server.lock:
+            server.log.append((self.command, self.path, time.monotonic()))
+            script = server.responses.get(key) or [(200, {}, {})]
+            status, headers, body = script.pop(0) if len(script) > 1 else script[0]
+
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_PATCH = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class DiscordRESTClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/v10"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.responses = {}
+        self.server.log = []
+        self.client = DiscordRESTClient(base_url=self.base_url, timeout=5)
+
+    def tearDown(self):
+        self.client.session.close()
+
+    def script(self, method: str, path: str, *responses):
+        self.server.responses[(method, f"/api/v10{path}")] = list(responses)
+
+    def hits(self, path: str) -> list:
+        return [ts for _, p, ts in self.server.log if p == f"/api/v10{path}"]
+
+    # ==================== БАКЕТЫ ====================
+
+    def test_exhausted_bucket_waits_for_reset(self):
+        self.script('GET', '/users/@me',
+                    (200, {'X-RateLimit-Bucket': 'abc', 'X-RateLimit-Remaining': '0',
+                           'X-RateLimit-Reset-After': '0.3'}, {'id': '1'}),
+                    (200, {'X-RateLimit-Bucket': 'abc', 'X-RateLimit-Remaining': '4',
+                           'X-RateLimit-Reset-After': '1'}, {'id': '1'}))
+
+        self.assertEqual(self.client.get_current_user('token').status_code, 200)
+        route_key = self.client._route_key('GET', '/users/@me', {'Authorization': 'Bearer token'})
+        self.assertEqual(self.client._route_buckets[route_key], 'abc')
+
+        self.assertEqual(self.client.get_current_user('token').status_code, 200)
+        first, second = self.hits('/users/@me')
+        self.assertGreaterEqual(second - first, 0.25)
+
+    def test_buckets_are_separate_per_token(self):
+        self.script('GET', '/users/@me',
+                    (200, {'X-RateLimit-Bucket': 'abc', 'X-RateLimit-Remaining': '0',
+                           'X-RateLimit-Reset-After': '5'}, {'id': '1'}))
+
+        self.client.get_current_user('first')
+        started = time.monotonic()
+        self.assertEqual(self.client.get_current_user('second').status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+
+    # ==================== 429 ====================
+
+    def test_429_waits_retry_after_and_retries(self):
+        self.script('GET', '/users/@me',
+                    (429, {}, {'message': 'You are being rate limited.', 'retry_after': 0.3, 'global': False}),
+                    (200, {}, {'id': '1'}))
+
+        response = self.client.get_current_user('token')
+
+        self.assertEqual(response.status_code, 200)
+        first, second = self.hits('/users/@me')
+        self.assertGreaterEqual(second - first, 0.25)
+
+    def test_global_429_blocks_other_routes(self):
+        self.client.max_retries = 0
+        self.script('GET', '/users/@me',
+                    (429, {'X-RateLimit-Global': 'true'}, {'retry_after': 0.3, 'global': True}))
+
+        self.assertEqual(self.client.get_current_user('token').status_code, 429)
+
+        # Пока не истёк global лимит, ждёт и другой маршрут
+        started = time.monotonic()
+        self.assertEqual(self.client.modify_current_member(1, 'bot', {'nick': 'x'}).status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_429_returned_after_max_retries(self):
+        self.client.max_retries = 1
+        self.script('GET', '/users/@me', (429, {}, {'retry_after': 0.05, 'global': False}))
+
+        response = self.client.get_current_user('token')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.hits('/users/@me')), 2)
+
+    def test_long_retry_after_is_returned_immediately(self):
+        self.script('GET', '/users/@me', (429, {}, {'retry_after': discord_rest.MAX_RETRY_AFTER + 10, 'global': False}))
+
+        started = time.monotonic()
+        response = self.client.get_current_user('token')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.hits('/users/@me')), 1)
+        self.assertLess(time.monotonic() - started, 1)
+
+    # ==================== СИНТЕТИЧЕСКИЙ 429 ====================
+
+    def test_synthetic_429_without_network(self):
+        self.script('GET', '/users/@me',
+                    (200, {'X-RateLimit-Bucket': 'abc', 'X-RateLimit-Remaining': '0',
+                           'X-RateLimit-Reset-After': str(discord_rest.MAX_RETRY_AFTER + 30)}, {'id': '1'}))
+
+        self.client.get_current_user('token')
+        response = self.client.get_current_user('token')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.hits('/users/@me')), 1)  # второй запрос до stub не дошёл
+        self.assertGreater(float(response.headers['Retry-After']), discord_rest.MAX_RETRY_AFTER)
+        data = response.json()
+        self.assertGreater(data['retry_after'], discord_rest.MAX_RETRY_AFTER)
+        self.assertFalse(data['global'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+EventBus: издатель в отдельном потоке, подписчик получает пачки дельт.
+
+    python -m unittest discover tests
+"""
+import json
+import time
+import threading
+import unittest
+
+from events import EventBus, Subscription, format_sse
+
+
+def drain(subscription: Subscription) -> list:
+    events = []
+    while (event := subscription.get(timeout=0.1)) is not None:
+        events.append(event)
+    return events
+
+
+class EventBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus(flush_interval=0.1, max_subscribers=4, max_per_guild=2)
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_publisher_thread_deltas_are_batched(self):
+        subscription = self.bus.subscribe(guild_id=1)
+
+        def publisher():
+            for i in range(20):
+                self.bus.increment_messages(1, 100 + i % 3)
+                self.bus.increment_messages(2, 200)  # другой сервер - подписчик не увидит
+            self.bus.publish('voice_join', 1, user_id=101, channel_id=10)
+            self.bus.publish('warning_issued', 1, user_id=102, warning_id=1, active_count=1)
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        thread.join()
+        time.sleep(0.3)
+
+        received = drain(subscription)
+        messages = [e for e in received if e['type'] == 'messages']
+
+        # 20 инкрементов пришли несколькими событиями 'messages', а не по одному
+        self.assertLess(len(messages), 20)
+        self.assertEqual(sum(e['total'] for e in messages), 20)
+        per_user = {}
+        for event in messages:
+            for user_id, count in event['counts'].items():
+                per_user[user_id] = per_user.get(user_id, 0) + count
+        self.assertEqual(per_user, {'100': 7, '101': 7, '102': 6})
+
+        self.assertTrue(all(e['guild_id'] == 1 for e in received))
+        self.assertEqual({e['type'] for e in received}, {'messages', 'voice_join', 'warning_issued'})
+        ids = [e['id'] for e in received]
+        self.assertEqual(ids, sorted(ids))
+        subscription.close()
+
+    def test_slow_subscriber_gets_resync(self):
+        subscription = Subscription(self.bus, guild_id=1, maxsize=3)
+        for i in range(5):
+            subscription.offer({'id': i, 'type': 'voice_join', 'guild_id': 1, 'ts': float(i)})
+
+        # Четвёртое событие переполнило очередь: она очищена, вместо дельт - resync
+        received = drain(subscription)
+        self.assertEqual([e['type'] for e in received], ['resync', 'voice_join'])
+        self.assertEqual(received[0]['ts'], 3.0)
+        self.assertEqual(subscription.dropped, 1)
+
+    def test_subscriber_limits(self):
+        first = self.bus.subscribe(guild_id=1)
+        second = self.bus.subscribe(guild_id=1)
+        self.assertIsNone(self.bus.subscribe(guild_id=1))  # лимит сервера
+
+        other = self.bus.subscribe(guild_id=2)
+        self.assertIsNotNone(other)
+        self.assertIsNotNone(self.bus.subscribe(guild_id=3))
+        self.assertIsNone(self.bus.subscribe(guild_id=4))  # общий лимит
+
+        first.close()
+        self.assertIsNotNone(self.bus.subscribe(guild_id=1))
+        second.close()
+        other.close()
+
+    def test_format_sse(self):
+        event = {'id': 7, 'type': 'settings_changed', 'guild_id': 1, 'ts': 1.0, 'fields': ['bot_name']}
+        text = format_sse(event)
+        self.assertTrue(text.startswith('id: 7\nevent: settings_changed\ndata: '))
+        self.assertTrue(text.endswith('\n\n'))
+        self.assertEqual(json.loads(text.split('data: ', 1)[1]), event)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+ExpiryScheduler: повтор ключей после ошибки callback.
+
+    python -m unittest discover tests
+"""
+import time
+import asyncio
+import unittest
+
+import expiry_scheduler
+from expiry_scheduler import ExpiryScheduler
+
+
+class ExpirySchedulerRetryTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._retry_base = expiry_scheduler.RETRY_BASE
+        expiry_scheduler.RETRY_BASE = 0.05
+
+    def tearDown(self):
+        expiry_scheduler.RETRY_BASE = self._retry_base
+
+    async def run_scheduler(self, scheduler: ExpiryScheduler, seconds: float):
+        scheduler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            scheduler.stop()
+
+    async def test_failed_keys_are_retried(self):
+        calls = []
+
+        async def callback(keys):
+            calls.append(sorted(keys))
+            if len(calls) < 3:
+                raise RuntimeError("database is locked")
+
+        scheduler = ExpiryScheduler(callback)
+        scheduler.schedule(1, time.time())
+        scheduler.schedule(2, time.time())
+        await self.run_scheduler(scheduler, 0.5)
+
+        self.assertEqual(calls, [[1, 2], [1, 2], [1, 2]])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler._failures, {})
+
+    async def test_key_cancelled_during_callback_is_not_retried(self):
+        calls = []
+        scheduler = None
+
+        async def callback(keys):
+            calls.append(sorted(keys))
+            if len(calls) == 1:
+                scheduler.cancel(1)  # выговор сняли вручную, пока шла пачка
+                raise RuntimeError("database is locked")
+
+        scheduler = ExpiryScheduler(callback)
+        scheduler.schedule(1, time.time())
+        scheduler.schedule(2, time.time())
+        await self.run_scheduler(scheduler, 0.3)
+
+        self.assertEqual(calls, [[1, 2], [2]])
+        self.assertEqual(len(scheduler), 0)
+
+    async def test_key_rescheduled_during_callback_keeps_new_deadline(self):
+        calls = []
+        scheduler = None
+        later = time.time() + 60
+
+        async def callback(keys):
+            calls.append(sorted(keys))
+            scheduler.schedule(1, later)
+            raise RuntimeError("database is locked")
+
+        scheduler = ExpiryScheduler(callback)
+        scheduler.schedule(1, time.time())
+        await self.run_scheduler(scheduler, 0.2)
+
+        self.assertEqual(calls, [[1]])
+        self.assertEqual(scheduler._deadlines, {1: later})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+
+GRANULARITY_DAYS = {'day': 1, 'week': 7}
+DEFAULT_MAX_POINTS = 365
+MAX_ROLES = 10
+
+# Активность пользователя по дням из обеих дневных таблиц
+_ACTIVITY_SQL = '''
+    SELECT message_date AS d, user_id, message_count AS messages, 0 AS voice_time
+    FROM user_messages_daily
+    WHERE guild_id = ? AND message_date >= ? AND message_date <= ? AND message_count > 0
+    UNION ALL
+    SELECT voice_date AS d, user_id, 0 AS messages, voice_time
+    FROM user_voice_daily
+    WHERE guild_id = ? AND voice_date >= ? AND voice_date <= ? AND voice_time > 0
+'''
+
+# Номер бакета: целое число полных ширин бакета от начала периода
+_BUCKET_SQL = "CAST(julianday(a.d) - julianday(?) AS INTEGER) / ?"
+
+
+def align_start(start: date, granularity: str) -> date:
+    """Недельные бакеты начинаются с понедельника"""
+    if granularity == 'week':
+        return start - timedelta(days=start.weekday())
+    return start
+
+
+def bucket_width(start: date, end: date, granularity: str, max_points: int) -> int:
+    """
+    Ширина бакета в днях: базовая (день/неделя), увеличенная кратно так,
+    чтобы точек было не больше max_points.
+    """
+    base = GRANULARITY_DAYS[granularity]
+    base_buckets = (end - start).days // base + 1
+    factor = -(-base_buckets // max_points)  # ceil
+    return base * max(factor, 1)
+
+
+def build_timeseries(cursor, guild_id: int, start: date, end: date, granularity: str = 'day',
+                     max_points: int = DEFAULT_MAX_POINTS, role_members: dict = None) -> dict:
+    """
+    Сообщения, время в войсе и активные пользователи по бакетам.
+    Агрегация и прореживание выполняются в SQLite: активные пользователи считаются
+    как COUNT(DISTINCT) внутри бакета, а не суммой дневных значений.
+
+    Args:
+        role_members: {role_id: set(user_id)} - разбивка по ролям (роли могут пересекаться)
+
+    Returns:
+        {'granularity', 'bucket_days', 'start', 'end', 'series': {...}, 'roles': [...]}
+        Ряды - колонки одинаковой длины (по одной точке на бакет, пропуски = 0).
+    """
+    start = align_start(start, granularity)
+    width = bucket_width(start, end, granularity, max_points)
+    bucket_count = (end - start).days // width + 1
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    params = (guild_id, start_iso, end_iso, guild_id, start_iso, end_iso)
+
+    def empty_series():
+        return {
+            'messages': [0] * bucket_count,
+            'voice_time': [0] * bucket_count,
+            'active_users': [0] * bucket_count
+        }
+
+    series = empty_series()
+    cursor.execute(f'''
+        SELECT {_BUCKET_SQL} AS bucket, SUM(a.messages), SUM(a.voice_time), COUNT(DISTINCT a.user_id)
+        FROM ({_ACTIVITY_SQL}) a
+        GROUP BY bucket
+    ''', (start_iso, width) + params)
+    for bucket, messages, voice_time, active_users in cursor.fetchall():
+        if 0 <= bucket < bucket_count:
+            series['messages'][bucket] = messages or 0
+            series['voice_time'][bucket] = voice_time or 0
+            series['active_users'][bucket] = active_users
+
+    roles = []
+    if role_members:
+        # Членство ролей во временной таблице - разбивка одним GROUP BY в SQLite
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS ts_role_members (role_id INTEGER, user_id INTEGER)')
+        cursor.execute('DELETE FROM ts_role_members')
+        cursor.executemany(
+            'INSERT INTO ts_role_members (role_id, user_id) VALUES (?, ?)',
+            ((role_id, user_id) for role_id, user_ids in role_members.items() for user_id in user_ids)
+        )
+
+        by_role = {role_id: empty_series() for role_id in role_members}
+        cursor.execute(f'''
+            SELECT r.role_id, {_BUCKET_SQL} AS bucket,
+                   SUM(a.messages), SUM(a.voice_time), COUNT(DISTINCT a.user_id)
+            FROM ({_ACTIVITY_SQL}) a
+            JOIN ts_role_members r ON r.user_id = a.user_id
+            GROUP BY r.role_id, bucket
+        ''', (start_iso, width) + params)
+        for role_id, bucket, messages, voice_time, active_users in cursor.fetchall():
+            if 0 <= bucket < bucket_count:
+                role_series = by_role[role_id]
+                role_series['messages'][bucket] = messages or 0
+                role_series['voice_time'][bucket] = voice_time or 0
+                role_series['active_users'][bucket] = active_users
+
+        cursor.execute('DELETE FROM ts_role_members')
+        roles = [
+            {'role_id': role_id, 'members': len(role_members[role_id]), **role_series}
+            for role_id, role_series in by_role.items()
+        ]
+
+    return {
+        'granularity': granularity,
+        'bucket_days': width,
+        'start': start_iso,
+        'end': end_iso,
+        'series': {
+            'date': [(start + timedelta(days=i * width)).isoformat() for i in range(bucket_count)],
+            **series
+        },
+        'roles': roles
+    }
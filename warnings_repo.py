@@ -0,0 +1,156 @@
+import time
+import sqlite3
+import threading
+from metrics import record_cache
+
+# Сводка живёт до первой записи в warnings (invalidate) или WARNINGS_CACHE_TTL секунд
+WARNINGS_CACHE_TTL = 300
+TOP_LIMIT = 5
+
+# Все метрики сводки одним запросом по warning_counters / warning_moderators:
+# строка 'totals' + строки топов (kind, id, count)
+SUMMARY_QUERY = '''
+    SELECT 'totals', COALESCE(SUM(total_count), 0), COALESCE(SUM(active_count), 0),
+           COUNT(*), COALESCE(SUM(active_count > 0), 0)
+    FROM warning_counters
+    WHERE guild_id = :guild_id AND total_count > 0
+    UNION ALL
+    SELECT 'active', user_id, active_count, total_count, NULL
+    FROM warning_counters
+    WHERE guild_id = :guild_id AND active_count > 0
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'total', user_id, total_count, active_count, NULL
+        FROM warning_counters
+        WHERE guild_id = :guild_id AND total_count > 0
+        ORDER BY total_count DESC
+        LIMIT :top
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'moderator', moderator_id, warnings_given, NULL, NULL
+        FROM warning_moderators
+        WHERE guild_id = :guild_id AND warnings_given > 0
+        ORDER BY warnings_given DESC
+        LIMIT :top
+    )
+'''
+
+
+class WarningsRepository:
+    """
+    Чтение сводок по выговорам для команд, панели и API.
+
+    Сводка сервера считается одним запросом и кэшируется; любая запись
+    в warnings (выдача, снятие, истечение) вызывает invalidate(guild_id).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._cache = {}        # guild_id -> (время, сводка)
+        self._generations = {}  # guild_id -> номер версии (растёт при invalidate)
+        self._epoch = 0         # растёт при сбросе всех серверов
+
+    def invalidate(self, guild_id: int = None):
+        """Сбросить сводку сервера (None - всех серверов)"""
+        with self._lock:
+            if guild_id is None:
+                self._cache.clear()
+                self._epoch += 1
+            else:
+                self._cache.pop(guild_id, None)
+                self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+    def _generation(self, guild_id: int) -> tuple:
+        return self._epoch, self._generations.get(guild_id, 0)
+
+    # ==================== СВОДКА ====================
+
+    def summary(self, guild_id: int) -> dict:
+        """
+        Сводка выговоров сервера:
+        total_warnings, active_warnings, unique_users, active_users,
+        active - [(user_id, активных, всего)] все пользователи с активными выговорами,
+        top_total - топ-5 [(user_id, всего)], top_moderators - топ-5 [(moderator_id, выдано)]
+        """
+        with self._lock:
+            cached = self._cache.get(guild_id)
+            generation = self._generation(guild_id)
+        if cached and time.monotonic() - cached[0] < WARNINGS_CACHE_TTL:
+            record_cache('warnings_summary', True)
+            return cached[1]
+        record_cache('warnings_summary', False)
+
+        summary = self._load_summary(guild_id)
+
+        with self._lock:
+            # Пока считали, могла пройти запись - такой результат не кэшируем
+            if self._generation(guild_id) == generation:
+                self._cache[guild_id] = (time.monotonic(), summary)
+        return summary
+
+    def _load_summary(self, guild_id: int) -> dict:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(SUMMARY_QUERY, {'guild_id': guild_id, 'top': TOP_LIMIT}).fetchall()
+        finally:
+            conn.close()
+
+        summary = {
+            'total_warnings': 0,
+            'active_warnings': 0,
+            'unique_users': 0,
+            'active_users': 0,
+            'active': [],
+            'top_total': [],
+            'top_moderators': []
+        }
+        for kind, key, count, extra, users_active in rows:
+            if kind == 'totals':
+                summary['total_warnings'] = key
+                summary['active_warnings'] = count
+                summary['unique_users'] = extra
+                summary['active_users'] = users_active
+            elif kind == 'active':
+                summary['active'].append((key, count, extra))
+            elif kind == 'total':
+                summary['top_total'].append((key, count))
+            else:
+                summary['top_moderators'].append((key, count))
+
+        # Порядок строк внутри UNION ALL не гарантирован - сортируем здесь
+        summary['active'].sort(key=lambda row: (-row[1], -row[2], row[0]))
+        summary['top_total'].sort(key=lambda row: -row[1])
+        summary['top_moderators'].sort(key=lambda row: -row[1])
+        return summary
+
+    def active_users(self, guild_id: int) -> list:
+        """[(user_id, активных)] по убыванию - пользователи с активными выговорами"""
+        return [(user_id, active) for user_id, active, _ in self.summary(guild_id)['active']]
+
+    # ==================== ТОЧЕЧНЫЕ ЧТЕНИЯ ====================
+
+    def user_counts(self, guild_id: int, user_id: int) -> tuple:
+        """(активных, всего) выговоров пользователя - одна строка warning_counters"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute('''
+                SELECT active_count, total_count FROM warning_counters
+                WHERE guild_id = ? AND user_id = ?
+            ''', (guild_id, user_id)).fetchone()
+        finally:
+            conn.close()
+        return row if row else (0, 0)
+
+    def get_warning(self, guild_id: int, warning_id: int):
+        """(user_id, warned_by, reason, is_active) выговора этого сервера или None"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute('''
+                SELECT user_id, warned_by, reason, is_active
+                FROM warnings
+                WHERE id = ? AND guild_id = ?
+            ''', (warning_id, guild_id)).fetchone()
+        finally:
+            conn.close()